@@ -1,3 +1,6 @@
+import re
+import time
+
 from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from collections import OrderedDict
@@ -33,6 +36,109 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
         cursor.close()
 
 
+#: the PRAGMAs of each Cosmos(sqlite_profile=...)
+SQLITE_PROFILES = {
+    # SQLite's own defaults: a rollback journal, and a full fsync at every commit
+    "default": OrderedDict(),
+    # a write-ahead log lets readers, like the web dashboard, read while Cosmos writes, and with
+    # synchronous=NORMAL a commit no longer waits on an fsync.  WAL does not work on network filesystems
+    "wal": OrderedDict(
+        [
+            ("journal_mode", "WAL"),
+            ("synchronous", "NORMAL"),
+            ("mmap_size", 256 * 2 ** 20),
+            ("cache_size", -64 * 2 ** 10),
+            ("busy_timeout", 30000),
+        ]
+    ),
+}
+
+#: the connections kept open, and the extra ones opened when they are all in use, by a SQLite engine with a
+#: sqlite_profile other than "default".  Enough for the runner plus the threads of `cosmos runweb`
+SQLITE_POOL_SIZE = 5
+SQLITE_POOL_MAX_OVERFLOW = 10
+
+
+def set_sqlite_profile(engine, profile):
+    """
+    Run the PRAGMAs of `profile` on every new connection of `engine`.  Does nothing if it isn't SQLite.
+
+    :param engine: a sqlalchemy engine
+    :param str|dict profile: a key of SQLITE_PROFILES, or a dict of PRAGMA names to values,
+      ex: {"journal_mode": "WAL", "busy_timeout": 10000}
+    """
+    if isinstance(profile, str):
+        if profile not in SQLITE_PROFILES:
+            raise ValueError(
+                "unknown sqlite_profile %s, must be one of %s" % (profile, sorted(SQLITE_PROFILES))
+            )
+        profile = SQLITE_PROFILES[profile]
+    for name, value in profile.items():
+        if not re.match(r"^\w+$", name) or not re.match(r"^-?\w+$", str(value)):
+            raise ValueError("invalid PRAGMA %s=%s" % (name, value))
+    if engine.dialect.name != "sqlite" or not profile:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in profile.items():
+            cursor.execute("PRAGMA %s=%s" % (name, value))
+        cursor.close()
+
+
+class GroupCommit(object):
+    """
+    Commits a session at most once every `max_lag` seconds, so that a burst of state changes costs one commit
+    (and one fsync or round trip to the database) rather than one each.  Nothing is lost by deferring: the
+    session holds the changes, and every commit writes all of them, so the database always has a consistent,
+    if slightly old, copy of the Workflow.
+
+    >>> class Session(object):
+    ...     commits = 0
+    ...     def commit(self):
+    ...         self.commits += 1
+    >>> group_commit = GroupCommit(Session(), max_lag=60)
+    >>> group_commit.commit(), group_commit.commit(), group_commit.session.commits
+    (False, False, 0)
+    >>> 0 < group_commit.seconds_until_due() <= 60
+    True
+    >>> group_commit.commit(force=True), group_commit.session.commits, group_commit.seconds_until_due()
+    (True, 1, None)
+
+    :param session: the session to commit
+    :param float max_lag: the most seconds a change may wait to be committed.  If None, commit every time.
+    """
+
+    def __init__(self, session, max_lag=None):
+        self.session = session
+        self.max_lag = max_lag
+        #: when the oldest change that hasn't been committed was made, or None if there are none
+        self.pending_since = None
+
+    def commit(self, force=False):
+        """
+        Commit now if `force`, or if the oldest uncommitted change is at least max_lag seconds old, otherwise
+        leave it for a later call.
+
+        :returns: (bool) True if the session was committed
+        """
+        now = time.time()
+        if self.pending_since is None:
+            self.pending_since = now
+        if force or self.max_lag is None or now - self.pending_since >= self.max_lag:
+            self.session.commit()
+            self.pending_since = None
+            return True
+        return False
+
+    def seconds_until_due(self):
+        """:returns: (float) how long the uncommitted changes can still wait, or None if there are none"""
+        if self.pending_since is None:
+            return None
+        return max(0, self.pending_since + self.max_lag - time.time())
+
+
 class Base(declarative_base()):
     __abstract__ = True
     exclude_from_dict = []
@@ -54,6 +160,27 @@ class Base(declarative_base()):
         return self.session.query(self.__class__)
 
 
+def create_missing_indexes(engine):
+    """
+    Create the indexes of existing tables that were added to the models after the tables were created, which
+    metadata.create_all() skips.  Running it again does nothing.
+
+    :returns: (list) the names of the indexes that were created
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing_indexes:
+                index.create(bind=engine)
+                created.append(index.name)
+    return created
+
+
 class MetaData(Base):
     __tablename__ = "metadata"
     id = Column(Integer, primary_key=True)
@@ -0,0 +1,176 @@
+"""
+A compact DAG for the scheduler, which can hold millions of Tasks without the per-node and per-edge dicts of a
+networkx.DiGraph.
+"""
+from array import array
+from collections import deque
+
+
+class CompactDAG(object):
+    """
+    A DAG of hashable nodes stored as integer ids, with the parents and children of every node in CSR form:
+    the children of node i are ``child_ids[child_offsets[i]:child_offsets[i + 1]]``.  Edges can't be added
+    after construction, but nodes can be removed, which is all the run loop needs.  Removed nodes are
+    forgotten, and can't be looked up anymore.
+
+    Implements the parts of the networkx.DiGraph API used by the scheduler.
+
+    >>> g = CompactDAG('abcdef', [('a', 'b'), ('b', 'c'), ('a', 'd'), ('d', 'c'), ('e', 'f')])
+    >>> len(g), sorted(g.successors('a')), dict(g.in_degree())['c']
+    (6, ['b', 'd'], 2)
+    >>> sorted(g.descendants('a'))
+    ['b', 'c', 'd']
+    >>> g.remove_node('b')
+    >>> list(g.topological_sort())
+    ['a', 'e', 'd', 'f', 'c']
+    >>> g.in_degree('c'), 'b' in g, len(g)
+    (1, False, 5)
+    >>> sorted(g.to_networkx().edges())
+    [('a', 'd'), ('d', 'c'), ('e', 'f')]
+    """
+
+    def __init__(self, nodes, edges):
+        """
+        :param iterable nodes: the nodes of the graph
+        :param iterable edges: (parent, child) pairs.  Both must be in nodes
+        """
+        self.nodes = list(nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+
+        parent_ids, child_ids = array("l"), array("l")
+        for parent, child in edges:
+            parent_ids.append(self.index[parent])
+            child_ids.append(self.index[child])
+        self.child_offsets, self.child_ids = _to_csr(n, parent_ids, child_ids)
+        self.parent_offsets, self.parent_ids = _to_csr(n, child_ids, parent_ids)
+
+        self.alive = bytearray(b"\x01") * n
+        self.num_alive = n
+
+    def __len__(self):
+        return self.num_alive
+
+    def __iter__(self):
+        return (node for i, node in enumerate(self.nodes) if self.alive[i])
+
+    def __contains__(self, node):
+        i = self.index.get(node)
+        return i is not None and self.alive[i] == 1
+
+    def _children(self, i):
+        return self.child_ids[self.child_offsets[i] : self.child_offsets[i + 1]]
+
+    def _parents(self, i):
+        return self.parent_ids[self.parent_offsets[i] : self.parent_offsets[i + 1]]
+
+    def successors(self, node):
+        alive = self.alive
+        return [self.nodes[c] for c in self._children(self.index[node]) if alive[c]]
+
+    def predecessors(self, node):
+        alive = self.alive
+        return [self.nodes[p] for p in self._parents(self.index[node]) if alive[p]]
+
+    def out_degree(self, node):
+        return sum(self.alive[c] for c in self._children(self.index[node]))
+
+    def in_degree(self, node=None):
+        """
+        :returns: the number of parents of `node`, or if node is None, (node, in_degree) for every node, like
+          networkx
+        """
+        if node is not None:
+            return sum(self.alive[p] for p in self._parents(self.index[node]))
+        return ((node, self.in_degree(node)) for node in self)
+
+    def remove_node(self, node):
+        # forget the node, so that it can be garbage collected during a long run
+        i = self.index.pop(node, None)
+        if i is not None:
+            self.nodes[i] = None
+            self.alive[i] = 0
+            self.num_alive -= 1
+
+    def remove_nodes_from(self, nodes):
+        for node in nodes:
+            self.remove_node(node)
+
+    def descendants(self, node):
+        """:returns: (set) the nodes reachable from `node`"""
+        alive = self.alive
+        seen = bytearray(len(self.nodes))
+        stack = [self.index[node]]
+        found = []
+        while stack:
+            for c in self._children(stack.pop()):
+                if alive[c] and not seen[c]:
+                    seen[c] = 1
+                    found.append(c)
+                    stack.append(c)
+        return {self.nodes[i] for i in found}
+
+    def topological_sort(self):
+        """:returns: (generator) the nodes, each after all of its parents"""
+        alive = self.alive
+        num_parents = array("l", (0 for _ in self.nodes))
+        for i in range(len(self.nodes)):
+            if alive[i]:
+                num_parents[i] = sum(alive[p] for p in self._parents(i))
+        ready = deque(i for i in range(len(self.nodes)) if alive[i] and num_parents[i] == 0)
+        while ready:
+            i = ready.popleft()
+            yield self.nodes[i]
+            for c in self._children(i):
+                if alive[c]:
+                    num_parents[c] -= 1
+                    if num_parents[c] == 0:
+                        ready.append(c)
+
+    def to_networkx(self):
+        """:returns: (networkx.DiGraph) a copy of the graph, ex: for drawing it"""
+        import networkx as nx
+
+        g = nx.DiGraph()
+        g.add_nodes_from(self)
+        g.add_edges_from((node, child) for node in self for child in self.successors(node))
+        return g
+
+
+def _to_csr(n, from_ids, to_ids):
+    """
+    :returns: (offsets, ids) where the ids that `from_ids[i]` points to are ids[offsets[i]:offsets[i + 1]]
+    """
+    offsets = array("l", bytes(array("l").itemsize * (n + 1)))
+    for i in from_ids:
+        offsets[i + 1] += 1
+    for i in range(n):
+        offsets[i + 1] += offsets[i]
+    ids = array("l", bytes(array("l").itemsize * len(to_ids)))
+    position = array("l", offsets[:n])
+    for i, j in zip(from_ids, to_ids):
+        ids[position[i]] = j
+        position[i] += 1
+    return offsets, ids
+
+
+def topological_sort_cycles(g, key=None):
+    """
+    Like networkx.topological_sort, but for a graph that may have cycles: its strongly connected components
+    are sorted topologically, and the nodes of each component by `key`.  Linear in the size of the graph,
+    unlike breaking every cycle first, since the number of cycles can grow exponentially.
+
+    >>> import networkx as nx
+    >>> g = nx.DiGraph([('a', 'b'), ('b', 'c'), ('c', 'b'), ('c', 'd'), ('e', 'a')])
+    >>> list(topological_sort_cycles(g))
+    ['e', 'a', 'b', 'c', 'd']
+
+    :param networkx.DiGraph g: the graph
+    :param callable key: orders the nodes within a cycle
+    :returns: (generator) the nodes, each after all of its parents that are not in a cycle with it
+    """
+    import networkx as nx
+
+    condensed = nx.condensation(g)
+    for component in nx.topological_sort(condensed):
+        yield from sorted(condensed.nodes[component]["members"], key=key)
@@ -1,14 +1,26 @@
 import itertools as it
 import os
-import stat
+from array import array
+import queue
 import signal
-from operator import attrgetter
+import time
+from concurrent import futures
+from functools import wraps
 
 from cosmos import TaskStatus, StageStatus, NOOP
 from cosmos.api import py_call
+from cosmos.db import GroupCommit
 from cosmos.job.drm.DRM_Base import DRM
+from cosmos.job.fusion import read_exit_status, write_fused_script
+from cosmos.models.Task import Task
 from cosmos.models.Workflow import default_task_log_output_dir
-from cosmos.util.helpers import mkdir, groupby2
+from cosmos.util.helpers import mkdir, groupby2, write_script
+
+#: the most threads that prepare the files of a batch of Tasks
+PREPARE_WORKERS = 8
+
+#: the executors that Workflow.run(render_executor=...) can create by name, to call cmd_fxns in
+RENDER_EXECUTORS = {"thread": futures.ThreadPoolExecutor, "process": futures.ProcessPoolExecutor}
 
 
 class JobManager(object):
@@ -21,148 +33,468 @@ class JobManager(object):
         session=None,
         workflow=None,
     ):
-        self.drms = {
-            DRM_sub_cls.name: DRM_sub_cls(logger, workflow=workflow) for DRM_sub_cls in DRM.__subclasses__()
-        }
+        # drm name -> DRM, created by get_drm() the first time a DRM is used
+        self.drms = dict()
+        # DRMs put their name here when they notice a finished job, see wait_for_finished_tasks()
+        self.job_finished_queue = queue.SimpleQueue()
 
         # self.local_drm = DRM_Local(self)
         self.tasks = []
-        self.running_tasks = []
+        self.running_tasks = RunningTasks()
         self.dead_tasks = []
+        # Workflow.run() sets it.  If True, finished Tasks are released by release_tasks() rather than kept in
+        # self.tasks and self.dead_tasks, and only their finished_tasks record is kept
+        self.release_finished_tasks = False
+        self.finished_tasks = FinishedTasks()
+        # the first Task of each linear chain -> the Tasks to fuse into its job.  See cosmos.job.fusion
+        self.fused_chains = dict()
         self.get_submit_args = get_submit_args
         self.cmd_wrapper = cmd_wrapper
         self.log_out_dir_func = log_out_dir_func
         self.log = logger
         self.session = session
-        # self.workflow = workflow
+        # Workflow.run() sets its max_lag.  Commits every time by default
+        self.group_commit = GroupCommit(session)
+        # Workflow.run() sets a BulkUpdater, so that the job info of finished Tasks is written in bulk when
+        # the session commits, and closes it when the run ends.  Otherwise it is set on the Tasks
+        self.job_info_updater = None
+        # Workflow.run() sets it.  cmd_fxns are called in this thread by default
+        self.render_executor = None
+        self._owns_render_executor = False
+        self.workflow = workflow
 
     def get_drm(self, drm_name):
         """This allows support for drmaa:ge type syntax"""
-        return self.drms[drm_name.split(":")[0]]
+        drm_name = drm_name.split(":")[0]
+        drm = self.drms.get(drm_name)
+        if drm is None:
+            drm = self.drms[drm_name] = DRM.get_drm(drm_name)(self.log, workflow=self.workflow)
+            drm.job_finished_queue = self.job_finished_queue
+        return drm
+
+    def set_render_executor(self, render_executor):
+        """
+        :param render_executor: None to call cmd_fxns in this thread, a key of RENDER_EXECUTORS for a pool of
+          the default size, or a concurrent.futures.Executor
+        """
+        self.shutdown_render_executor()
+        if isinstance(render_executor, str):
+            if render_executor not in RENDER_EXECUTORS:
+                raise ValueError(
+                    "render_executor must be one of %s, not %r" % (sorted(RENDER_EXECUTORS), render_executor)
+                )
+            self.render_executor = RENDER_EXECUTORS[render_executor]()
+            self._owns_render_executor = True
+        else:
+            self.render_executor = render_executor
+
+    def shutdown_render_executor(self):
+        """Shut down the render executor, if it was created by set_render_executor()"""
+        if self._owns_render_executor:
+            self.render_executor.shutdown()
+        self.render_executor = None
+        self._owns_render_executor = False
 
-    def call_cmd_fxn(self, task):
+    def call_cmd_fxn(self, task, cmd_fxn=None):
         """
-        NOTE THIS METHOD MUST BE THREAD SAFE
-        :param task:
-        :return:
+        :param callable cmd_fxn: called instead of task.cmd_fxn, ex: to return an already rendered command
+        :returns: (str) the command of `task`
         """
         # session = self.cosmos_app.session  # we expect this to be its own thread
         # thread_local_task = session.merge(task)
         thread_local_task = task
+        cmd_fxn = cmd_fxn or task.cmd_fxn
 
         if self.cmd_wrapper:
             if self.cmd_wrapper == py_call:
                 # this is for backwards compatibility, the user should have specified
                 # py_call_cmd_wrapper
-                fxn = py_call(task.cmd_fxn)
+                fxn = py_call(cmd_fxn)
             else:
-                fxn = self.cmd_wrapper(thread_local_task)(task.cmd_fxn)
+                fxn = self.cmd_wrapper(thread_local_task)(cmd_fxn)
         else:
-            fxn = task.cmd_fxn
+            fxn = cmd_fxn
 
         command = fxn(**task.params)
 
         return command
 
+    def render_commands(self, tasks):
+        """
+        Call the cmd_fxns of `tasks`, in the render executor if there is one.  Only the cmd_fxns run there,
+        with copies of their params, so that the ORM is only used from this thread: the cmd_wrapper, which
+        may read the Task, is applied here to the rendered command.  A cmd_wrapper must therefore call the
+        cmd_fxn it wraps, as the default one does, and cmd_fxns and their params must be picklable to use a
+        process pool.
+
+        :returns: (list) the command of each Task
+        """
+        start = time.time()
+        if self.render_executor is None or self.cmd_wrapper == py_call:
+            # py_call writes a script that calls the cmd_fxn when the job runs, rendering is just formatting
+            commands = list(map(self.call_cmd_fxn, tasks))
+        else:
+            rendered = [self.render_executor.submit(_call, task.cmd_fxn, dict(task.params)) for task in tasks]
+            commands = [
+                self.call_cmd_fxn(task, _returns(task.cmd_fxn, future.result()))
+                for task, future in zip(tasks, rendered)
+            ]
+        if tasks:
+            self.log.info("Rendered %d commands in %.3fs", len(tasks), time.time() - start)
+        return commands
+
     def prepare_task_for_submission(self, task, command):
-        task.log_dir = self.log_out_dir_func(task)
-        for p in [
-            task.output_stdout_path,
-            task.output_stderr_path,
-            task.output_command_script_path,
-        ]:
-            if os.path.exists(p):
-                os.unlink(p)
-
-        if command is NOOP:
-            task.NOOP = True
+        self.prepare_tasks_for_submission([task], [command])
+
+    def prepare_tasks_for_submission(self, tasks, commands):
+        """
+        Create the log directories and command scripts of `tasks`, and remove the files left in them by
+        previous runs.  Every filesystem operation can take milliseconds on a network filesystem, so the
+        parents of the log directories are created once each, files are only removed from log directories
+        that already existed, and the per Task work is done by a pool of threads.  The ORM is only used from
+        this thread.
+        """
+        jobs = []
+        for task, command in zip(tasks, commands):
+            task.log_dir = self.log_out_dir_func(task)
+            stale_paths = [
+                task.output_stdout_path,
+                task.output_stderr_path,
+                task.output_command_script_path,
+                task.output_exit_status_path,
+            ]
 
+            if command is NOOP:
+                task.NOOP = True
+
+            if task.NOOP:
+                task.status = TaskStatus.submitted
+                jobs.append((None, stale_paths, None, None))
+            else:
+                jobs.append((task.log_dir, stale_paths, task.output_command_script_path, command))
+                task.drm_native_specification = self.get_submit_args(task)
+                assert task.drm is not None, "task has no drm set"
+
+        for parent in {os.path.dirname(log_dir) for log_dir, _, _, _ in jobs if log_dir}:
+            mkdir(parent)
+        if len(jobs) < 2:
+            list(it.starmap(_prepare_task_files, jobs))
+        else:
+            with futures.ThreadPoolExecutor(min(PREPARE_WORKERS, len(jobs))) as pool:
+                list(pool.map(_prepare_task_files, *zip(*jobs)))
+
+    def prepare_fused_tasks(self, task, commands):
+        """
+        Prepare the Tasks of task's chain to run in the same job as `task`, up to the first NOOP one, which is
+        left to be submitted on its own.
+
+        :param list commands: the rendered command of each Task in the chain.  They are rendered with the
+          Tasks submitted with `task`, before `task` has run.  See cosmos.job.fusion.
+        """
+        task.fused_tasks = []
         if task.NOOP:
-            task.status = TaskStatus.submitted
             return
-        else:
-            mkdir(task.log_dir)
+        fused_commands = []
+        for fused_task, command in zip(self.fused_chains.get(task, []), commands):
+            if command is NOOP or fused_task.NOOP:
+                break
+            task.fused_tasks.append(fused_task)
+            fused_commands.append(command)
+        self.prepare_tasks_for_submission(task.fused_tasks, fused_commands)
 
-            _create_command_sh(task, command)
-            task.drm_native_specification = self.get_submit_args(task)
-            assert task.drm is not None, "task has no drm set"
+        if task.fused_tasks:
+            if os.path.exists(task.output_fused_script_path):
+                os.unlink(task.output_fused_script_path)
+            write_fused_script(task)
 
     def run_tasks(self, tasks):
-        self.running_tasks += tasks
-        self.tasks += tasks
+        if not self.release_finished_tasks:
+            self.tasks += tasks
 
-        # Run the cmd_fxns in parallel, but do not submit any jobs they return
-        # Note we use the cosmos_app thread_pool here so we don't have to setup/teardown threads
-        # (or their sqlalchemy sessions)
-        # commands = self.cosmos_app.thread_pool.map(self.call_cmd_fxn, tasks)
-        commands = list(map(self.call_cmd_fxn, tasks))
-        # commands = self.cosmos_app.futures_executor.map(self.call_cmd_fxn, tasks)
+        # Run the cmd_fxns, in parallel if there is a render executor, but do not submit any jobs they return.
+        # The Tasks fused into their jobs are rendered with them
+        chains = [self.fused_chains.get(task, []) for task in tasks]
+        commands = self.render_commands(tasks + [t for chain in chains for t in chain])
+        commands, fused_commands = commands[: len(tasks)], iter(commands[len(tasks) :])
 
         # Submit the jobs in serial
         # TODO parallelize this for speed.  Means having all ORM stuff outside Job Submission.
 
         # this can be done in serial, because it is fast.  it's using some of the database features
 
-        list(map(self.prepare_task_for_submission, tasks, commands))
+        self.prepare_tasks_for_submission(tasks, commands)
+        for task, chain in zip(tasks, chains):
+            self.prepare_fused_tasks(task, list(it.islice(fused_commands, len(chain))))
+            # now that its cmd_fxn has said whether it is NOOP
+            self.running_tasks.add(task)
 
         # group by drms, so we can submit in parallel
-        for drm_name, tasks in groupby2(tasks, lambda t: t.drm):
+        for drm_name, drm_tasks in groupby2(tasks, lambda t: t.drm):
             drm = self.get_drm(drm_name)
-            tasks = list(tasks)
-            drm.submit_jobs(tasks)
+            drm_tasks = list(drm_tasks)
+            drm.submit_jobs(drm_tasks)
 
-        self.session.commit()
+        for task in tasks:
+            for fused_task in task.fused_tasks:
+                if not self.release_finished_tasks:
+                    self.tasks.append(fused_task)
+                fused_task.drm_jobID = task.drm_jobID
+                fused_task.status = task.status
+
+        self.group_commit.commit()
 
     def terminate(self):
         """Kills all tasks in a workflow."""
-        get_drm = lambda t: t.drm
-
-        for drm, tasks in it.groupby(sorted(self.running_tasks, key=get_drm), get_drm):
+        for drm, tasks in sorted(self.running_tasks.by_drm.items()):
             drm = self.get_drm(drm)
             target_tasks = list([t for t in tasks if t.drm_jobID is not None])
             drm.kill_tasks(target_tasks)
             for task in target_tasks:
-                task.status = TaskStatus.killed
-                task.stage.status = StageStatus.killed
+                for t in [task] + task.fused_tasks:
+                    t.status = TaskStatus.killed
+                    t.stage.status = StageStatus.killed
 
             drm.shutdown()
 
+        self.shutdown_render_executor()
+
     def get_finished_tasks(self):
         """
         yields all finished tasks
         """
         # NOOP tasks are already done
-        for task in list(self.running_tasks):
-            # task may have failed if submission failed
-            if task.NOOP:
-                self.running_tasks.remove(task)
-                self.dead_tasks.append(task)
-                yield task
-
-            assert task.status not in [TaskStatus.failed], "invalid: %s" % task.status
+        for task in self.running_tasks.pop_noop_tasks():
+            self._add_dead_task(task)
+            yield task
 
         # For the rest, ask its DRM if it is done
-        f = attrgetter("drm")
-        for drm, tasks in it.groupby(sorted(self.running_tasks, key=f), f):
+        for drm, tasks in sorted(self.running_tasks.by_drm.items()):
             for task, job_info_dict in self.get_drm(drm).filter_is_done(list(tasks)):
                 self.running_tasks.remove(task)
                 self.get_drm(drm).release_resources_after_completion(task)
-                self.dead_tasks.append(task)
-                for k, v in list(job_info_dict.items()):
-                    setattr(task, k, v)
-                yield task
+                self._add_dead_task(task)
+                if self.job_info_updater is None:
+                    for k, v in list(job_info_dict.items()):
+                        setattr(task, k, v)
+                else:
+                    self.job_info_updater.update(task, job_info_dict)
+                if task.fused_tasks:
+                    for t in self._split_fused_job(task):
+                        yield t
+                else:
+                    yield task
+
+    def _split_fused_job(self, task):
+        """
+        yields the Tasks of a finished fused job that ran, with their own exit_status and wall_time.  The rest
+        are reset, so that they are submitted again once their parent succeeds.
+
+        The other job info, such as the resource usage, is only set on the first Task.
+        """
+        chain = [task] + task.fused_tasks
+        for i, t in enumerate(chain):
+            exit_status_and_wall_time = read_exit_status(t)
+            if exit_status_and_wall_time is not None:
+                t.exit_status, t.wall_time = exit_status_and_wall_time
+            elif t is task:
+                # the job died before the first Task finished
+                t.exit_status = task.exit_status or -1
+            else:
+                t.drm_jobID = None
+                t.status = TaskStatus.no_attempt
+
+            if t.status == TaskStatus.no_attempt or t.exit_status != 0:
+                # the chain stopped here, the rest of it is fused into this Task's job if that is resubmitted
+                for rest_task in chain[i + 1 :]:
+                    rest_task.drm_jobID = None
+                    rest_task.status = TaskStatus.no_attempt
+                if chain[i + 1 :]:
+                    self.fused_chains[t] = chain[i + 1 :]
+                if t.status == TaskStatus.no_attempt:
+                    return
+
+            if t is not task:
+                self._add_dead_task(t)
+            yield t
+
+    def _add_dead_task(self, task):
+        if not self.release_finished_tasks:
+            self.dead_tasks.append(task)
+
+    def release_tasks(self, tasks):
+        """
+        Forget `tasks`, which have finished for good, so that a long run only holds the Tasks it still has to
+        run.  Their changes are flushed first, then they are expunged from the session, and a compact record
+        of each is added to finished_tasks.
+
+        :param list tasks: Tasks that are successful, or failed and won't be retried
+        """
+        if not tasks:
+            return
+        if self.job_info_updater is not None:
+            self.job_info_updater.flush()
+        self.session.flush()
+        stages = set()
+        for task in tasks:
+            self.finished_tasks.add(task)
+            self.fused_chains.pop(task, None)
+            stages.add(task.stage)
+            self.session.expunge(task)
+        for stage in stages:
+            # the Stage's task counts are kept, see cosmos.util.sqla.CollectionCounter
+            self.session.expire(stage, ["tasks"])
 
     @property
     def poll_interval(self):
-        if not self.running_tasks:
+        """
+        :returns: seconds to wait before polling the DRMs of running tasks again, or None if all of those DRMs
+            notify the JobManager when a job finishes
+        """
+        if not self.running_tasks or self.running_tasks.noop_tasks:
             return 0
-        return max(self.get_drm(d).poll_interval for d in set(t.drm for t in self.running_tasks))
+        poll_intervals = [self.get_drm(d).poll_interval for d in self.running_tasks.by_drm]
+        poll_intervals = [i for i in poll_intervals if i is not None]
+        return max(poll_intervals) if poll_intervals else None
+
+    def wait_for_finished_tasks(self, timeout):
+        """
+        Block until it is time to poll the DRMs again, a DRM reports a finished job, or wake() is called.
+
+        :param float timeout: the maximum number of seconds to block
+        """
+        poll_interval = self.poll_interval
+        if poll_interval is not None:
+            timeout = min(timeout, poll_interval)
+
+        if timeout > 0:
+            try:
+                self.job_finished_queue.get(timeout=timeout)
+            except queue.Empty:
+                pass
+
+        # one poll will pick up every finished job
+        while not self.job_finished_queue.empty():
+            self.job_finished_queue.get_nowait()
+
+    def wake(self):
+        """Stop blocking in wait_for_finished_tasks().  Safe to call from a signal handler."""
+        self.job_finished_queue.put(None)
+
 
+class RunningTasks(object):
+    """
+    The Tasks whose jobs are running, in a dict per DRM name that keeps them in the order they were added, so
+    that adding or removing a Task, and finding the DRMs to poll, don't depend on how many are running.  NOOP
+    Tasks, which are done as soon as they are submitted, are kept apart.
 
-def _create_command_sh(task, command):
-    """Create a sh script that will execute a command"""
-    with open(task.output_command_script_path, "w") as f:
-        f.write(command)
+    >>> from collections import namedtuple
+    >>> T = namedtuple('T', 'name drm NOOP')
+    >>> running = RunningTasks()
+    >>> for task in [T('a', 'ge', False), T('b', 'local', False), T('c', 'ge', False), T('d', 'ge', True)]:
+    ...     running.add(task)
+    >>> running.remove(T('b', 'local', False))
+    >>> len(running), sorted(running.by_drm), [t.name for t in running]
+    (3, ['ge'], ['d', 'a', 'c'])
+    >>> [t.name for t in running.pop_noop_tasks()], len(running)
+    (['d'], 2)
+    """
+
+    def __init__(self):
+        #: drm name -> {task: None}
+        self.by_drm = dict()
+        self.noop_tasks = []
+
+    def __len__(self):
+        return len(self.noop_tasks) + sum(len(tasks) for tasks in self.by_drm.values())
+
+    def __iter__(self):
+        return it.chain(self.noop_tasks, *self.by_drm.values())
+
+    def add(self, task):
+        """Add `task`, after its command was rendered, which decides whether it is NOOP"""
+        if task.NOOP:
+            self.noop_tasks.append(task)
+        else:
+            self.by_drm.setdefault(task.drm, dict())[task] = None
+
+    def remove(self, task):
+        tasks = self.by_drm[task.drm]
+        del tasks[task]
+        if not tasks:
+            del self.by_drm[task.drm]
+
+    def pop_noop_tasks(self):
+        noop_tasks, self.noop_tasks = self.noop_tasks, []
+        return noop_tasks
+
+
+class FinishedTasks(object):
+    """
+    The id, status and exit_status of Tasks that were released by JobManager.release_tasks(), in arrays that
+    take a few bytes per Task rather than a whole Task.
+
+    >>> from collections import namedtuple
+    >>> T = namedtuple('T', 'id status exit_status')
+    >>> finished = FinishedTasks()
+    >>> finished.add(T(1, TaskStatus.successful, 0))
+    >>> finished.add(T(2, TaskStatus.failed, None))
+    >>> len(finished), [(id_, status.name, exit_status) for id_, status, exit_status in finished]
+    (2, [(1, 'successful', 0), (2, 'failed', None)])
+    """
+
+    #: stands in for an exit_status of None
+    NO_EXIT_STATUS = -(2 ** 63)
+    STATUSES = list(TaskStatus)
+
+    def __init__(self):
+        self.ids = array("q")
+        self.statuses = bytearray()
+        self.exit_statuses = array("q")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        """:returns: (iterator) (id, status, exit_status) of each Task, in the order they were added"""
+        for id_, status, exit_status in zip(self.ids, self.statuses, self.exit_statuses):
+            yield id_, self.STATUSES[status], None if exit_status == self.NO_EXIT_STATUS else exit_status
+
+    def add(self, task):
+        self.ids.append(task.id)
+        self.statuses.append(self.STATUSES.index(task.status))
+        self.exit_statuses.append(self.NO_EXIT_STATUS if task.exit_status is None else task.exit_status)
+
+
+def _prepare_task_files(log_dir, stale_paths, script_path, command):
+    """
+    Create a Task's log directory if it is not None, then its command script.  The files of previous runs
+    can only be in a log directory that already existed.
+    """
+    if log_dir is not None:
+        try:
+            os.mkdir(log_dir)
+            stale_paths = []
+        except FileExistsError:
+            pass
+    for path in stale_paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+    if script_path is not None:
+        write_script(script_path, command)
+
+
+def _call(cmd_fxn, params):
+    """Render a command in the render executor"""
+    return cmd_fxn(**params)
+
+
+def _returns(cmd_fxn, command):
+    """:returns: (callable) stands in for `cmd_fxn`, which already returned `command`, for the cmd_wrapper"""
+
+    @wraps(cmd_fxn)
+    def rendered(*args, **kwargs):
+        return command
 
-    st = os.stat(task.output_command_script_path)
-    os.chmod(task.output_command_script_path, st.st_mode | stat.S_IEXEC)
+    return rendered
@@ -1,13 +1,36 @@
+import importlib
 from abc import abstractmethod, ABCMeta
+from functools import lru_cache
+
+#: name -> "module:class" of the DRMs that come with Cosmos.  Each module is only imported when its DRM is
+#: used, so that, ex: boto3 is not imported unless the awsbatch DRM is
+DRM_CLASSES = {
+    "awsbatch": "cosmos.job.drm.drm_awsbatch:DRM_AWSBatch",
+    "drmaa": "cosmos.job.drm.drm_drmaa:DRM_DRMAA",
+    "ge": "cosmos.job.drm.drm_ge:DRM_GE",
+    "k8s-jobs": "cosmos.job.drm.drm_k8s_jobs:DRM_K8S_Jobs",
+    "local": "cosmos.job.drm.drm_local:DRM_Local",
+    "lsf": "cosmos.job.drm.drm_lsf:DRM_LSF",
+    "slurm": "cosmos.job.drm.drm_slurm:DRM_SLURM",
+}
+
+#: other packages can add DRMs by declaring entry points in this group, ex: in their setup.py,
+#: entry_points={"cosmos.drms": ["mydrm = mypackage.drm:DRM_Mine"]}
+ENTRY_POINT_GROUP = "cosmos.drms"
 
 
 class DRM(object, metaclass=ABCMeta):
     "DRM base class"
 
     name = None
+    #: seconds between calls to filter_is_done().  None if the DRM calls notify_job_finished() instead.
     poll_interval = 1
     required_drm_options = set()
+    #: False if jobs can't run the scripts of other Tasks from the local filesystem.  See cosmos.job.fusion
+    supports_job_fusion = True
     log = None
+    #: a queue.SimpleQueue that the JobManager blocks on between polls
+    job_finished_queue = None
 
     def __init__(self, log, workflow=None):
         self.log = log
@@ -32,11 +55,33 @@ class DRM(object, metaclass=ABCMeta):
 
     @classmethod
     def get_drm(cls, drm_name):
-        """Gets a DRM by name.
+        """Gets a DRM by name, importing its module the first time.
         :params str drm_name: The name of the DRM to retrieve
         :return DRM: The DRM with a matching name
+        :raises ValueError: if there is no DRM named `drm_name`
+        """
+        # subclasses that were already imported, including ones that aren't registered
+        drm_cls = next((drm_cls for drm_cls in cls.__subclasses__() if drm_cls.name == drm_name), None)
+        if drm_cls is not None:
+            return drm_cls
+
+        path = DRM_CLASSES.get(drm_name) or _entry_point_drms().get(drm_name)
+        if path is None:
+            raise ValueError("unsupported drm: %s" % drm_name)
+        module_name, class_name = path.split(":")
+        return getattr(importlib.import_module(module_name), class_name)
+
+    @classmethod
+    def has_drm(cls, drm_name):
+        """
+        :params str drm_name: The name of a DRM
+        :return bool: True if there is a DRM named `drm_name`, without importing it
         """
-        return next(drm_cls for drm_cls in cls.__subclasses__() if drm_cls.name == drm_name)
+        return (
+            drm_name in DRM_CLASSES
+            or any(drm_cls.name == drm_name for drm_cls in cls.__subclasses__())
+            or drm_name in _entry_point_drms()
+        )
 
     @classmethod
     def get_drm_names(cls):
@@ -44,7 +89,7 @@ class DRM(object, metaclass=ABCMeta):
 
         :return set: All DRM names
         """
-        return {drm.name for drm in cls.__subclasses__()}
+        return set(DRM_CLASSES) | set(_entry_point_drms()) | {drm.name for drm in cls.__subclasses__()}
 
     @abstractmethod
     def submit_job(self, task):
@@ -70,6 +115,13 @@ class DRM(object, metaclass=ABCMeta):
         for t in tasks:
             self.kill(t)
 
+    def notify_job_finished(self):
+        """
+        Wake up the JobManager so it calls filter_is_done() right away.  Safe to call from any thread.
+        """
+        if self.job_finished_queue is not None:
+            self.job_finished_queue.put(self.name)
+
     def populate_logs(self, task):
         pass
 
@@ -78,3 +130,16 @@ class DRM(object, metaclass=ABCMeta):
 
     def shutdown(self):
         pass
+
+
+@lru_cache(maxsize=None)
+def _entry_point_drms():
+    """:returns: (dict) name -> "module:class" of the DRMs that other packages declared as entry points"""
+    from importlib import metadata
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        entry_points = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        entry_points = entry_points.get(ENTRY_POINT_GROUP, [])
+    return {entry_point.name: entry_point.value for entry_point in entry_points}
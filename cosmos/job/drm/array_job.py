@@ -0,0 +1,120 @@
+"""
+Submits groups of compatible Tasks as one array job, so a large Stage costs one call to qsub or sbatch rather
+than one per Task.
+
+Each element of the array runs one Task's job script, with that Task's stdout and stderr, so Tasks are still
+tracked, profiled and killed individually using the element's job id.
+"""
+import os
+import re
+import shlex
+
+from cosmos.util.helpers import groupby2, write_script
+
+#: options that set the job name, which is usually unique to each Task and so is ignored when grouping
+JOB_NAME_OPTION_RE = re.compile(r"""(^|\s)(-N|-J|--job-name)(\s+|=)("[^"]*"|'[^']*'|\S+)""")
+
+
+def strip_job_name(native_specification):
+    """
+    >>> strip_job_name('-cwd -pe orte 2 -N "stage[uid]" -q all.q')
+    '-cwd -pe orte 2 -q all.q'
+    >>> strip_job_name('-c 1 -p short -J stage[uid] --mem 1024')
+    '-c 1 -p short --mem 1024'
+    """
+    return JOB_NAME_OPTION_RE.sub("", native_specification or "").strip()
+
+
+def array_job_key(task):
+    """Tasks with the same key can be elements of the same array job"""
+    return task.drm, strip_job_name(task.drm_native_specification)
+
+
+def group_array_jobs(tasks, max_size):
+    """
+    Group Tasks that can be submitted as one array job.
+
+    >>> class T(object):
+    ...     drm, environment_variables = 'ge', None
+    ...     def __init__(self, i, ns):
+    ...         self.i, self.drm_native_specification = i, ns + ' -N "job%s"' % i
+    ...     def __repr__(self):
+    ...         return 'T%s' % self.i
+    >>> group_array_jobs([T(1, '-pe orte 1'), T(2, '-pe orte 2'), T(3, '-pe orte 1'), T(4, '-pe orte 1')], 2)
+    [[T1, T3], [T2], [T4]]
+
+    :param int max_size: the most Tasks in one array job
+    :returns: (list) lists of Tasks, in the order their first Task appeared in `tasks`
+    """
+    # environment_variables are not supported by array jobs, or by the DRMs that submit them
+    tasks = list(tasks)
+    singletons = [[t] for t in tasks if t.environment_variables is not None]
+    groups = []
+    for _, group in groupby2([t for t in tasks if t.environment_variables is None], array_job_key):
+        group = list(group)
+        groups += [group[i : i + max_size] for i in range(0, len(group), max_size)]
+    order = {task: i for i, task in enumerate(tasks)}
+    return sorted(groups + singletons, key=lambda group: order[group[0]])
+
+
+def array_job_name(tasks):
+    """
+    >>> class T(object):
+    ...     class stage(object):
+    ...         name = 'align'
+    >>> array_job_name([T(), T()])
+    'align[2]'
+    """
+    return "%s[%s]" % (tasks[0].stage.name, len(tasks))
+
+
+def write_array_job_script(tasks, task_id_var):
+    """
+    Write the script submitted as the array job for `tasks`, to the first Task's
+    `output_array_job_script_path`.  Element i (starting at 1) runs the job script of tasks[i - 1].
+
+    :param str task_id_var: the environment variable the DRM sets to the index of the element
+    :returns: (str) the path of the script
+    """
+    path = tasks[0].output_array_job_script_path
+    lines = [
+        "#!/bin/bash",
+        "# %s Tasks submitted as one array job, see cosmos.job.drm.array_job" % len(tasks),
+        'case "$%s" in' % task_id_var,
+    ]
+    for i, task in enumerate(tasks, 1):
+        lines.append(
+            "  %s) exec %s > %s 2> %s ;;"
+            % (
+                i,
+                shlex.quote(os.path.abspath(task.output_job_script_path)),
+                shlex.quote(os.path.abspath(task.output_stdout_path)),
+                shlex.quote(os.path.abspath(task.output_stderr_path)),
+            )
+        )
+    lines += [
+        "esac",
+        'echo "no Task for array element $%s" >&2' % task_id_var,
+        "exit 1",
+    ]
+
+    # a resubmitted Task may still be the first element of a running array job, so never write in place
+    if os.path.exists(path):
+        os.unlink(path)
+    write_script(path, "\n".join(lines) + "\n")
+    return path
+
+
+def expand_task_ids(task_ids):
+    """
+    Expand the array element ranges that the DRMs print for pending elements.
+
+    >>> expand_task_ids('1-5:2,8,10-11%2')
+    [1, 3, 5, 8, 10, 11]
+    """
+    expanded = []
+    for task_id_range in task_ids.split("%")[0].split(","):
+        m = re.match(r"(\d+)(?:-(\d+)(?::(\d+))?)?$", task_id_range)
+        first, last, step = m.group(1), m.group(2) or m.group(1), m.group(3) or 1
+        expanded += range(int(first), int(last) + 1, int(step))
+    return expanded
@@ -270,6 +270,7 @@ def register_base_job_definition(container_image, environment, command, mount_po
 
 class DRM_AWSBatch(DRM):
     name = "awsbatch"
+    supports_job_fusion = False
     required_drm_options = {
         "container_image",
         "s3_prefix_for_command_script_temp_files",
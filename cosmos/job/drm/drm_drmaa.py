@@ -28,7 +28,7 @@ class DRM_DRMAA(DRM):
         if task.environment_variables is not None:
             raise NotImplementedError
         with get_drmaa_session().createJobTemplate() as jt:
-            jt.remoteCommand = os.path.abspath(task.output_command_script_path)
+            jt.remoteCommand = os.path.abspath(task.output_job_script_path)
             jt.outputPath = ":" + os.path.abspath(task.output_stdout_path)
             jt.errorPath = ":" + os.path.abspath(task.output_stderr_path)
             jt.jobEnvironment = os.environ
@@ -8,6 +8,13 @@ from collections import OrderedDict
 
 from cosmos import TaskStatus
 from cosmos.job.drm.DRM_Base import DRM
+from cosmos.job.drm.array_job import (
+    array_job_name,
+    expand_task_ids,
+    group_array_jobs,
+    strip_job_name,
+    write_array_job_script,
+)
 from cosmos.job.drm.util import convert_size_to_kb, div, exit_process_group, run_cli_cmd
 from cosmos.util.signal_handlers import sleep_through_signals
 from more_itertools import grouper
@@ -26,12 +33,42 @@ class QacctJobNotFoundError(Exception):
 class DRM_GE(DRM):
     name = "ge"
     poll_interval = 5
+    #: the most Tasks submitted as one array job (qsub -t), see cosmos.job.drm.array_job.  1 disables array
+    #: jobs.  Should not be more than the cluster's max_aj_tasks
+    max_array_job_size = 75000
+
+    def submit_jobs(self, tasks):
+        for array_tasks in group_array_jobs(tasks, self.max_array_job_size):
+            if len(array_tasks) == 1:
+                self.submit_job(array_tasks[0])
+            else:
+                self.submit_array_job(array_tasks)
+
+    def submit_array_job(self, tasks):
+        """
+        Submit `tasks` as one array job.  Each Task's drm_jobID is set to the id of its element, ex: 123.1
+        """
+        script_path = write_array_job_script(tasks, "SGE_TASK_ID")
+        prefix = os.path.splitext(script_path)[0]
+        job_id, status = qsub(
+            cmd_fn=script_path,
+            stdout_fn=prefix + "_stdout.txt",
+            stderr_fn=prefix + "_stderr.txt",
+            addl_args='%s -N "%s" -t 1-%d'
+            % (strip_job_name(tasks[0].drm_native_specification), array_job_name(tasks), len(tasks)),
+            drm_name=tasks[0].drm,
+            logger=tasks[0].log,
+            log_prefix="%s (array job of %d Tasks)" % (tasks[0], len(tasks)),
+        )
+        for i, task in enumerate(tasks, 1):
+            task.drm_jobID = None if job_id is None else "%s.%s" % (job_id, i)
+            task.status = status
 
     def submit_job(self, task):
         if task.environment_variables is not None:
             raise NotImplementedError
         task.drm_jobID, task.status = qsub(
-            cmd_fn=task.output_command_script_path,
+            cmd_fn=task.output_job_script_path,
             stdout_fn=task.output_stdout_path,
             stderr_fn=task.output_stderr_path,
             addl_args=task.drm_native_specification,
@@ -245,7 +282,7 @@ def qacct(job_id, num_retries=10, quantum=30, logger=None, log_prefix=""):
     for i in range(num_retries):
 
         qacct_stdout_str, qacct_stderr_str, qacct_returncode = run_cli_cmd(
-            ["qacct", "-j", str(job_id)], logger=logger
+            ["qacct", "-j"] + str(job_id).replace(".", " -t ").split(), logger=logger
         )
         if qacct_returncode == 0 and qacct_stdout_str.strip():
             # qacct returned actual output w/no error code. we're good
@@ -377,11 +414,15 @@ def qstat(logger=None):
 
     The exact contents of the sub-dictionaries in the returned dictionary's
     values() depend on the installed GE version.
+
+    Each element of an array job is also mapped from its own id, ex: 123.1
     """
     if logger is None:
         logger = _get_null_logger()
 
-    stdout, _, returncode = run_cli_cmd(["qstat"], attempts=3, interval=30, logger=logger, timeout=30)
+    stdout, _, returncode = run_cli_cmd(
+        ["qstat", "-g", "d"], attempts=3, interval=30, logger=logger, timeout=30
+    )
     if returncode != 0:
         logger.warning("qstat returned %s: If GE is offline, all jobs are dead or done")
         return {}
@@ -398,6 +439,14 @@ def qstat(logger=None):
     for l in lines[2:]:
         items = re.split(r"\s+", l.strip())
         bjobs[items[0]] = dict(list(zip(keys, items)))
+
+        # job-ID prior name user state submit/start-date time [queue] slots [ja-task-ID]
+        rest = items[7:]
+        if rest and "@" in rest[0]:
+            rest = rest[1:]
+        if len(rest) > 1:
+            for task_id in expand_task_ids(rest[1]):
+                bjobs["%s.%s" % (items[0], task_id)] = dict(bjobs[items[0]], **{"ja-task-ID": str(task_id)})
     return bjobs
 
 
@@ -442,7 +491,8 @@ def qsub(
         status = TaskStatus.failed
     else:
         try:
-            job_id = str(int(stdout))
+            # array jobs print the range of elements too, ex: 123.1-10:1
+            job_id = str(int(stdout.strip().split(".")[0]))
         except ValueError:
             logger.error(
                 "%s submission to %s returned unexpected text: %s", log_prefix, drm_name, stdout,
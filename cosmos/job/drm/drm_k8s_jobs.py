@@ -18,6 +18,7 @@ class DRM_K8S_Jobs(DRM):  # noqa
     """
 
     name = "k8s-jobs"
+    supports_job_fusion = False
     required_drm_options = {"image"}
     optional_drm_options = {
         "file",
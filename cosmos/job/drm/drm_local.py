@@ -1,13 +1,16 @@
 import os
 import re
+import select
 import signal
 import sys
+import threading
 import time
 from concurrent.futures.thread import ThreadPoolExecutor
 from random import shuffle
 
 from cosmos.job.drm.DRM_Base import DRM
-from cosmos.job.drm.util import exit_process_group
+from cosmos.job.drm.py_call_pool import PooledProcess, PyCallPool, is_python_script
+from cosmos.job.drm.util import div, exit_process_group
 from cosmos.api import TaskStatus
 from cosmos.util.helpers import progress_bar
 from cosmos.constants import TERMINATION_SIGNALS
@@ -46,9 +49,234 @@ def parse_COSMOS_LOCAL_GPU_DEVICES(COSMOS_LOCAL_GPU_DEVICES=None):
                 yield gpu_str
 
 
+def pidfds_are_supported():
+    """
+    :returns: True if this platform can open a file descriptor that becomes readable when a process exits
+    """
+    if not hasattr(os, "pidfd_open") or not hasattr(select, "epoll"):
+        return False
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except OSError:
+        # kernels older than 5.3
+        return False
+    return True
+
+
+class ChildReaper(threading.Thread):
+    """
+    Reaps child processes as soon as they exit, by waiting on a pidfd for each of them with epoll.
+
+    `on_exit(pid, wait_status, rusage)` is called from this thread for each reaped process.  wait_status and
+    rusage are None if the process was reaped by someone else, for example by Popen.wait().
+
+    Its file descriptors are only opened by :meth:`start`, and are closed when the thread stops, so a reaper
+    that is never started holds none.
+    """
+
+    def __init__(self, on_exit):
+        super(ChildReaper, self).__init__(name="cosmos-local-reaper", daemon=True)
+        self.on_exit = on_exit
+        self._epoll = None
+        self._pids = dict()
+        self._stop_r, self._stop_w = None, None
+
+    def start(self):
+        self._epoll = select.epoll()
+        self._stop_r, self._stop_w = os.pipe()
+        self._epoll.register(self._stop_r, select.EPOLLIN)
+        super(ChildReaper, self).start()
+
+    def watch(self, pid):
+        """Start watching a child process.  Safe to call from any thread, even after it has exited."""
+        pidfd = os.pidfd_open(pid)
+        self._pids[pidfd] = pid
+        self._epoll.register(pidfd, select.EPOLLIN)
+
+    def stop(self):
+        os.write(self._stop_w, b"x")
+
+    def run(self):
+        while True:
+            for fd, _ in self._epoll.poll():
+                if fd == self._stop_r:
+                    self._close()
+                    return
+
+                pid = self._pids.pop(fd)
+                self._epoll.unregister(fd)
+                os.close(fd)
+                try:
+                    # the process has exited, so this will not block
+                    _, wait_status, rusage = os.wait4(pid, os.WNOHANG)
+                except ChildProcessError:
+                    wait_status, rusage = None, None
+                self.on_exit(pid, wait_status, rusage)
+
+    def _close(self):
+        self._epoll.close()
+        for fd in list(self._pids):
+            os.close(fd)
+        self._pids.clear()
+        os.close(self._stop_r)
+        os.close(self._stop_w)
+
+
+def rusage_to_profile(rusage, wall_time):
+    """
+    :param resource.struct_rusage rusage: as returned by os.wait4() for a job, which includes every descendant
+      that was waited for
+    :returns: (dict) Task profile fields
+    """
+    cpu_time = rusage.ru_utime + rusage.ru_stime
+    return dict(
+        user_time=rusage.ru_utime,
+        system_time=rusage.ru_stime,
+        cpu_time=cpu_time,
+        percent_cpu=div(cpu_time, wall_time),
+        # kilobytes on linux
+        max_rss_mem_kb=rusage.ru_maxrss,
+        io_read_count=rusage.ru_inblock,
+        io_write_count=rusage.ru_oublock,
+        ctx_switch_voluntary=rusage.ru_nvcsw,
+        ctx_switch_involuntary=rusage.ru_nivcsw,
+    )
+
+
+class ProcessGroupSampler(threading.Thread):
+    """
+    Samples the memory, threads and open files of every process in each watched process group from /proc,
+    every `interval` seconds.
+
+    A single pass over /proc is shared by all the watched groups, so the cost depends on the number of
+    processes on the machine rather than on the number of jobs.
+    """
+
+    def __init__(self, interval):
+        super(ProcessGroupSampler, self).__init__(name="cosmos-local-sampler", daemon=True)
+        self.interval = interval
+        self.page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+        self._samples = dict()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def watch(self, pgid):
+        with self._lock:
+            self._samples[pgid] = _GroupSamples()
+
+    def unwatch(self, pgid):
+        """
+        Stop sampling a process group.
+
+        :returns: (dict) Task profile fields summarizing its samples, empty if it was never sampled
+        """
+        with self._lock:
+            samples = self._samples.pop(pgid, None)
+        return samples.summary() if samples is not None else dict()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        with self._lock:
+            watched = dict(self._samples)
+        if not watched:
+            return
+
+        group_totals = {pgid: [0, 0, 0, 0] for pgid in watched}
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f"/proc/{pid}/stat") as fh:
+                    stat = fh.read()
+                # fields after the command name, which may contain spaces or parentheses, start at "state"
+                fields = stat[stat.rindex(")") + 2 :].split()
+                pgid = int(fields[2])
+                if pgid not in watched:
+                    continue
+                num_threads, vms_kb, rss_kb = int(fields[17]), int(fields[20]) // 1024, int(fields[21])
+                num_fds = len(os.listdir(f"/proc/{pid}/fd"))
+                io = _read_proc_io(pid)
+            except (OSError, ValueError, IndexError):
+                # the process exited while it was being read
+                continue
+
+            totals = group_totals[pgid]
+            totals[0] += rss_kb * self.page_kb
+            totals[1] += vms_kb
+            totals[2] += num_threads
+            totals[3] += num_fds
+            if io is not None:
+                watched[pgid].io_kb_by_pid[pid] = io
+
+        for pgid, totals in group_totals.items():
+            watched[pgid].add(*totals)
+
+
+class _GroupSamples(object):
+    def __init__(self):
+        self.n = 0
+        self.sums = [0, 0, 0, 0]
+        self.maxes = [0, 0, 0, 0]
+        # the io counters are cumulative, so only the last reading of each process is needed
+        self.io_kb_by_pid = dict()
+
+    def add(self, rss_kb, vms_kb, num_threads, num_fds):
+        if not num_threads:
+            # no live process was found in the group
+            return
+        self.n += 1
+        for i, value in enumerate((rss_kb, vms_kb, num_threads, num_fds)):
+            self.sums[i] += value
+            self.maxes[i] = max(self.maxes[i], value)
+
+    def summary(self):
+        if not self.n:
+            return dict()
+        avg_rss_mem_kb, avg_vms_mem_kb, avg_num_threads, avg_num_fds = (int(s / self.n) for s in self.sums)
+        max_rss_mem_kb, max_vms_mem_kb, max_num_threads, max_num_fds = self.maxes
+        profile = dict(
+            avg_rss_mem_kb=avg_rss_mem_kb,
+            max_rss_mem_kb=max_rss_mem_kb,
+            avg_vms_mem_kb=avg_vms_mem_kb,
+            max_vms_mem_kb=max_vms_mem_kb,
+            avg_num_threads=avg_num_threads,
+            max_num_threads=max_num_threads,
+            avg_num_fds=avg_num_fds,
+            max_num_fds=max_num_fds,
+        )
+        if self.io_kb_by_pid:
+            profile["io_read_kb"] = sum(read_kb for read_kb, _ in self.io_kb_by_pid.values())
+            profile["io_write_kb"] = sum(write_kb for _, write_kb in self.io_kb_by_pid.values())
+        return profile
+
+
+def _read_proc_io(pid):
+    """:returns: (read_kb, write_kb) of storage io by a process, or None if /proc/<pid>/io is not readable"""
+    try:
+        with open(f"/proc/{pid}/io") as fh:
+            counters = dict(line.split(": ") for line in fh.read().splitlines())
+    except (OSError, ValueError):
+        return None
+    return int(counters["read_bytes"]) // 1024, int(counters["write_bytes"]) // 1024
+
+
 class DRM_Local(DRM):
     name = "local"
     poll_interval = 0.3
+    #: seconds between samples of each job's memory, threads and open files from /proc.  None disables
+    #: sampling.  Defaults to $COSMOS_LOCAL_PROFILE_INTERVAL
+    profile_interval = None
+    #: modules to import in a warm fork server that runs Python Task scripts (see cosmos.api.py_call), instead
+    #: of starting a new interpreter for each of them.  The modules of the Tasks' functions are also imported.
+    #: None disables the fork server.  Defaults to $COSMOS_LOCAL_PY_CALL_POOL, a comma separated list of
+    #: modules, or 1
+    py_call_pool_preload = None
 
     def __init__(self, log, workflow=None):
         self.procs = dict()
@@ -57,8 +285,49 @@ class DRM_Local(DRM):
 
         self.task_id_to_gpus_used = dict()
 
+        # drm_jobID -> (exit_status, end time, rusage) of jobs reaped by the ChildReaper
+        self.exited_jobs = dict()
+        self.exited_jobs_changed = threading.Condition()
+        if pidfds_are_supported():
+            # no need to poll: jobs are reaped as soon as they exit, and the JobManager is woken up
+            self.reaper = ChildReaper(self._on_child_exit)
+            self.poll_interval = None
+        else:
+            self.reaper = None
+
+        profile_interval = self.profile_interval or os.environ.get("COSMOS_LOCAL_PROFILE_INTERVAL")
+        if profile_interval and os.path.exists("/proc/self/stat"):
+            self.sampler = ProcessGroupSampler(float(profile_interval))
+        else:
+            self.sampler = None
+
+        preload = self.py_call_pool_preload
+        if preload is None and os.environ.get("COSMOS_LOCAL_PY_CALL_POOL"):
+            preload = [m for m in os.environ["COSMOS_LOCAL_PY_CALL_POOL"].split(",") if m != "1"]
+        if preload is not None:
+            self.py_call_pool = PyCallPool(self._on_pooled_job_exit, preload)
+        else:
+            self.py_call_pool = None
+
         super(DRM_Local, self).__init__(log, workflow)
 
+    def _on_child_exit(self, pid, wait_status, rusage):
+        drm_jobID = str(pid)
+        p = self.procs[drm_jobID]
+        if wait_status is not None:
+            # let the Popen know it has been reaped, so it doesn't try to wait on it
+            p.returncode = os.waitstatus_to_exitcode(wait_status)
+        self._on_job_exit(drm_jobID, p.returncode, rusage)
+
+    def _on_pooled_job_exit(self, pid, exit_status, rusage):
+        self._on_job_exit(str(pid), exit_status, rusage)
+
+    def _on_job_exit(self, drm_jobID, exit_status, rusage):
+        with self.exited_jobs_changed:
+            self.exited_jobs[drm_jobID] = (exit_status, time.time(), rusage)
+            self.exited_jobs_changed.notify_all()
+        self.notify_job_finished()
+
     @property
     def gpus_used(self):
         return [gpu for gpus in list(self.task_id_to_gpus_used.values()) for gpu in gpus]
@@ -93,10 +362,10 @@ class DRM_Local(DRM):
                     "-k",
                     "10",
                     str(task.time_req),
-                    task.output_command_script_path,
+                    task.output_job_script_path,
                 ]
             else:
-                cmd = task.output_command_script_path
+                cmd = task.output_job_script_path
 
             env = os.environ.copy()
             if task.gpu_req:
@@ -111,23 +380,46 @@ class DRM_Local(DRM):
                 for (k, v,) in task.environment_variables.items():
                     env[k] = v
 
-            p = subprocess.Popen(
-                cmd,
-                stdout=open(task.output_stdout_path, "w"),
-                stderr=open(task.output_stderr_path, "w"),
-                shell=False,
-                env=env,
-                preexec_fn=exit_process_group,
-            )
-            p.start_time = time.time()
+            start_time = time.time()
+            if self.py_call_pool is not None and is_python_script(task.output_job_script_path):
+                p = self.py_call_pool.start(
+                    task.output_job_script_path,
+                    task.output_stdout_path,
+                    task.output_stderr_path,
+                    env,
+                    task.time_req,
+                )
+            else:
+                p = subprocess.Popen(
+                    cmd,
+                    stdout=open(task.output_stdout_path, "w"),
+                    stderr=open(task.output_stderr_path, "w"),
+                    shell=False,
+                    env=env,
+                    preexec_fn=exit_process_group,
+                )
+            p.start_time = start_time
             drm_jobID = str(p.pid)
             self.procs[drm_jobID] = p
+            if self.sampler is not None:
+                # the job is the leader of its own process group
+                self.sampler.watch(p.pid)
+            if self.reaper is not None and not isinstance(p, PooledProcess):
+                # the fork server reaps its own children
+                self.reaper.watch(p.pid)
 
             return drm_jobID
         else:
             return None
 
     def submit_jobs(self, tasks):
+        if self.reaper is not None and not self.reaper.is_alive():
+            self.reaper.start()
+        if self.sampler is not None and not self.sampler.is_alive():
+            self.sampler.start()
+        if self.py_call_pool is not None:
+            self.py_call_pool.preload(getattr(getattr(t, "cmd_fxn", None), "__module__", None) for t in tasks)
+
         if len(tasks) > 1:
             with ThreadPoolExecutor(min(len(tasks), MAX_THREADS)) as pool:
                 rv = list(progress_bar(pool.map(self._submit_job, tasks), len(tasks), "Submitting"))
@@ -145,6 +437,10 @@ class DRM_Local(DRM):
                 task.status = TaskStatus.killed
 
     def _is_done(self, task, timeout=0):
+        if self.reaper is not None or isinstance(self.procs.get(task.drm_jobID), PooledProcess):
+            with self.exited_jobs_changed:
+                return self.exited_jobs_changed.wait_for(lambda: task.drm_jobID in self.exited_jobs, timeout)
+
         try:
             p = self.procs[task.drm_jobID]
             p.wait(timeout=timeout)
@@ -173,10 +469,23 @@ class DRM_Local(DRM):
         return {task.drm_jobID: f(task) for task in tasks}
 
     def _get_task_return_data(self, task):
-        return dict(
-            exit_status=self.procs[task.drm_jobID].wait(timeout=0),
-            wall_time=round(int(time.time() - self.procs[task.drm_jobID].start_time)),
-        )
+        p = self.procs[task.drm_jobID]
+        if task.drm_jobID in self.exited_jobs:
+            exit_status, end_time, rusage = self.exited_jobs[task.drm_jobID]
+        else:
+            exit_status, end_time, rusage = p.wait(timeout=0), time.time(), None
+        wall_time = end_time - p.start_time
+
+        data = dict(exit_status=exit_status, wall_time=round(int(wall_time)),)
+        if rusage is not None:
+            data.update(rusage_to_profile(rusage, wall_time))
+        if self.sampler is not None:
+            sampled = self.sampler.unwatch(p.pid)
+            # rusage only knows the largest single process, the samples add up the whole process group
+            if "max_rss_mem_kb" in data:
+                sampled["max_rss_mem_kb"] = max(sampled.get("max_rss_mem_kb", 0), data["max_rss_mem_kb"])
+            data.update(sampled)
+        return data
 
     @staticmethod
     def _signal(task, sig):
@@ -221,6 +530,18 @@ class DRM_Local(DRM):
     def release_resources_after_completion(self, task):
         if task.gpu_req:
             self.task_id_to_gpus_used.pop(task.id)
+        # the job was reaped, so its process and exit status aren't needed anymore
+        self.procs.pop(task.drm_jobID, None)
+        with self.exited_jobs_changed:
+            self.exited_jobs.pop(task.drm_jobID, None)
+
+    def shutdown(self):
+        if self.reaper is not None and self.reaper.is_alive():
+            self.reaper.stop()
+        if self.sampler is not None and self.sampler.is_alive():
+            self.sampler.stop()
+        if self.py_call_pool is not None:
+            self.py_call_pool.shutdown()
 
 
 class JobStatusError(Exception):
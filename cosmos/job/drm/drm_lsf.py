@@ -22,6 +22,7 @@ decode_lsf_state = dict(
 
 class DRM_LSF(DRM):
     name = "lsf"
+    supports_job_fusion = False
     poll_interval = 5
 
     def submit_job(self, task):
@@ -6,6 +6,13 @@ from pprint import pformat
 
 from cosmos import TaskStatus
 from cosmos.job.drm.DRM_Base import DRM
+from cosmos.job.drm.array_job import (
+    array_job_name,
+    expand_task_ids,
+    group_array_jobs,
+    strip_job_name,
+    write_array_job_script,
+)
 from cosmos.job.drm.util import convert_size_to_kb, div, exit_process_group, run_cli_cmd
 from cosmos.util.retry import retry_call
 from more_itertools import grouper
@@ -80,7 +87,36 @@ def sbatch(task):
             os.path.abspath(task.output_stderr_path),
         ]
         + ns.split()
-        + [task.output_command_script_path]
+        + [task.output_job_script_path]
+    )
+
+    out, err, _ = run_cli_cmd(cmd, env=os.environ)
+    return str(re.search(r"job (\d+)", out).group(1))
+
+
+def sbatch_array(tasks, script_path):
+    """
+    Submit `script_path` as an array job with an element for each of `tasks`.
+
+    :returns: (str) the id of the array job
+    """
+    prefix = os.path.splitext(script_path)[0]
+    cmd = (
+        [
+            "sbatch",
+            "--array",
+            "1-%d" % len(tasks),
+            "--open-mode",
+            "append",
+            "-o",
+            prefix + "_stdout.txt",
+            "-e",
+            prefix + "_stderr.txt",
+            "-J",
+            array_job_name(tasks),
+        ]
+        + strip_job_name(tasks[0].drm_native_specification).split()
+        + [script_path]
     )
 
     out, err, _ = run_cli_cmd(cmd, env=os.environ)
@@ -90,6 +126,34 @@ def sbatch(task):
 class DRM_SLURM(DRM):
     name = "slurm"
     poll_interval = 5
+    #: the most Tasks submitted as one array job (sbatch --array), see cosmos.job.drm.array_job.  1 disables
+    #: array jobs.  Must be less than the cluster's MaxArraySize, which defaults to 1001
+    max_array_job_size = 1000
+
+    def submit_jobs(self, tasks):
+        for array_tasks in group_array_jobs(tasks, self.max_array_job_size):
+            if len(array_tasks) == 1:
+                self.submit_job(array_tasks[0])
+            else:
+                self.submit_array_job(array_tasks)
+
+    def submit_array_job(self, tasks):
+        """
+        Submit `tasks` as one array job.  Each Task's drm_jobID is set to the id of its element, ex: 123_1
+        """
+        script_path = write_array_job_script(tasks, "SLURM_ARRAY_TASK_ID")
+        job_id = retry_call(
+            sbatch_array,
+            fargs=[tasks, script_path],
+            delay=10,
+            tries=10,
+            backoff=2,
+            max_delay=60,
+            logger=tasks[0].log,
+        )
+        for i, task in enumerate(tasks, 1):
+            task.drm_jobID = "%s_%s" % (job_id, i)
+            task.status = TaskStatus.submitted
 
     def submit_job(self, task):
         if task.environment_variables is not None:
@@ -170,6 +234,8 @@ class DRM_SLURM(DRM):
 
 def do_sacct(job_ids):
     # there's a lag between when a job finishes and when sacct is available :(Z
+    # the elements of an array job (ex: 123_1) are all listed by its id
+    job_ids = sorted({job_id.split("_")[0] for job_id in job_ids})
     cmd = (
         "sacct --format="
         '"State,JobID,CPUTime,MaxRSS,AveRSS,AveCPU,CPUTimeRAW,AveVMSize,MaxVMSize,Elapsed,ExitCode,Start,End" '
@@ -192,7 +258,14 @@ def do_sacct(job_ids):
             # slurm prints these .batch versions of jobids which have better information, overwrite
             job_dict["JobID"] = job_dict["JobID"].replace(".batch", "")
 
-        all_jobs[job_dict["JobID"]] = job_dict
+        m = re.match(r"(\d+)_\[(.+)\]$", job_dict["JobID"])
+        if m:
+            # pending elements of an array job are listed as a range, ex: 123_[2-10%4]
+            for task_id in expand_task_ids(m.group(2)):
+                element_id = "%s_%s" % (m.group(1), task_id)
+                all_jobs[element_id] = dict(job_dict, JobID=element_id)
+        else:
+            all_jobs[job_dict["JobID"]] = job_dict
 
     return all_jobs
 
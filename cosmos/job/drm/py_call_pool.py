@@ -0,0 +1,312 @@
+"""
+Runs the Python scripts written by :func:`cosmos.api.py_call` in processes forked from a warm interpreter,
+rather than starting a new interpreter and re-importing everything for every Task.
+
+The warm interpreter is a fork server (see :func:`serve`) that imports the preloaded modules, then reads one
+JSON request per line from stdin, forks a child to run each script, and writes a JSON line to stdout when a
+child starts and when it exits.
+"""
+import json
+import os
+import re
+import resource
+import runpy
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+from cosmos.job.drm.util import exit_process_group
+
+#: the exit status of a Task that exceeds its time_req, the same as /usr/bin/timeout
+TIME_LIMIT_EXIT_STATUS = 124
+#: the exit status of a Task that had to be killed after exceeding its time_req, the same as /usr/bin/timeout
+KILLED_EXIT_STATUS = 128 + signal.SIGKILL
+
+
+def is_python_script(path):
+    """
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile('w') as fh:
+    ...     _ = fh.write('#!/usr/bin/env python\\nprint(1)\\n') and fh.flush()
+    ...     is_python_script(fh.name)
+    True
+    """
+    with open(path) as fh:
+        first_line = fh.readline()
+    return re.match(r"#!\s*(/usr/bin/env\s+)?\S*python[\d.]*\s*$", first_line) is not None
+
+
+class PooledProcess(object):
+    """A Task script running in a process forked by the fork server"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+
+
+class PyCallPool(object):
+    """
+    Starts Task scripts from a fork server that has already imported the preloaded modules.  Forking it takes
+    a few milliseconds, compared to the interpreter startup and imports of a new `python` process.
+
+    The fork server is started by the first call to :meth:`start`, so modules passed to :meth:`preload` after
+    that are imported by each Task instead.
+    """
+
+    #: seconds after its time_req that the fork server kills a Task which has not exited, like `timeout -k`
+    kill_after = 10
+
+    def __init__(self, on_exit, preload=()):
+        """
+        :param callable on_exit: called as `on_exit(pid, exit_status, rusage)` from another thread when a
+          process exits.  exit_status and rusage are None if the fork server died first.
+        :param list preload: modules to import in the fork server
+        """
+        self.on_exit = on_exit
+        self.preload_modules = []
+        self.server = None
+        self.processes = dict()
+        self._lock = threading.Lock()
+        self._started = threading.Condition(self._lock)
+        self._started_pids = dict()
+        self._next_request_id = 0
+        self.preload(preload)
+
+    def preload(self, modules):
+        for module in modules:
+            # __main__ is the workflow script, importing it again is not useful or safe
+            if module and module != "__main__" and module not in self.preload_modules:
+                self.preload_modules.append(module)
+
+    def _start_server(self):
+        # the workflow's sys.path is only used to find the preloaded modules, Tasks get the usual sys.path
+        args = json.dumps(dict(preload=self.preload_modules, sys_path=sys.path, kill_after=self.kill_after))
+        self.server = subprocess.Popen(
+            [sys.executable, "-c", "import sys; from %s import serve; serve(sys.argv[1])" % __name__, args],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        threading.Thread(target=self._read_responses, name="cosmos-py-call-pool", daemon=True).start()
+
+    def start(self, script_path, stdout_path, stderr_path, env, time_req=None):
+        """
+        :returns: (PooledProcess) the process running `script_path`
+        """
+        with self._lock:
+            if self.server is None:
+                self._start_server()
+            request_id = self._next_request_id
+            self._next_request_id += 1
+            request = dict(
+                id=request_id,
+                script_path=script_path,
+                stdout_path=stdout_path,
+                stderr_path=stderr_path,
+                env=env,
+                cwd=os.getcwd(),
+                time_req=time_req,
+            )
+            self.server.stdin.write(json.dumps(request).encode() + b"\n")
+            self.server.stdin.flush()
+
+            self._started.wait_for(lambda: request_id in self._started_pids or self.server.poll() is not None)
+            if request_id not in self._started_pids:
+                raise EnvironmentError(f"the py_call fork server exited with status {self.server.returncode}")
+            return self.processes[self._started_pids.pop(request_id)]
+
+    def _read_responses(self):
+        for line in self.server.stdout:
+            response = json.loads(line)
+            pid = response["pid"]
+            if "id" in response:
+                with self._lock:
+                    self.processes[pid] = PooledProcess(pid)
+                    self._started_pids[response["id"]] = pid
+                    self._started.notify_all()
+            else:
+                with self._lock:
+                    p = self.processes.pop(pid)
+                p.returncode = os.waitstatus_to_exitcode(response["wait_status"])
+                self.on_exit(pid, p.returncode, resource.struct_rusage(response["rusage"]))
+
+        # the fork server exited, so its children can no longer be waited for
+        self.server.wait()
+        with self._lock:
+            self._started.notify_all()
+            processes, self.processes = self.processes, dict()
+        for pid in processes:
+            self.on_exit(pid, None, None)
+
+    def shutdown(self):
+        if self.server is not None and self.server.poll() is None:
+            # the fork server exits when its stdin is closed
+            self.server.stdin.close()
+
+
+def serve(args):
+    """
+    The main loop of the fork server.
+
+    :param str args: json of the modules to preload, the sys.path to find them with, and the seconds after
+      their time_req to kill Tasks that have not exited
+    """
+    args = json.loads(args)
+    sys_path = list(sys.path)
+    sys.path.extend(path for path in args["sys_path"] if path not in sys.path)
+    for module in args["preload"]:
+        try:
+            __import__(module)
+        except Exception as ex:
+            print(f"py_call fork server could not preload {module}: {ex}", file=sys.stderr)
+    sys.path[:] = sys_path
+
+    # ctrl+c is handled by Cosmos, which kills the Tasks
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sigchld_r, sigchld_w = os.pipe()
+    os.set_blocking(sigchld_r, False)
+    os.set_blocking(sigchld_w, False)
+    signal.set_wakeup_fd(sigchld_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    requests_fd, responses = sys.stdin.fileno(), sys.stdout
+    buffered = b""
+    # pid -> when to kill the process group of a Task that exceeded its time_req.  The Task handles SIGALRM
+    # itself, but a long call into a C extension, or its own SIGALRM handler, can keep that from happening
+    kill_deadlines = dict()
+    killed = set()
+    while True:
+        timeout = None
+        if kill_deadlines:
+            timeout = max(0, min(kill_deadlines.values()) - time.monotonic())
+        readable, _, _ = select.select([requests_fd, sigchld_r], [], [], timeout)
+
+        now = time.monotonic()
+        for pid, deadline in list(kill_deadlines.items()):
+            if deadline <= now:
+                del kill_deadlines[pid]
+                killed.add(pid)
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+        if sigchld_r in readable:
+            while True:
+                try:
+                    os.read(sigchld_r, 4096)
+                except BlockingIOError:
+                    break
+            while True:
+                try:
+                    pid, wait_status, rusage = os.wait4(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                kill_deadlines.pop(pid, None)
+                if pid in killed:
+                    killed.remove(pid)
+                    # report it as an exit status, the way the wait status of /usr/bin/timeout would be
+                    wait_status = KILLED_EXIT_STATUS << 8
+                response = dict(pid=pid, wait_status=wait_status, rusage=list(rusage))
+                responses.write(json.dumps(response) + "\n")
+            responses.flush()
+
+        if requests_fd in readable:
+            data = os.read(requests_fd, 65536)
+            if not data:
+                # Cosmos closed the pipe, or exited
+                return
+            *lines, buffered = (buffered + data).split(b"\n")
+            for line in lines:
+                request = json.loads(line)
+                request_id = request.pop("id")
+                pid = os.fork()
+                if pid == 0:
+                    # the child must never return to this loop, or it would become a second fork server
+                    exit_status = 1
+                    try:
+                        signal.set_wakeup_fd(-1)
+                        os.close(sigchld_r)
+                        os.close(sigchld_w)
+                        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                        signal.signal(signal.SIGINT, signal.default_int_handler)
+                        exit_status = run_script(**request)
+                    except BaseException:
+                        traceback.print_exc()
+                    finally:
+                        _flush()
+                        os._exit(exit_status)
+                if request["time_req"] is not None:
+                    kill_deadlines[pid] = time.monotonic() + request["time_req"] + args["kill_after"]
+                responses.write(json.dumps(dict(id=request_id, pid=pid)) + "\n")
+                responses.flush()
+
+
+def run_script(script_path, stdout_path, stderr_path, env, cwd, time_req):
+    """
+    Run `script_path` as __main__ in the current (freshly forked) process.  The caller must exit with the
+    returned status, which is the one `python script_path` would have had.  Failing to set up the job, ex:
+    because its log directory is missing, is an exit status of 1.
+
+    :returns: (int) the exit status
+    """
+    try:
+        exit_process_group()
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(env)
+        null_fd = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(null_fd, 0)
+        os.close(null_fd)
+        for fd, path in [(1, stdout_path), (2, stderr_path)]:
+            out_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.dup2(out_fd, fd)
+            os.close(out_fd)
+        if time_req is not None:
+            signal.signal(signal.SIGALRM, _time_limit_exceeded)
+            signal.alarm(int(time_req))
+
+        sys.argv = [script_path]
+        sys.path[0] = os.path.dirname(os.path.abspath(script_path))
+        runpy.run_path(script_path, run_name="__main__")
+        exit_status = 0
+    except SystemExit as ex:
+        if ex.code is None or isinstance(ex.code, int):
+            exit_status = ex.code or 0
+        else:
+            print(ex.code, file=sys.stderr)
+            exit_status = 1
+    except KeyboardInterrupt:
+        # die from SIGINT like the interpreter does
+        _flush()
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        os.kill(os.getpid(), signal.SIGINT)
+        exit_status = 1
+    except BaseException:
+        traceback.print_exc()
+        exit_status = 1
+
+    _flush()
+    return exit_status
+
+
+def _time_limit_exceeded(signum, frame):
+    print("time_req exceeded, exiting", file=sys.stderr)
+    _flush()
+    # like /usr/bin/timeout, also terminate anything the Task started
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    os.killpg(0, signal.SIGTERM)
+    os._exit(TIME_LIMIT_EXIT_STATUS)
+
+
+def _flush():
+    for fh in (sys.stdout, sys.stderr):
+        try:
+            fh.flush()
+        except (OSError, ValueError):
+            pass
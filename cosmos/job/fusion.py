@@ -0,0 +1,132 @@
+"""
+Fuses linear chains of Tasks into one DRM job, to avoid paying submission and polling latency for every link.
+
+Each Task in a chain keeps its own command script, stdout, stderr, exit status and attempt.  The first Task of
+a chain is submitted with a script that runs the command scripts in order, recording each exit status and wall
+time in the Task's `output_exit_status_path`, and stopping at the first failure.
+
+Every command script of a chain is written, by calling each Task's cmd_fxn, when the first Task is submitted.
+A cmd_fxn that reads its parents' output files or state would see them before its parents have run, so chains
+must only be fused when no cmd_fxn does that.
+"""
+import os
+import shlex
+
+from cosmos.util.helpers import write_script
+
+#: Tasks must match on all of these to be fused into the same job
+FUSION_ATTRS = (
+    "drm",
+    "queue",
+    "job_class",
+    "core_req",
+    "gpu_req",
+    "mem_req",
+    "resource_reqs",
+    "environment_variables",
+    "drm_options",
+)
+
+
+def can_fuse(parent, child, fusible_stages=()):
+    """
+    :param list fusible_stages: names of Stages whose Tasks may also be fused with the Tasks of other
+      fusible Stages.  Otherwise only Tasks of the same Stage are fused
+    :returns: True if `child` can run in the same job as `parent`, right after it
+
+    `child`'s cmd_fxn is called before `parent` has run, so the result is only correct if that cmd_fxn does
+    not read `parent`'s output files or state.  That can't be checked here, and is up to whoever enables
+    fusion.
+    """
+    # Avoid cyclical import dependencies
+    from cosmos.job.drm.DRM_Base import DRM
+
+    if parent.stage != child.stage and not (
+        parent.stage.name in fusible_stages and child.stage.name in fusible_stages
+    ):
+        return False
+    if parent.time_req is not None or child.time_req is not None:
+        # the job would need the sum of the time_reqs, and a time limit for each Task
+        return False
+    if not DRM.get_drm(parent.drm.split(":")[0]).supports_job_fusion:
+        return False
+    return all(getattr(parent, attr) == getattr(child, attr) for attr in FUSION_ATTRS)
+
+
+def find_linear_chains(task_graph, can_fuse=can_fuse):
+    """
+    Find the maximal chains of Tasks where each link is a Task's only child, and that child's only parent.
+
+    >>> import networkx as nx
+    >>> g = nx.DiGraph([(1, 2), (2, 3), (3, 4), (3, 5), (5, 6), (6, 7), (8, 7)])
+    >>> find_linear_chains(g, lambda parent, child: True)
+    {1: [2, 3], 5: [6]}
+    >>> find_linear_chains(g, lambda parent, child: child != 2)
+    {2: [3], 5: [6]}
+
+    :param callable can_fuse: called with (parent, child), returns True if they may be fused
+    :returns: (dict) the first Task of each chain -> the Tasks that are fused after it, in order
+    """
+
+    def is_fusible_link(parent, child):
+        if task_graph.out_degree(parent) != 1 or task_graph.in_degree(child) != 1:
+            return False
+        return can_fuse(parent, child)
+
+    chains = dict()
+    for task in task_graph:
+        parents = list(task_graph.predecessors(task))
+        if len(parents) == 1 and is_fusible_link(parents[0], task):
+            # fused after its parent
+            continue
+
+        chain = []
+        tail = task
+        while task_graph.out_degree(tail) == 1:
+            child = next(iter(task_graph.successors(tail)))
+            if not is_fusible_link(tail, child):
+                break
+            chain.append(child)
+            tail = child
+        if chain:
+            chains[task] = chain
+    return chains
+
+
+def write_fused_script(task):
+    """Write the script that runs `task` and then `task.fused_tasks`, to `task.output_fused_script_path`"""
+    lines = [
+        "#!/bin/bash",
+        "# %s Tasks fused into one job, see cosmos.job.fusion" % (len(task.fused_tasks) + 1),
+    ]
+    for t in [task] + task.fused_tasks:
+        run_cmd = shlex.quote(os.path.abspath(t.output_command_script_path))
+        if t is not task:
+            # the job's stdout and stderr are already the first Task's
+            run_cmd += " > %s 2> %s" % (
+                shlex.quote(os.path.abspath(t.output_stdout_path)),
+                shlex.quote(os.path.abspath(t.output_stderr_path)),
+            )
+        exit_status_path = shlex.quote(os.path.abspath(t.output_exit_status_path))
+        lines += [
+            "",
+            "start=$SECONDS",
+            run_cmd,
+            "exit_status=$?",
+            'echo "$exit_status $((SECONDS - start))" > %s' % exit_status_path,
+            '[ "$exit_status" -eq 0 ] || exit "$exit_status"',
+        ]
+
+    write_script(task.output_fused_script_path, "\n".join(lines) + "\n")
+
+
+def read_exit_status(task):
+    """
+    :returns: (exit_status, wall_time) recorded by the fused job for `task`, or None if it did not finish
+    """
+    try:
+        with open(task.output_exit_status_path) as fh:
+            exit_status, wall_time = fh.read().split()
+    except (IOError, ValueError):
+        return None
+    return int(exit_status), int(wall_time)
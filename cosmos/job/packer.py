@@ -0,0 +1,178 @@
+"""
+Packs ready Tasks into the resources left over by running Tasks.
+"""
+
+import heapq
+import itertools as it
+
+from cosmos import TaskStatus
+
+#: resources with a dedicated Task column, and the name of that column.  Other resources are looked up in
+#: Task.resource_reqs
+TASK_RESOURCE_ATTRS = {"gpus": "gpu_req", "cores": "core_req", "mem": "mem_req"}
+
+
+def get_resource_req(task, resource):
+    """
+    :param str resource: ex "cores", "gpus", "mem", or any custom resource passed to Workflow.add_task
+    :returns: the amount of `resource` required by `task`
+    """
+    attr = TASK_RESOURCE_ATTRS.get(resource)
+    if attr is not None:
+        return getattr(task, attr) or 0
+    return task.resource_reqs.get(resource, 0)
+
+
+def creation_order(task):
+    """In the order the Tasks were created"""
+    return task.id
+
+
+def default_pack_order(task):
+    """Smallest Tasks first, then in the order they were created"""
+    return task.gpu_req, task.core_req, task.id
+
+
+class TaskPacker(object):
+    """
+    A set of ready Tasks, bucketed by their requirements for each constrained resource.
+
+    Each bucket is a heap ordered by `key`, so filling the remaining capacity only looks at the head of each
+    bucket, and a bucket that does not fit is skipped for the rest of the pass.  The result is the same as
+    repeatedly submitting the first Task (ordered by `key`) that fits, but costs
+    O(buckets + submitted * log(buckets)) instead of re-sorting every ready Task for each submission.
+
+    >>> class T(object):
+    ...     status = TaskStatus.no_attempt
+    ...     resource_reqs = {}
+    ...     def __init__(self, id, core_req, gpu_req=0, mem_req=None):
+    ...         self.id, self.core_req, self.gpu_req, self.mem_req = id, core_req, gpu_req, mem_req
+    ...     def __repr__(self):
+    ...         return 'T%s' % self.id
+    >>> packer = TaskPacker(resources=["gpus", "cores", "mem"])
+    >>> for t in [T(1, 4), T(2, 1), T(3, 2), T(4, 1, gpu_req=1), T(5, 1, mem_req=2048)]:
+    ...     packer.add(t)
+    >>> packer.pop_submittable(dict(cores=4, gpus=0, mem=1024))
+    [T2, T3]
+    >>> packer.efficiency
+    {'gpus': None, 'cores': 0.75, 'mem': 0.0}
+    >>> sorted(packer, key=lambda t: t.id)
+    [T1, T4, T5]
+
+    With no constrained resources, every Task fits and they are returned in the order they were created.
+
+    >>> packer = TaskPacker(resources=[])
+    >>> packer.update([T(3, 1), T(1, 4), T(2, 2)])
+    >>> packer.pop_submittable()
+    [T1, T2, T3]
+    """
+
+    def __init__(self, key=None, resources=("gpus", "cores")):
+        """
+        :param callable key: sort key for Tasks, the smallest are packed first.  Must be unique for each Task.
+            Defaults to :func:`default_pack_order`, or :func:`creation_order` if no resource is constrained.
+        :param list resources: the names of the resources that may be constrained when packing
+        """
+        self.resources = tuple(resources)
+        self.key = key or (default_pack_order if self.resources else creation_order)
+        self.buckets = dict()
+        self.efficiency = None
+        self._tasks = set()
+        self._counter = it.count()
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __iter__(self):
+        return iter(self._tasks)
+
+    def __contains__(self, task):
+        return task in self._tasks
+
+    def requirements(self, task):
+        return tuple(get_resource_req(task, resource) for resource in self.resources)
+
+    def add(self, task):
+        if task in self._tasks:
+            return
+        self._tasks.add(task)
+        bucket = self.buckets.setdefault(self.requirements(task), [])
+        heapq.heappush(bucket, (self.key(task), next(self._counter), task))
+
+    def discard(self, task):
+        # the bucket entry is removed lazily, the next time it reaches the head of its bucket
+        self._tasks.discard(task)
+
+    def update(self, tasks):
+        for task in tasks:
+            self.add(task)
+
+    def difference_update(self, tasks):
+        for task in tasks:
+            self.discard(task)
+
+    def _head(self, bucket):
+        """:returns: the first live entry of bucket, dropping stale entries along the way"""
+        while bucket and bucket[0][2] not in self._tasks:
+            heapq.heappop(bucket)
+        return bucket[0] if bucket else None
+
+    def pop_submittable(self, resources_left=None):
+        """
+        Remove and return the Tasks to submit given the remaining resources, in `key` order.  Only Tasks with
+        a status of no_attempt are returned.
+
+        Sets :attr:`efficiency` to a dict of the fraction of each available resource used by the returned
+        Tasks (None for unconstrained resources).
+
+        :param dict resources_left: resource name -> the amount available.  Missing resources are unconstrained
+        """
+        resources_left = resources_left or dict()
+        available = [resources_left.get(resource, float("inf")) for resource in self.resources]
+        left = list(available)
+
+        heads = []
+        for bucket_key, bucket in list(self.buckets.items()):
+            head = self._head(bucket)
+            if head is None:
+                del self.buckets[bucket_key]
+            else:
+                heads.append((head[0], head[1], bucket_key))
+        heapq.heapify(heads)
+
+        submittable, skipped = [], []
+        while heads:
+            _, _, bucket_key = heapq.heappop(heads)
+            if any(req > amount_left for req, amount_left in zip(bucket_key, left)):
+                # resources only go down during a pass, so nothing else in this bucket will fit
+                continue
+
+            bucket = self.buckets[bucket_key]
+            entry = heapq.heappop(bucket)
+            task = entry[2]
+            if task.status == TaskStatus.no_attempt:
+                self._tasks.remove(task)
+                left = [amount_left - req for req, amount_left in zip(bucket_key, left)]
+                submittable.append(task)
+            else:
+                skipped.append((bucket_key, entry))
+
+            head = self._head(bucket)
+            if head is not None:
+                heapq.heappush(heads, (head[0], head[1], bucket_key))
+
+        for bucket_key, entry in skipped:
+            heapq.heappush(self.buckets[bucket_key], entry)
+
+        self.efficiency = {
+            resource: _fraction_used(amount_available, amount_left)
+            for resource, amount_available, amount_left in zip(self.resources, available, left)
+        }
+
+        return submittable
+
+
+def _fraction_used(available, left):
+    if available in (0, float("inf")):
+        return None
+    return round(float(available - left) / available, 4)
@@ -3,14 +3,18 @@ import sys
 
 # from concurrent import futures
 from datetime import datetime
-from typing import Optional, Dict
-
-from flask import Flask
+from typing import Optional, Dict, Union
 
 
 from cosmos import WorkflowStatus
 from cosmos import __version__
-from cosmos.db import Base
+from cosmos.db import (
+    Base,
+    SQLITE_POOL_MAX_OVERFLOW,
+    SQLITE_POOL_SIZE,
+    create_missing_indexes,
+    set_sqlite_profile,
+)
 from cosmos.models import Task
 from cosmos.util.args import get_last_cmd_executed
 from cosmos.util.helpers import confirm
@@ -69,6 +73,7 @@ class Cosmos(object):
         flask_app=None,
         default_job_class: Optional[str] = None,
         default_environment_variables: Optional[Dict] = None,
+        sqlite_profile: Union[str, Dict] = "default",
     ):
         """
         :param database_url: A `sqlalchemy database url <http://docs.sqlalchemy.org/en/latest/core/engines.html>`_.  ex: sqlite:///home/user/sqlite.db or
@@ -81,12 +86,16 @@ class Cosmos(object):
         :param default_queue: Default value for every Task.queue
         :param default_time_req: Default value for every Task.time_req
         :param default_environment_variables: Default value for every Task.environment_variables
+        :param sqlite_profile: PRAGMAs to set on each connection to a SQLite database_url, either the name of
+            one of cosmos.db.SQLITE_PROFILES or a dict like {"busy_timeout": 30000}.  "wal" lets
+            `cosmos runweb` read while the workflow writes, and makes commits much faster, but the database
+            must not be on a network filesystem.
         """
         default_drm_options = {} if default_drm_options is None else default_drm_options
         # Avoid cyclical import dependencies
         from cosmos.job.drm.DRM_Base import DRM
 
-        assert default_drm.split(":")[0] in DRM.get_drm_names(), (
+        assert DRM.has_drm(default_drm.split(":")[0]), (
             "unsupported drm: %s" % default_drm.split(":")[0]
         )
 
@@ -95,38 +104,32 @@ class Cosmos(object):
         assert "://" in database_url, "Invalid database_url: %s" % database_url
 
         # self.futures_executor = futures.ThreadPoolExecutor(10)
-        if flask_app:
-            self.flask_app = flask_app
-        else:
-            try:
-                self.flask_app = Flask(__name__)
-                self.flask_app.secret_key = os.urandom(24)
-
-                @self.flask_app.teardown_appcontext
-                def shutdown_session(exception=None):
-                    self.session.remove()
-
-                # self.flask_app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-                # self.flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-                self.flask_app.jinja_env.globals["time_now"] = datetime.now()
-                # self.flask_app.config['SQLALCHEMY_ECHO'] = True
-
-                # from flask_sqlalchemy import SQLAlchemy
-                #
-                #
-                # self.sqla = SQLAlchemy(self.flask_app)
-                # self.session = self.sqla.session
-
-            except NotImplementedError:
-                self.flask_app = None
+        # created the first time it is used, see flask_app
+        self._flask_app = flask_app
 
         self.get_submit_args = get_submit_args
 
         from sqlalchemy import create_engine
         from sqlalchemy.orm import sessionmaker, scoped_session
+        from sqlalchemy.engine.url import make_url
+        from sqlalchemy.pool import QueuePool
         from sqlalchemy.ext.declarative import declarative_base
 
-        engine = create_engine(database_url, convert_unicode=True)
+        engine_kwargs = dict(convert_unicode=True)
+        url = make_url(database_url)
+        is_sqlite_file = url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+        if is_sqlite_file and sqlite_profile != "default":
+            # keep connections open between transactions, rather than opening one per transaction, so that the
+            # PRAGMAs are only run once, and a WAL isn't checkpointed every time a connection closes.  A
+            # pooled connection is used by whichever thread checks it out next
+            engine_kwargs.update(
+                poolclass=QueuePool,
+                pool_size=SQLITE_POOL_SIZE,
+                max_overflow=SQLITE_POOL_MAX_OVERFLOW,
+                connect_args=dict(check_same_thread=False),
+            )
+        engine = create_engine(database_url, **engine_kwargs)
+        set_sqlite_profile(engine, sqlite_profile)
         self.session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 
         Base = declarative_base()
@@ -150,6 +153,39 @@ class Cosmos(object):
     # def session(self):
     #     return self.Session()
 
+    @property
+    def flask_app(self):
+        """
+        The Flask application of the web interface.  Unless one was passed in, it is created the first time
+        it is used, so that Cosmos doesn't import Flask until then.
+        """
+        if self._flask_app is None:
+            from flask import Flask
+
+            try:
+                flask_app = Flask(__name__)
+                flask_app.secret_key = os.urandom(24)
+
+                @flask_app.teardown_appcontext
+                def shutdown_session(exception=None):
+                    self.session.remove()
+
+                # flask_app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+                # flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+                flask_app.jinja_env.globals["time_now"] = datetime.now()
+                # flask_app.config['SQLALCHEMY_ECHO'] = True
+
+                # from flask_sqlalchemy import SQLAlchemy
+                #
+                #
+                # self.sqla = SQLAlchemy(flask_app)
+                # self.session = self.sqla.session
+
+            except NotImplementedError:
+                return None
+            self._flask_app = flask_app
+        return self._flask_app
+
     def close(self):
         self.session.close()
 
@@ -176,6 +212,10 @@ class Cosmos(object):
         :rtype Workflow:
         :returns: An Workflow instance.
         """
+        from sqlalchemy import false
+
+        from .Stage import Stage
+        from .Task import Task
         from .Workflow import Workflow
 
         assert os.path.exists(os.getcwd()), (
@@ -233,7 +273,13 @@ class Cosmos(object):
 
             wf.log.info("Resuming %s" % wf)
             session.add(wf)
-            failed_tasks = [t for s in wf.stages for t in s.tasks if not t.successful]
+            # query by the (stage_id, successful) index rather than loading every Task
+            wf_tasks = session.query(Task).join(Stage).filter(Stage.workflow_id == wf.id)
+            # Stages whose Tasks all failed are kept, so that their Tasks are re-run in them
+            stage_ids_with_tasks = {
+                stage_id for stage_id, in wf_tasks.with_entities(Task.stage_id).distinct()
+            }
+            failed_tasks = wf_tasks.filter(Task.successful == false()).all()
             n = len(failed_tasks)
             if n:
                 wf.log.info(
@@ -242,7 +288,7 @@ class Cosmos(object):
                 for t in failed_tasks:
                     session.delete(t)
 
-            for stage in [s for s in wf.stages if len(s.tasks) == 0]:
+            for stage in [s for s in wf.stages if s.id not in stage_ids_with_tasks]:
                 wf.log.info("Deleting stage %s, since it has 0 successful Tasks" % stage)
                 session.delete(stage)
 
@@ -272,10 +318,12 @@ class Cosmos(object):
 
     def initdb(self):
         """
-        Initialize the database via sql CREATE statements.  If the tables already exists, nothing will happen.
+        Initialize the database via sql CREATE statements.  If the tables already exist, only the indexes that
+        were added since they were created are.
         """
         # print >> sys.stderr, 'Initializing sql database for Cosmos v{}..'.format(__version__)
         Base.metadata.create_all(bind=self.session.bind)
+        create_missing_indexes(self.session.bind)
         from ..db import MetaData
 
         meta = MetaData(initdb_library_version=__version__)
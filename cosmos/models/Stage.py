@@ -6,13 +6,10 @@ from sqlalchemy.types import Boolean, Integer, String, DateTime
 from sqlalchemy.orm import relationship, synonym
 from sqlalchemy.ext.declarative import declared_attr
 
-from flask import url_for
-
-
 from cosmos.db import Base
-from cosmos.util.sqla import Enum_ColumnType
+from cosmos.models.Task import Task
+from cosmos.util.sqla import CollectionCounter, CollectionIndex, Enum_ColumnType
 from cosmos import StageStatus, signal_stage_status_change, TaskStatus
-import networkx as nx
 import datetime
 
 
@@ -21,7 +18,7 @@ def stage_status_changed(stage):
     if stage.status not in [StageStatus.no_attempt]:
         stage.log.info(
             "%s %s (%s/%s Tasks were successful)"
-            % (stage, stage.status, sum(t.successful for t in stage.tasks), len(stage.tasks),)
+            % (stage, stage.status, stage.num_successful_tasks(), stage.count_tasks(),)
         )
 
     if stage.status == StageStatus.successful:
@@ -110,20 +107,23 @@ class Stage(Base):
 
         return self.session.query(Task)
 
-    #
-    # def num_tasks(self):
-    #     return self.tasksq.count()
+    def count_tasks(self, **where):
+        """
+        :param where: filters on Task.status, successful or must_succeed, ex: status=TaskStatus.failed
+        :return: (int) the number of Tasks that match, without scanning them
+        """
+        return task_counter.count(self, **where)
 
     def num_successful_tasks(self):
-        # return self.tasksq.filter_by(stage=self, successful=True).count()
-        return len([t for t in self.tasks if t.successful])
+        return self.count_tasks(successful=True)
 
     def num_failed_tasks(self):
-        # return self.tasksq.filter_by(stage=self, status=TaskStatus.failed).count()
-        return len([t for t in self.tasks if t.status == TaskStatus.failed])
+        return self.count_tasks(status=TaskStatus.failed)
 
     @property
     def url(self):
+        from flask import url_for
+
         return url_for("cosmos.stage", workflow_name=self.workflow.name, stage_name=self.name)
 
     @property
@@ -154,22 +154,9 @@ class Stage(Base):
         return (t for t in self.tasks if all(t.params.get(k, None) == v for k, v in list(filter_by.items())))
 
     def get_task(self, uid, default="ERROR@#$"):
-        # this is the part of the code that makes adding new tasks very slow
-        # the commented code is even slower
-
-        # from cosmos.models.Task import Task
-        #
-        # try:
-        #     return self.session.query(Task).filter_by(uid=uid).one()
-        # except NoResultFound:
-        #     if default == "ERROR@#$":
-        #         raise KeyError("Task with uid %s does not exist" % uid)
-        #     else:
-        #         return default
-
-        for task in self.tasks:
-            if task.uid == uid:
-                return task
+        task = task_uid_index.get(self).get(uid)
+        if task is not None:
+            return task
 
         if default == "ERROR@#$":
             raise KeyError("Task with uid %s does not exist" % uid)
@@ -184,7 +171,7 @@ class Stage(Base):
 
     def percent_running(self):
         return round(
-            float(len([t for t in self.tasks if t.status == TaskStatus.submitted]))
+            float(self.count_tasks(status=TaskStatus.submitted))
             / (float(len(self.tasks)) or 1)
             * 100,
             2,
@@ -194,7 +181,9 @@ class Stage(Base):
         """
         :return: (list) all stages that descend from this stage in the stage_graph
         """
-        x = nx.descendants(self.workflow.stage_graph(), self)
+        import networkx as nx
+
+        x = nx.descendants(self.workflow.cached_stage_graph(), self)
         if include_self:
             return sorted({self}.union(x), key=lambda stage: stage.number)
         else:
@@ -206,3 +195,10 @@ class Stage(Base):
 
     def __repr__(self):
         return "<Stage[%s] %s>" % (self.id or "", self.name)
+
+
+#: Stage.tasks by uid, so that looking up a Task while adding one does not scan the whole Stage
+task_uid_index = CollectionIndex(Stage.tasks, Task.uid, "stage")
+
+#: Stage.tasks counted by status, so that progress and completion checks do not scan the whole Stage
+task_counter = CollectionCounter(Stage.tasks, (Task._status, Task.successful, Task.must_succeed), "stage")
@@ -5,14 +5,10 @@ import pprint
 import re
 import subprocess as sp
 
-import networkx as nx
-
-from flask import url_for
-
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.declarative.base import _declarative_constructor
 from sqlalchemy.orm import reconstructor, relationship, synonym
-from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint
+from sqlalchemy.schema import Column, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.types import Boolean, DateTime, Integer, String
 
 from cosmos import StageStatus, TaskStatus, signal_task_status_change
@@ -139,12 +135,12 @@ def task_status_changed(task):
                     task.status,
                     task.drm_jobID,
                     datetime.timedelta(seconds=task.wall_time),
-                    sum(1 for t in task.workflow.tasks if t.finished),
-                    len(task.workflow.tasks),
+                    task.workflow.count_tasks(status=completed_task_statuses),
+                    task.workflow.count_tasks(),
                 )
             )
         task.finished_on = datetime.datetime.now()
-        if all(t.successful or not t.must_succeed for t in task.stage.tasks):
+        if task.stage.count_tasks(successful=False, must_succeed=True) == 0:
             task.stage.status = StageStatus.successful
 
 
@@ -206,7 +202,12 @@ class Task(Base):
     A job that gets executed.  Has a unique set of params within its Stage.
     """
     # FIXME causes a problem with mysql?
-    __table_args__ = (UniqueConstraint("stage_id", "uid", name="_uc1"),)
+    __table_args__ = (
+        UniqueConstraint("stage_id", "uid", name="_uc1"),
+        # Tasks of a Stage by status, ex: for resuming a Workflow or for the web dashboard
+        Index("ix_task_stage_id_status", "stage_id", "_status"),
+        Index("ix_task_stage_id_successful", "stage_id", "successful"),
+    )
     drm_options = {}
 
     mount_points = []
@@ -377,6 +378,14 @@ class Task(Base):
     output_command_script_path = logplus("command.bash")
     output_stderr_path = logplus("stderr.txt")
     output_stdout_path = logplus("stdout.txt")
+    output_exit_status_path = logplus("exit_status.txt")
+    output_fused_script_path = logplus("fused_command.bash")
+    output_array_job_script_path = logplus("array_job.bash")
+
+    @property
+    def output_job_script_path(self):
+        """The script submitted to the DRM, which also runs this Task's fused_tasks if there are any"""
+        return self.output_fused_script_path if self.fused_tasks else self.output_command_script_path
 
     @property
     def stdout_text(self):
@@ -419,14 +428,18 @@ class Task(Base):
         """
         :return: (list) all stages that descend from this stage in the stage_graph
         """
-        x = nx.descendants(self.workflow.task_graph(), self)
+        import networkx as nx
+
+        x = nx.descendants(self.workflow.cached_task_graph(), self)
         if include_self:
             return sorted({self}.union(x), key=lambda task: task.stage.number)
         else:
             return x
 
     def ancestors(self, include_self=False):
-        x = nx.ancestors(self.workflow.task_graph(), self)
+        import networkx as nx
+
+        x = nx.ancestors(self.workflow.cached_task_graph(), self)
         if include_self:
             return sorted({self}.union(x), key=lambda task: task.stage.number)
         else:
@@ -462,6 +475,8 @@ class Task(Base):
 
     @property
     def url(self):
+        from flask import url_for
+
         return url_for(
             "cosmos.task", ex_name=self.workflow.name, stage_name=self.stage.name, task_id=self.id,
         )
@@ -489,11 +504,16 @@ class Task(Base):
     # FIXME consider making job_class a proper field next time the schema changes
     def __init__(self, **kwargs):
         self.job_class = kwargs.pop("job_class", None)
+        self.resource_reqs = kwargs.pop("resource_reqs", None) or {}
+        # Tasks that run in the same job as this one, right after it.  See cosmos.job.fusion
+        self.fused_tasks = []
         _declarative_constructor(self, **kwargs)
 
     @reconstructor
     def init_on_load(self):
         self.job_class = None
+        self.resource_reqs = {}
+        self.fused_tasks = []
 
     @property
     def environment_variables_pretty(self):
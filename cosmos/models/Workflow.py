@@ -11,18 +11,15 @@ import signal
 import sys
 import time
 import warnings
+import weakref
+from collections import defaultdict
 
 import funcsigs
-import networkx as nx
-
-from flask import url_for
-
-
-from networkx.algorithms.dag import descendants, topological_sort
-from sqlalchemy import orm
+from sqlalchemy import event, orm
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import validates, synonym, relationship
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.schema import Column
 from sqlalchemy.types import Boolean, Integer, String, DateTime, VARCHAR
 
@@ -33,16 +30,20 @@ from cosmos import (
     signal_workflow_status_change,
 )
 from cosmos.core.cmd_fxn import signature
-from cosmos.db import Base
-from cosmos.models.Task import Task
+from cosmos.db import Base, GroupCommit
+from cosmos.graph.dag import CompactDAG, topological_sort_cycles
+from cosmos.job.fusion import can_fuse, find_linear_chains
+from cosmos.job.packer import TaskPacker, get_resource_req
+from cosmos.models.Stage import Stage, task_counter, task_uid_index
+from cosmos.models.Task import Task, TaskEdge
 from cosmos.util.helpers import duplicates, get_logger, mkdir
-from cosmos.util.iterstuff import only_one
-from cosmos.util.sqla import Enum_ColumnType, MutableDict, JSONEncodedDict
+from cosmos.util.sqla import BulkUpdater, CollectionIndex, Enum_ColumnType, MutableDict, JSONEncodedDict
 from cosmos.constants import TERMINATION_SIGNALS
 
 opj = os.path.join
 
 WORKFLOW_LOG_AWKWARD_SILENCE_INTERVAL = 300
+TASK_PRIORITIES = (None, "critical_path")
 
 
 class DuplicateUid(Exception):
@@ -76,8 +77,8 @@ def _workflow_status_changed(workflow):
             % (
                 workflow,
                 workflow.status,
-                sum(t.successful for t in workflow.tasks),
-                len(workflow.tasks),
+                workflow.count_tasks(successful=True),
+                workflow.count_tasks(),
                 workflow.wall_time,
             )
         )
@@ -118,6 +119,17 @@ class Workflow(Base):
     exclude_from_dict = ["info"]
     _dont_garbage_collect = None
     termination_signal = None
+    max_mem = None
+    max_resources = None
+
+    @property
+    def resource_limits(self):
+        """
+        :returns: (dict) resource name -> the maximum amount to use at once, for each constrained resource
+        """
+        limits = dict(gpus=self.max_gpus, cores=self.max_cores, mem=self.max_mem)
+        limits.update(self.max_resources or {})
+        return {resource: limit for resource, limit in limits.items() if limit is not None}
 
     @property
     def wall_time(self):
@@ -214,6 +226,7 @@ class Workflow(Base):
         if_duplicate="raise",
         mount_points=None,
         volumes=None,
+        resource_reqs=None,
     ):
         """
         Adds a new Task to the Workflow.  If the Task already exists (and was successful), return the successful Task stored in the database
@@ -243,30 +256,11 @@ class Workflow(Base):
         :param dict environment_variables: Environment variables to pass to the DRM (if supported).
         :param str if_duplicate: If "raise", raises an error if a Task with the same UID has already been added to this
           Workflow.  If "return", return that Task, allowing for an easy way to avoid duplicate work.
+        :param dict resource_reqs: Amounts of custom resources required by this Task, ex: {"scratch_gb": 10}.  These
+          are enforced by the `max_resources` parameter of :meth:`Workflow.run`.
         :rtype: cosmos.api.Task
         """
-        # Avoid cyclical import dependencies
-        from cosmos.job.drm.DRM_Base import DRM
-        from cosmos.models.Stage import Stage
-        from cosmos import recursive_resolve_dependency
-
-        # parents
-        if parents is None:
-            parents = []
-        elif isinstance(parents, Task):
-            parents = [parents]
-        else:
-            parents = list(parents)
-
-        # params
-        if params is None:
-            params = dict()
-        for k, v in list(params.items()):
-            # decompose `Dependency` objects to values and parents
-            new_val, parent_tasks = recursive_resolve_dependency(v)
-
-            params[k] = new_val
-            parents.extend(parent_tasks - set(parents))
+        parents, params = _resolve_parents_and_params(parents, params)
 
         # uid
         if uid is None:
@@ -279,112 +273,300 @@ class Workflow(Base):
         if stage_name is None:
             stage_name = str(func.__name__)
 
-        # Get the right Stage
-        stage = only_one((s for s in self.stages if s.name == stage_name), None)
-        if stage is None:
-            stage = Stage(workflow=self, name=stage_name, status=StageStatus.no_attempt)
-            self.session.add(stage)
+        stage = self._get_or_create_stage(stage_name)
 
         # Check if task is already in stage
         task = stage.get_task(uid, None)
 
         if task is not None:
-            # if task is already in stage, but unsuccessful, raise an error (duplicate params) since unsuccessful tasks
-            # were already removed on workflow load
+            task = self._get_existing_task(task, stage_name, params, if_duplicate)
             if task.successful:
-                # If the user manually edited the dag and this a resume, parents might need to be-readded
-                task.parents.extend(set(parents).difference(set(task.parents)))
+                self._readd_parents(task, parents)
+            return task
 
-                for p in parents:
-                    if p.stage not in stage.parents:
-                        stage.parents.append(p.stage)
+        task = self._new_task(
+            func,
+            params,
+            uid,
+            drm=drm,
+            queue=queue,
+            must_succeed=must_succeed,
+            time_req=time_req,
+            core_req=core_req,
+            mem_req=mem_req,
+            gpu_req=gpu_req,
+            max_attempts=max_attempts,
+            noop=noop,
+            job_class=job_class,
+            drm_options=drm_options,
+            environment_variables=environment_variables,
+            mount_points=mount_points,
+            volumes=volumes,
+            resource_reqs=resource_reqs,
+        )
+        task.stage = stage
+        task.parents = parents
 
-                return task
-            else:
-                if if_duplicate == "raise":
-                    raise DuplicateUid(
-                        "Duplicate uid, you have added a Task to Stage %s with the uid (unique identifier) `%s` twice.  "
-                        "Task uids must be unique within the same Stage." % (stage_name, uid)
-                    )
-                elif if_duplicate == "return":
-                    if task.params != params:
-                        raise InvalidParams(
-                            f"Tried to add a task with the same uid, but different parameters."
-                        )
-                    return task
-                else:
-                    raise ValueError(f"{if_duplicate} is not valid")
-        else:
-            # Create Task
-            sig = funcsigs.signature(func)
-
-            def params_or_signature_default_or(name, default):
-                if name in params:
-                    return params[name]
-                if name in sig.parameters:
-                    param_default = sig.parameters[name].default
-                    if param_default is funcsigs._empty:
-                        return default
-                    else:
-                        return param_default
-                return default
-
-            task = Task(
-                stage=stage,
-                params=params,
-                parents=parents,
-                uid=uid,
-                drm=drm if drm is not None else self.cosmos_app.default_drm,
-                job_class=job_class if job_class is not None else self.cosmos_app.default_job_class,
-                queue=queue if queue is not None else self.cosmos_app.default_queue,
-                must_succeed=must_succeed,
-                core_req=core_req if core_req is not None else params_or_signature_default_or("core_req", 1),
-                mem_req=mem_req if mem_req is not None else params_or_signature_default_or("mem_req", None),
-                time_req=time_req if time_req is not None else self.cosmos_app.default_time_req,
-                successful=False,
-                max_attempts=max_attempts
-                if max_attempts is not None
-                else self.cosmos_app.default_max_attempts,
-                attempt=1,
-                NOOP=noop,
-                gpu_req=gpu_req if gpu_req is not None else params_or_signature_default_or("gpu_req", 0),
-                environment_variables=environment_variables
-                if environment_variables is not None
-                else self.cosmos_app.default_environment_variables,
-            )
+        # Add Stage Dependencies
+        for p in parents:
+            if p.stage not in stage.parents:
+                stage.parents.append(p.stage)
 
-            task.cmd_fxn = func
+        self._dont_garbage_collect.append(task)
 
-            # for awsbatch add custom volumes to container
-            # leave empty list if not specified
-            if mount_points is None or volumes is None:
-                task.mount_points = []
-                task.volumes = []
-            else:
-                task.mount_points = mount_points
-                task.volumes = volumes
+        return task
 
-            if drm_options is None:
-                task.drm_options = {}
+    def add_tasks(self, tasks):
+        """
+        Adds many Tasks to the Workflow at once.  The result is the same as calling :meth:`add_task` for each
+        of `tasks` in order, but the new Tasks and their edges are written to the database with one bulk
+        INSERT each, rather than one INSERT per row the next time the session is flushed.
+
+        Example::
+
+            hello = dict(func=echo, params=dict(word="hello"), uid="1")
+            world = dict(func=echo, params=dict(word="world"), uid="2", parents=[hello])
+            hello_task, world_task = workflow.add_tasks([hello, world])
+
+        :param iterable[dict] tasks: keyword arguments to :meth:`add_task` for each Task.  `parents` may also
+          include earlier dicts of `tasks`, to refer to the Tasks added for them.
+        :returns: (list[cosmos.api.Task]) the Task added (or returned) for each of `tasks`
+        """
+        added = []
+        task_by_spec_id = dict()
+        new_tasks = []
+        new_tasks_by_key = dict()
+        readd_parents = []
+        signatures = dict()
+
+        for spec in tasks:
+            kwargs = dict(spec)
+            func = kwargs.pop("func")
+            if_duplicate = kwargs.pop("if_duplicate", "raise")
+            stage_name = kwargs.pop("stage_name", None) or str(func.__name__)
+            uid = kwargs.pop("uid", None)
+            assert isinstance(uid, str), "uid must be a string"
+
+            parents = kwargs.pop("parents", None)
+            if parents is not None and not isinstance(parents, Task):
+                parents = [task_by_spec_id[id(p)] if isinstance(p, dict) else p for p in parents]
+            parents, params = _resolve_parents_and_params(parents, kwargs.pop("params", None))
+
+            stage = self._get_or_create_stage(stage_name)
+            task = stage.get_task(uid, None) or new_tasks_by_key.get((stage, uid))
+            if task is not None:
+                task = self._get_existing_task(task, stage_name, params, if_duplicate)
+                if task.successful:
+                    # after the insert, in case any of the parents are new
+                    readd_parents.append((task, parents))
             else:
-                task.drm_options = drm_options
-            # use default for any keys not set
-            if self.cosmos_app.default_drm_options is not None:
-                for key, val in list(self.cosmos_app.default_drm_options.items()):
-                    if key not in task.drm_options:
-                        task.drm_options[key] = val
+                if func not in signatures:
+                    signatures[func] = funcsigs.signature(func)
+                task = self._new_task(func, params, uid, func_signature=signatures[func], **kwargs)
+                new_tasks.append((task, stage, parents))
+                new_tasks_by_key[stage, uid] = task
 
-            DRM.validate_drm_options(task.drm, task.drm_options)
+            task_by_spec_id[id(spec)] = task
+            added.append(task)
+
+        self._bulk_insert_tasks(new_tasks)
+        for task, parents in readd_parents:
+            self._readd_parents(task, parents)
+
+        return added
+
+    def _get_or_create_stage(self, stage_name):
+        stage = stage_name_index.get(self).get(stage_name)
+        if stage is None:
+            stage = Stage(workflow=self, name=stage_name, status=StageStatus.no_attempt)
+            self.session.add(stage)
+        return stage
+
+    def _get_existing_task(self, task, stage_name, params, if_duplicate):
+        """
+        :returns: the Task to return when adding a Task with the same Stage and uid as `task`
+        """
+        # if task is already in stage, but unsuccessful, raise an error (duplicate params) since unsuccessful
+        # tasks were already removed on workflow load
+        if task.successful:
+            return task
+        elif if_duplicate == "raise":
+            raise DuplicateUid(
+                "Duplicate uid, you have added a Task to Stage %s with the uid (unique identifier) `%s` "
+                "twice.  Task uids must be unique within the same Stage." % (stage_name, task.uid)
+            )
+        elif if_duplicate == "return":
+            if task.params != params:
+                raise InvalidParams(f"Tried to add a task with the same uid, but different parameters.")
+            return task
+        else:
+            raise ValueError(f"{if_duplicate} is not valid")
+
+    def _readd_parents(self, task, parents):
+        # If the user manually edited the dag and this a resume, parents might need to be-readded
+        task.parents.extend(set(parents).difference(set(task.parents)))
 
-        # Add Stage Dependencies
         for p in parents:
-            if p.stage not in stage.parents:
-                stage.parents.append(p.stage)
+            if p.stage not in task.stage.parents:
+                task.stage.parents.append(p.stage)
 
-        self._dont_garbage_collect.append(task)
+    def _new_task(
+        self,
+        func,
+        params,
+        uid,
+        drm=None,
+        queue=None,
+        must_succeed=True,
+        time_req=None,
+        core_req=None,
+        mem_req=None,
+        gpu_req=None,
+        max_attempts=None,
+        noop=False,
+        job_class=None,
+        drm_options=None,
+        environment_variables=None,
+        mount_points=None,
+        volumes=None,
+        resource_reqs=None,
+        func_signature=None,
+    ):
+        """
+        :returns: a new Task, which is not yet part of a Stage or the session
+        """
+        # Avoid cyclical import dependencies
+        from cosmos.job.drm.DRM_Base import DRM
 
+        sig = func_signature or funcsigs.signature(func)
+
+        def params_or_signature_default_or(name, default):
+            if name in params:
+                return params[name]
+            if name in sig.parameters:
+                param_default = sig.parameters[name].default
+                if param_default is funcsigs._empty:
+                    return default
+                else:
+                    return param_default
+            return default
+
+        task = Task(
+            params=params,
+            uid=uid,
+            drm=drm if drm is not None else self.cosmos_app.default_drm,
+            job_class=job_class if job_class is not None else self.cosmos_app.default_job_class,
+            queue=queue if queue is not None else self.cosmos_app.default_queue,
+            must_succeed=must_succeed,
+            core_req=core_req if core_req is not None else params_or_signature_default_or("core_req", 1),
+            mem_req=mem_req if mem_req is not None else params_or_signature_default_or("mem_req", None),
+            time_req=time_req if time_req is not None else self.cosmos_app.default_time_req,
+            successful=False,
+            max_attempts=max_attempts if max_attempts is not None else self.cosmos_app.default_max_attempts,
+            attempt=1,
+            NOOP=noop,
+            gpu_req=gpu_req if gpu_req is not None else params_or_signature_default_or("gpu_req", 0),
+            environment_variables=environment_variables
+            if environment_variables is not None
+            else self.cosmos_app.default_environment_variables,
+            resource_reqs=resource_reqs,
+        )
+
+        task.cmd_fxn = func
+
+        # for awsbatch add custom volumes to container
+        # leave empty list if not specified
+        if mount_points is None or volumes is None:
+            task.mount_points = []
+            task.volumes = []
+        else:
+            task.mount_points = mount_points
+            task.volumes = volumes
+
+        if drm_options is None:
+            task.drm_options = {}
+        else:
+            task.drm_options = drm_options
+        # use default for any keys not set
+        if self.cosmos_app.default_drm_options is not None:
+            for key, val in list(self.cosmos_app.default_drm_options.items()):
+                if key not in task.drm_options:
+                    task.drm_options[key] = val
+
+        DRM.validate_drm_options(task.drm, task.drm_options)
         return task
 
+    def _bulk_insert_tasks(self, new_tasks):
+        """
+        Insert new Tasks and their edges with one executemany each, then attach them to the session, their
+        Stages and their parents as if they had been loaded from the database.
+
+        :param list new_tasks: (task, stage, parents) for each new Task, parents before children
+        """
+        if not new_tasks:
+            return
+        # new Stages need an id
+        self.session.flush()
+
+        columns = [(prop.key, prop.columns[0]) for prop in Task.__mapper__.column_attrs]
+        rows = []
+        for task, stage, parents in new_tasks:
+            task.__dict__["stage_id"] = stage.id
+            row = dict()
+            for key, column in columns:
+                value = task.__dict__.get(key)
+                if value is None and column.default is not None:
+                    value = column.default.arg
+                task.__dict__[key] = row[column.key] = value
+            del row["id"]
+            rows.append(row)
+        self.session.execute(Task.__table__.insert(), rows)
+
+        # find the new ids using the unique (stage_id, uid) constraint
+        stages = {stage for _, stage, _ in new_tasks}
+        ids = dict(
+            ((stage_id, uid), id_)
+            for id_, stage_id, uid in self.session.query(Task.id, Task.stage_id, Task.uid).filter(
+                Task.stage_id.in_([stage.id for stage in stages])
+            )
+        )
+
+        children = defaultdict(list)
+        for task, stage, parents in new_tasks:
+            for parent in parents:
+                children[parent].append(task)
+        edges = []
+        new_tasks_by_stage = defaultdict(list)
+        for task, stage, parents in new_tasks:
+            task.__dict__["id"] = ids[stage.id, task.uid]
+            orm.make_transient_to_detached(task)
+            self.session.add(task)
+            set_committed_value(task, "stage", stage)
+            set_committed_value(task, "parents", parents)
+            set_committed_value(task, "children", children.pop(task, []))
+            new_tasks_by_stage[stage].append(task)
+            # Task.parents joins task_edge on its parent_id column
+            edges += [dict(parent_id=task.id, child_id=parent.id) for parent in parents]
+        if edges:
+            self.session.execute(TaskEdge.__table__.insert(), edges)
+
+        # the rest of the children belong to Tasks that were already in the session
+        for parent, new_children in children.items():
+            if "children" in parent.__dict__:
+                set_committed_value(parent, "children", parent.children + new_children)
+        for stage, stage_tasks in new_tasks_by_stage.items():
+            if "tasks" in stage.__dict__:
+                set_committed_value(stage, "tasks", stage.tasks + stage_tasks)
+            task_uid_index.reset(stage)
+            task_counter.reset(stage)
+            for parent_stage in {p.stage for task in stage_tasks for p in task.parents}:
+                if parent_stage not in stage.parents:
+                    stage.parents.append(parent_stage)
+
+        # set_committed_value doesn't fire the events that maintain the cached task graph
+        _add_tasks_to_cached_graph(self, [task for task, _, _ in new_tasks])
+        self._dont_garbage_collect += [task for task, _, _ in new_tasks]
+
     def run(
         self,
         max_cores=None,
@@ -395,6 +577,14 @@ class Workflow(Base):
         max_gpus=None,
         do_cleanup_atexit=True,
         lethal_signals=TERMINATION_SIGNALS,
+        task_priority=None,
+        max_mem=None,
+        max_resources=None,
+        fuse_chains=False,
+        fusible_stages=None,
+        commit_interval=None,
+        render_executor=None,
+        release_finished_tasks=False,
     ):
         """
         Runs this Workflow's DAG
@@ -413,6 +603,38 @@ class Workflow(Base):
             run more tasks in this workflow later.
         :param do_cleanup_atexit: if False, do not attempt to cleanup unhandled exits.
         :param lethal_signals: signals to catch and shutdown
+        :param str task_priority: The order in which ready Tasks are submitted.  If None, Tasks are submitted in the
+            order they were added.  If "critical_path", Tasks that gate the longest chain of downstream work are
+            submitted first.  A Task's work is estimated by the average wall_time of previously successful Tasks in
+            its Stage, falling back to its time_req, and then to 1.
+        :param int max_mem: The maximum amount of memory, in MB (based on the sum of Task.mem_req), to use at once.
+            A value of None indicates no maximum.
+        :param dict max_resources: The maximum amount of custom resources to use at once, ex: {"scratch_gb": 500}.
+            Tasks declare their requirements with the `resource_reqs` parameter of :meth:`Workflow.add_task`.
+        :param bool fuse_chains: If True, submit each linear chain of Tasks (where every Task is its parent's
+            only child, and its only parent) as one job.  Each Task still gets its own status, exit_status and
+            logs.  Only Tasks of the same Stage, with the same drm and resource requirements, and without a
+            time_req, are fused.  The commands of a whole chain are rendered when its first Task is submitted,
+            before any of the others have run, so only use it when no cmd_fxn reads the output files or state
+            of its parents.  See cosmos.job.fusion.
+        :param list fusible_stages: Names of Stages whose Tasks may also be fused with the Tasks of the other
+            fusible Stages, when fuse_chains is True.
+        :param float commit_interval: If set, Task state changes are committed to the database together, at
+            most every `commit_interval` seconds, rather than after every batch of submitted or finished
+            Tasks.  Helps when commits are slow, ex: SQLite on NFS or a remote database.  Everything is
+            committed when the run ends or is terminated; if Cosmos is killed, at most the last
+            `commit_interval` seconds of changes are lost, and those Tasks are run again on resume.
+        :param render_executor: Where to call the cmd_fxns of ready Tasks.  If None, they are called one at a
+            time before each batch is submitted.  "thread" or "process" calls them in a pool, which helps when
+            they do real work, like listing input directories.  A concurrent.futures.Executor may also be
+            passed.  cmd_fxns are called with a copy of their params, while cmd_wrapper is applied in the
+            calling thread and must call the cmd_fxn it wraps, as the default one does.  A "process" pool
+            needs cmd_fxns and params that can be pickled.  Ignored if cmd_wrapper is py_call.
+        :param bool release_finished_tasks: If True, Tasks that finish for good, and those that were already
+            successful, are expunged from the session and dropped by the scheduler, so that memory use follows
+            the number of Tasks left to run rather than the size of the Workflow.  Only their id, status and
+            exit_status are kept, in self.jobmanager.finished_tasks.  Task objects loaded before the run must
+            not be used after it; query them again, ex: with self.tasks.
 
         Returns True if all tasks in the workflow ran successfully, False otherwise.
         If dry is specified, returns None.
@@ -435,6 +657,7 @@ class Workflow(Base):
                 ), "Workflow was not initialized using the Workflow.start method"
                 assert hasattr(log_out_dir_func, "__call__"), "log_out_dir_func must be a function"
                 assert self.session, "Workflow must be part of a sqlalchemy session"
+                assert task_priority in TASK_PRIORITIES, "task_priority must be one of %s" % (TASK_PRIORITIES,)
 
                 session = self.session
                 self.log.info(
@@ -453,6 +676,8 @@ class Workflow(Base):
 
                 self.max_cores = max_cores
                 self.max_gpus = max_gpus
+                self.max_mem = max_mem
+                self.max_resources = max_resources
                 #
                 # Run some validation checks
                 #
@@ -466,20 +691,7 @@ class Workflow(Base):
                             "GPUs"
                         )
 
-                # check for duplicate output files
-                output_fnames_to_task_and_key = dict()
-                for task in self.tasks:
-                    for key, fname in list(task.output_map.items()):
-                        current_value = output_fnames_to_task_and_key.setdefault(fname, (task, key))
-                        if current_value != (task, key):
-                            task2, key2 = current_value
-                            raise ValueError(
-                                "Duplicate output files detected!:  "
-                                '{task}.params["{key}"] == {task2}.params["{key2}"] == {fname}'.format(
-                                    **locals()
-                                )
-                            )
-                        output_fnames_to_task_and_key[fname] = (task, key)
+                _check_for_duplicate_output_files(self.tasks)
 
                 from ..job.JobManager import JobManager
 
@@ -492,6 +704,10 @@ class Workflow(Base):
                         session=self.session,
                         workflow=self,
                     )
+                self.jobmanager.group_commit = GroupCommit(session, max_lag=commit_interval)
+                self.jobmanager.job_info_updater = BulkUpdater(session, Task)
+                self.jobmanager.set_render_executor(render_executor)
+                self.jobmanager.release_finished_tasks = release_finished_tasks
 
                 self.status = WorkflowStatus.running
                 self.successful = False
@@ -499,52 +715,81 @@ class Workflow(Base):
                 if self.started_on is None:
                     self.started_on = datetime.datetime.now()
 
-                task_graph = self.task_graph()
+                task_queue = self.task_dag()
                 stage_graph = self.stage_graph()
 
                 assert len(set(self.stages)) == len(self.stages), "duplicate stage name detected: %s" % (
                     next(duplicates(self.stages))
                 )
 
-                # renumber stages
-                stage_graph_no_cycles = nx.DiGraph()
-                stage_graph_no_cycles.add_nodes_from(stage_graph.nodes())
-                stage_graph_no_cycles.add_edges_from(stage_graph.edges())
-                for cycle in nx.simple_cycles(stage_graph):
-                    stage_graph_no_cycles.remove_edge(cycle[-1], cycle[0])
-                for i, s in enumerate(topological_sort(stage_graph_no_cycles)):
+                # renumber stages.  Stages in a cycle keep the order they were added in
+                stage_order = {s: i for i, s in enumerate(self.stages)}
+                for i, s in enumerate(topological_sort_cycles(stage_graph, key=stage_order.get)):
                     s.number = i + 1
                     if s.status != StageStatus.successful:
                         s.status = StageStatus.no_attempt
 
                 # Make sure everything is in the sqlalchemy session
                 session.add(self)
-                successful = list([t for t in task_graph.nodes() if t.successful])
+                successful = list([t for t in task_queue if t.successful])
 
                 # print stages
                 for s in sorted(self.stages, key=lambda s: s.number):
                     self.log.info("%s %s" % (s, s.status))
 
                 # Create Task Queue
-                task_queue = _copy_graph(task_graph)
                 self.log.info("Skipping %s successful tasks..." % len(successful))
                 task_queue.remove_nodes_from(successful)
 
+                if task_priority == "critical_path":
+                    self.log.info("Computing critical path lengths...")
+                    # key by id, so that the scheduler doesn't hold on to the Tasks.  New ones get theirs here
+                    session.flush()
+                    critical_path_lengths = {
+                        t.id: n for t, n in _get_critical_path_lengths(task_queue, successful).items()
+                    }
+                    submit_order_key = lambda t: (-critical_path_lengths[t.id], t.id)
+                else:
+                    submit_order_key = None
+
+                if fuse_chains:
+                    fusible_stages = set(fusible_stages or [])
+                    self.jobmanager.fused_chains = find_linear_chains(
+                        task_queue, lambda parent, child: can_fuse(parent, child, fusible_stages)
+                    )
+                    self.log.info(
+                        "Fusing %d Tasks into %d linear chains",
+                        sum(len(chain) + 1 for chain in self.jobmanager.fused_chains.values()),
+                        len(self.jobmanager.fused_chains),
+                    )
+                else:
+                    self.jobmanager.fused_chains = dict()
+
                 if do_cleanup_atexit:
                     handle_exits(self)
 
-                if self.max_cores is not None:
-                    self.log.info("Ensuring there are enough cores...")
-                    # make sure we've got enough cores
+                resource_limits = self.resource_limits
+                if resource_limits:
+                    self.log.info("Ensuring there are enough resources...")
+                    # make sure we've got enough cores, gpus, etc.
                     for t in task_queue:
-                        assert int(t.core_req) <= self.max_cores, (
-                            "%s requires more cpus (%s) than `max_cores` (%s)"
-                            % (t, t.core_req, self.max_cores,)
-                        )
+                        for resource, limit in resource_limits.items():
+                            assert get_resource_req(t, resource) <= limit, (
+                                "%s requires more %s (%s) than are available (%s)"
+                                % (t, resource, get_resource_req(t, resource), limit,)
+                            )
 
                 # Run this thing!
                 self.log.info("Committing to SQL db...")
                 session.commit()
+
+                if release_finished_tasks:
+                    # including the ones kept by previous runs
+                    self._dont_garbage_collect = []
+                    self.jobmanager.tasks, self.jobmanager.dead_tasks = [], []
+                    self.__dict__.pop("_cached_task_graph", None)
+                    self.jobmanager.release_tasks(successful)
+                del successful
             except KeyboardInterrupt:
                 # haven't started submitting yet, just raise the exception
                 self.log.fatal("ctrl+c caught")
@@ -552,7 +797,13 @@ class Workflow(Base):
                 raise
 
             if not dry:
-                _run(self, session, task_queue, lethal_signals=lethal_signals)
+                _run(
+                    self,
+                    session,
+                    task_queue,
+                    lethal_signals=lethal_signals,
+                    submit_order_key=submit_order_key,
+                )
 
                 # set status
                 if self.status == WorkflowStatus.failed_but_running:
@@ -580,6 +831,14 @@ class Workflow(Base):
             self.log.fatal(ex, exc_info=True)
             self.terminate(due_to_failure=False)
             raise
+        finally:
+            # including after a dry run, or an exception
+            if self.jobmanager is not None:
+                self.jobmanager.shutdown_render_executor()
+                if self.jobmanager.job_info_updater is not None:
+                    # so that its session listeners don't outlive the run
+                    self.jobmanager.job_info_updater.close()
+                    self.jobmanager.job_info_updater = None
 
     def terminate(self, due_to_failure=True):
         self.log.info("Terminating %s, due_to_failure=%s" % (self, due_to_failure))
@@ -604,10 +863,19 @@ class Workflow(Base):
         return [t for s in self.stages for t in s.tasks]
         # return session.query(Task).join(Stage).filter(Stage.workflow == ex).all()
 
+    def count_tasks(self, **where):
+        """
+        :param where: filters on Task.status, successful or must_succeed, ex: status=TaskStatus.failed
+        :return: (int) the number of Tasks that match, without scanning them
+        """
+        return workflow_task_counter.count(self, **where)
+
     def stage_graph(self):
         """
         :return: (networkx.DiGraph) a DAG of the stages
         """
+        import networkx as nx
+
         g = nx.DiGraph()
         g.add_nodes_from(self.stages)
         g.add_edges_from((s, c) for s in self.stages for c in s.children if c)
@@ -617,25 +885,50 @@ class Workflow(Base):
         """
         :return: (networkx.DiGraph) a DAG of the tasks
         """
+        import networkx as nx
+
         g = nx.DiGraph()
         g.add_nodes_from(self.tasks)
         g.add_edges_from([(t, c) for t in self.tasks for c in t.children])
         return g
 
+    def cached_stage_graph(self):
+        """
+        :return: (networkx.DiGraph) the same DAG as :meth:`stage_graph`, built once and then kept up to date
+          as Stages and their edges are added and deleted.  It is shared, so don't modify it.
+        """
+        return _get_cached_graph(self, "_cached_stage_graph", self.stage_graph)
+
+    def cached_task_graph(self):
+        """
+        :return: (networkx.DiGraph) the same DAG as :meth:`task_graph`, built once and then kept up to date as
+          Tasks and their edges are added and deleted, so traversals only cost the size of their answer.
+          It is shared, so don't modify it.
+        """
+        return _get_cached_graph(self, "_cached_task_graph", self.task_graph)
+
+    def task_dag(self):
+        """
+        :return: (cosmos.graph.dag.CompactDAG) a DAG of the tasks, which uses much less memory than
+          :meth:`task_graph` for large workflows
+        """
+        tasks = self.tasks
+        return CompactDAG(tasks, ((t, c) for t in tasks for c in t.children))
+
     def get_stage(self, name_or_id):
         if isinstance(name_or_id, int):
-            f = lambda s: s.id == name_or_id
+            stage = next((s for s in self.stages if s.id == name_or_id), None)
         else:
-            f = lambda s: s.name == name_or_id
-
-        for stage in self.stages:
-            if f(stage):
-                return stage
+            stage = stage_name_index.get(self).get(name_or_id)
 
+        if stage is not None:
+            return stage
         raise ValueError("Stage with name %s does not exist" % name_or_id)
 
     @property
     def url(self):
+        from flask import url_for
+
         return url_for("cosmos.workflow", name=self.name)
 
     def __repr__(self):
@@ -675,14 +968,155 @@ class Workflow(Base):
         return None
 
 
-def _run(workflow, session, task_queue, lethal_signals):
+#: Workflow.stages by name, so that finding the Stage of a new Task does not scan every Stage
+stage_name_index = CollectionIndex(Workflow.stages, Stage.name, "workflow")
+
+#: the Tasks of every Stage counted by status, so that logging progress does not scan the whole Workflow
+workflow_task_counter = task_counter.roll_up(Workflow.stages, "workflow")
+
+#: Workflows with a cached task or stage graph, which the listeners below keep up to date
+_workflows_with_cached_graphs = weakref.WeakSet()
+
+
+def _get_cached_graph(workflow, key, build):
+    g = workflow.__dict__.get(key)
+    if g is None:
+        g = workflow.__dict__[key] = build()
+        _workflows_with_cached_graphs.add(workflow)
+    return g
+
+
+def _cached_graphs(key, workflow=None):
+    workflows = list(_workflows_with_cached_graphs) if workflow is None else [workflow]
+    return [wf.__dict__[key] for wf in workflows if key in wf.__dict__]
+
+
+def _drop_cached_graphs(key):
+    for workflow in list(_workflows_with_cached_graphs):
+        workflow.__dict__.pop(key, None)
+
+
+def _add_tasks_to_cached_graph(workflow, tasks):
+    for g in _cached_graphs("_cached_task_graph", workflow):
+        for task in tasks:
+            g.add_node(task)
+            g.add_edges_from((p, task) for p in task.__dict__.get("parents", ()))
+            g.add_edges_from((task, c) for c in task.__dict__.get("children", ()))
+
+
+@event.listens_for(Task.parents, "append")
+def _task_edge_added(task, parent, initiator):
+    for g in _cached_graphs("_cached_task_graph"):
+        if task in g or parent in g:
+            g.add_edge(parent, task)
+
+
+@event.listens_for(Task.parents, "remove")
+def _task_edge_removed(task, parent, initiator):
+    for g in _cached_graphs("_cached_task_graph"):
+        if g.has_edge(parent, task):
+            g.remove_edge(parent, task)
+
+
+@event.listens_for(Stage.tasks, "append")
+def _task_added(stage, task, initiator):
+    if stage.workflow is not None:
+        _add_tasks_to_cached_graph(stage.workflow, [task])
+
+
+@event.listens_for(Stage.tasks, "remove")
+def _task_removed(stage, task, initiator):
+    for g in _cached_graphs("_cached_task_graph"):
+        if task in g:
+            g.remove_node(task)
+
+
+@event.listens_for(Stage.parents, "append")
+def _stage_edge_added(stage, parent, initiator):
+    for g in _cached_graphs("_cached_stage_graph"):
+        if stage in g or parent in g:
+            g.add_edge(parent, stage)
+
+
+@event.listens_for(Stage.parents, "remove")
+def _stage_edge_removed(stage, parent, initiator):
+    for g in _cached_graphs("_cached_stage_graph"):
+        if g.has_edge(parent, stage):
+            g.remove_edge(parent, stage)
+
+
+@event.listens_for(Workflow.stages, "append")
+def _stage_added(workflow, stage, initiator):
+    for g in _cached_graphs("_cached_stage_graph", workflow):
+        g.add_node(stage)
+    _add_tasks_to_cached_graph(workflow, stage.__dict__.get("tasks", ()))
+
+
+@event.listens_for(Workflow.stages, "remove")
+def _stage_removed(workflow, stage, initiator):
+    for g in _cached_graphs("_cached_stage_graph", workflow):
+        if stage in g:
+            g.remove_node(stage)
+    workflow.__dict__.pop("_cached_task_graph", None)
+
+
+@event.listens_for(orm.Session, "persistent_to_deleted")
+def _deleted(session, instance):
+    if isinstance(instance, Task):
+        _task_removed(None, instance, None)
+    elif isinstance(instance, Stage):
+        # the database deletes the Stage's Tasks, without telling the session about each one
+        _drop_cached_graphs("_cached_stage_graph")
+        _drop_cached_graphs("_cached_task_graph")
+
+
+@event.listens_for(orm.Session, "after_soft_rollback")
+def _rolled_back(session, previous_transaction):
+    # new Tasks and Stages were expunged, so start over
+    _drop_cached_graphs("_cached_stage_graph")
+    _drop_cached_graphs("_cached_task_graph")
+
+
+def _resolve_parents_and_params(parents, params):
+    """
+    :returns: (parents, params), with parents as a list, and each Dependency in params resolved to its value
+      and its Task added to parents
+    """
+    # Avoid cyclical import dependencies
+    from cosmos import recursive_resolve_dependency
+
+    # parents
+    if parents is None:
+        parents = []
+    elif isinstance(parents, Task):
+        parents = [parents]
+    else:
+        parents = list(parents)
+
+    # params
+    if params is None:
+        params = dict()
+    for k, v in list(params.items()):
+        # decompose `Dependency` objects to values and parents
+        new_val, parent_tasks = recursive_resolve_dependency(v)
+
+        params[k] = new_val
+        parents.extend(parent_tasks - set(parents))
+
+    return parents, params
+
+
+def _run(workflow, session, task_queue, lethal_signals, submit_order_key=None):
     """
     Do the workflow!
+
+    :param callable submit_order_key: sort key for ready Tasks, the smallest are submitted first
     """
 
     def signal_handler(signum, frame):
         workflow.log.critical(f"caught signal: {signum}, shutdown procedure will initiate shortly")
         workflow.termination_signal = signum
+        workflow.jobmanager.wake()
 
     for sig in lethal_signals:
         # catch lethal signals (like a ctrl+c)
@@ -692,14 +1126,21 @@ def _run(workflow, session, task_queue, lethal_signals):
     available_cores = True
     last_log_timestamp = time.time()
 
+    # Track readiness incrementally so a finished task costs O(children) rather than a rescan of task_queue.
+    # A queued task is ready once it has no unfinished parents left.
+    num_unfinished_parents = dict(task_queue.in_degree())
+    ready_tasks = TaskPacker(key=submit_order_key, resources=workflow.resource_limits.keys())
+    ready_tasks.update(task for task, n in num_unfinished_parents.items() if n == 0)
+
     while len(task_queue) > 0:
         if available_cores:
-            _run_queued_and_ready_tasks(task_queue, workflow)
+            _run_queued_and_ready_tasks(ready_tasks, workflow)
             available_cores = False
 
+        finished_tasks = []
         for task in _process_finished_tasks(workflow.jobmanager):
             if task.status == TaskStatus.failed and not task.must_succeed:
-                pass  # it's ok if the task failed
+                finished_tasks.append(task)  # it's ok if the task failed
 
             elif task.status == TaskStatus.failed and task.must_succeed:
 
@@ -714,25 +1155,39 @@ def _run(workflow, session, task_queue, lethal_signals):
                     return
 
                 # pop all descendents when a task fails; the rest of the graph can still execute
-                remove_nodes = descendants(task_queue, task).union({task,})
+                remove_nodes = task_queue.descendants(task).union({task,})
                 # graph_failed.add_edges(task_queue.subgraph(remove_nodes).edges())
 
                 task_queue.remove_nodes_from(remove_nodes)
+                finished_tasks += remove_nodes
+                ready_tasks.difference_update(remove_nodes)
+                for t in remove_nodes:
+                    del num_unfinished_parents[t]
                 workflow.status = WorkflowStatus.failed_but_running
                 workflow.log.info("%s tasks left in the queue" % len(task_queue))
             elif task.status == TaskStatus.successful:
-                # just pop this task
+                # pop this task, its children become ready once all of their parents have finished.  A fused
+                # task was made ready by its parent finishing in the same job, right before it.
+                ready_tasks.discard(task)
+                for child in task_queue.successors(task):
+                    num_unfinished_parents[child] -= 1
+                    if num_unfinished_parents[child] == 0:
+                        ready_tasks.add(child)
                 task_queue.remove_node(task)
+                del num_unfinished_parents[task]
+                finished_tasks.append(task)
             elif task.status == TaskStatus.no_attempt:
                 # the task must have failed, and is being reattempted
-                pass
+                ready_tasks.add(task)
             else:
                 raise AssertionError("Unexpected finished task status %s for %s" % (task.status, task))
             available_cores = True
             last_log_timestamp = time.time()
 
         # only commit Task changes after processing a batch of finished ones
-        session.commit()
+        workflow.jobmanager.group_commit.commit()
+        if workflow.jobmanager.release_finished_tasks:
+            workflow.jobmanager.release_tasks(finished_tasks)
 
         if last_log_timestamp + WORKFLOW_LOG_AWKWARD_SILENCE_INTERVAL < time.time():
             num_running = len(list(workflow.jobmanager.running_tasks))
@@ -744,8 +1199,13 @@ def _run(workflow, session, task_queue, lethal_signals):
 
             last_log_timestamp = time.time()
 
-        # conveniently, this returns early if we catch a signal
-        time.sleep(workflow.jobmanager.poll_interval)
+        # conveniently, this returns early if a task finishes or we catch a signal.  Wake up in time to commit
+        # any deferred changes, too
+        timeout = WORKFLOW_LOG_AWKWARD_SILENCE_INTERVAL
+        seconds_until_commit = workflow.jobmanager.group_commit.seconds_until_due()
+        if seconds_until_commit is not None:
+            timeout = min(timeout, seconds_until_commit)
+        workflow.jobmanager.wait_for_finished_tasks(timeout=timeout)
 
         if workflow.termination_signal:
             workflow.log.info(
@@ -757,67 +1217,80 @@ def _run(workflow, session, task_queue, lethal_signals):
             return
 
 
-def _get_one_submittable_task_given_resource_constraints(tasks, cores_left, gpus_left):
-    tasks = sorted(tasks, key=lambda t: (t.gpu_req, t.core_req, t.id))
+def _check_for_duplicate_output_files(tasks):
+    """
+    :raises ValueError: if two of `tasks` have the same output file
+    """
+    output_fnames_to_task_and_key = dict()
     for task in tasks:
-        if task.gpu_req <= gpus_left and task.cpu_req <= cores_left:
-            return task
-    else:
-        return None
-
-
-def _get_all_submittable_tasks_given_resource_constraints(workflow, ready_tasks):
-    ready_tasks = list(ready_tasks)
-    # get the list of submittable tasks given resource constraints
-    cores_used = sum([t.core_req for t in workflow.jobmanager.running_tasks])
-    gpus_used = sum([t.gpu_req for t in workflow.jobmanager.running_tasks])
-    if workflow.max_cores is None:
-        cores_left = float("inf")
-    else:
-        cores_left = workflow.max_cores - cores_used
-
-    if workflow.max_gpus is None:
-        gpus_left = float("inf")
-    else:
-        gpus_left = workflow.max_gpus - gpus_used
+        for key, fname in list(task.output_map.items()):
+            current_value = output_fnames_to_task_and_key.setdefault(fname, (task, key))
+            if current_value != (task, key):
+                task2, key2 = current_value
+                raise ValueError(
+                    "Duplicate output files detected!:  "
+                    '{task}.params["{key}"] == {task2}.params["{key2}"] == {fname}'.format(**locals())
+                )
 
-    submittable_tasks = []
-    while len(ready_tasks) > 0:
-        task = _get_one_submittable_task_given_resource_constraints(ready_tasks, cores_left, gpus_left)
-        if task is None:
-            break
-        else:
-            ready_tasks.remove(task)
-            cores_left -= task.core_req
-            gpus_left -= task.gpu_req
-            submittable_tasks.append(task)
 
-    return submittable_tasks
+def _get_resources_left(workflow):
+    """
+    :returns: (dict) resource name -> the amount not being used by running tasks, for each constrained resource
+    """
+    resources_left = workflow.resource_limits
+    for task in workflow.jobmanager.running_tasks:
+        for resource in resources_left:
+            resources_left[resource] -= get_resource_req(task, resource)
+    return resources_left
 
 
-def _run_queued_and_ready_tasks(task_queue, workflow):
-    ready_tasks = [
-        task
-        for task, degree in list(task_queue.in_degree())
-        if degree == 0 and task.status == TaskStatus.no_attempt
-    ]
+def _run_queued_and_ready_tasks(ready_tasks, workflow):
+    """
+    Submit as many `ready_tasks` as resource constraints allow.  Submitted tasks are removed from the packer.
 
-    if workflow.max_cores is None and workflow.max_gpus is None:
-        submittable_tasks = sorted(ready_tasks, key=lambda t: t.id)
-    else:
-        submittable_tasks = _get_all_submittable_tasks_given_resource_constraints(workflow, ready_tasks)
+    :param TaskPacker ready_tasks: queued Tasks whose parents have all finished successfully
+    """
+    resources_left = _get_resources_left(workflow)
+    submittable_tasks = ready_tasks.pop_submittable(resources_left)
 
     # submit in a batch for speed
     workflow.jobmanager.run_tasks(submittable_tasks)
-    if len(submittable_tasks) < len(ready_tasks):
+    if len(ready_tasks) and resources_left:
         workflow.log.info(
-            "Reached resource limits of max_cores of {workflow.max_cores}, "
-            "or max_gpu of {workflow.max_gpus}, "
+            "Reached resource limits of {workflow.resource_limits}, "
+            "packing efficiency was {ready_tasks.efficiency}, "
             "waiting for a task to finish...".format(**locals())
         )
 
     # only commit submitted Tasks after submitting a batch
-    workflow.session.commit()
+    workflow.jobmanager.group_commit.commit()
+
+
+def _get_critical_path_lengths(task_queue, successful_tasks):
+    """
+    :param cosmos.graph.dag.CompactDAG task_queue: the Tasks left to run
+    :param list successful_tasks: previously successful Tasks, used to estimate the wall_time of each Stage
+    :returns: (dict) Task -> the weighted length of the longest path from that Task to the end of the task_queue
+    """
+    stage_wall_times = defaultdict(list)
+    for task in successful_tasks:
+        if task.wall_time is not None:
+            stage_wall_times[task.stage].append(task.wall_time)
+    avg_stage_wall_time = {stage: sum(w) / len(w) for stage, w in stage_wall_times.items()}
+
+    def weight(task):
+        if task.stage in avg_stage_wall_time:
+            return avg_stage_wall_time[task.stage]
+        if task.time_req is not None:
+            return task.time_req
+        return 1
+
+    critical_path_lengths = dict()
+    for task in reversed(list(task_queue.topological_sort())):
+        critical_path_lengths[task] = weight(task) + max(
+            (critical_path_lengths[child] for child in task_queue.successors(task)), default=0
+        )
+    return critical_path_lengths
 
 
 def _process_finished_tasks(jobmanager):
@@ -845,10 +1318,3 @@ def handle_exits(workflow):
                 "%s Unknown status when atexit() was called (SQL error), terminating" % workflow
             )
             workflow.terminate(due_to_failure=True)
-
-
-def _copy_graph(graph):
-    graph2 = nx.DiGraph()
-    graph2.add_edges_from(graph.edges())
-    graph2.add_nodes_from(graph.nodes())
-    return graph2
@@ -0,0 +1,12 @@
+"""
+cmd_fxns shared by the tests.  They live in a module, rather than in each test, so that they can be pickled
+for a process render_executor.
+"""
+
+
+def echo(i):
+    return "echo %s" % i
+
+
+def noop():
+    pass
@@ -0,0 +1,23 @@
+import pytest
+
+from cosmos.api import Cosmos
+
+
+@pytest.fixture()
+def db_url(tmp_path, monkeypatch):
+    """A SQLite database in a new temporary directory, which is also the working directory of the test"""
+    # Task log directories are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return "sqlite:///%s" % (tmp_path / "db.sqlite")
+
+
+@pytest.fixture()
+def cosmos_app(db_url):
+    cosmos = Cosmos(db_url)
+    cosmos.initdb()
+    return cosmos
+
+
+@pytest.fixture()
+def workflow(cosmos_app):
+    return cosmos_app.start("workflow", skip_confirm=True)
@@ -0,0 +1,38 @@
+"""
+Measures Workflow.add_task throughput as a workflow grows, which should stay flat now that Stages and Tasks
+are found by name and uid rather than by scanning.
+
+usage: python -m cosmos.test.misc.benchmark_add_task [--num_tasks 100000] [--num_stages 10] [--batch 10000]
+"""
+import argparse
+import time
+
+from cosmos.api import Cosmos
+
+
+def echo(i):
+    return "echo %s" % i
+
+
+def main(num_tasks, num_stages, batch):
+    cosmos = Cosmos("sqlite://")
+    cosmos.initdb()
+    workflow = cosmos.start("benchmark_add_task", skip_confirm=True)
+
+    print(f"adding {num_tasks} tasks to {num_stages} stages")
+    start = time.time()
+    for first in range(0, num_tasks, batch):
+        batch_start = time.time()
+        for i in range(first, min(first + batch, num_tasks)):
+            workflow.add_task(echo, params=dict(i=i), stage_name="stage_%s" % (i % num_stages), uid=str(i))
+        seconds = time.time() - batch_start
+        print(f"tasks {first:>9}-{i:<9} {batch / seconds:10.0f} tasks/s")
+    print(f"total: {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--num_tasks", type=int, default=100000)
+    p.add_argument("--num_stages", type=int, default=10)
+    p.add_argument("--batch", type=int, default=10000)
+    main(**vars(p.parse_args()))
@@ -0,0 +1,74 @@
+"""
+Times `import cosmos.api` and `cosmos ls` in new interpreters, the startup cost every script and command pays,
+and lists the heavy optional modules that `import cosmos.api` and `Cosmos()` pull in.
+
+usage: python -m cosmos.test.misc.benchmark_import_time [--repeat 10]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cosmos
+from cosmos.api import Cosmos
+
+HEAVY_MODULES = ["boto3", "botocore", "dateutil", "flask", "networkx", "drmaa"]
+
+LIST_IMPORTED = """
+import sys
+from cosmos.api import Cosmos
+Cosmos("sqlite:///:memory:")
+print(" ".join(m for m in %r if m in sys.modules))
+""" % (
+    HEAVY_MODULES,
+)
+
+
+def cosmos_script():
+    script = os.path.join(os.path.dirname(os.path.dirname(cosmos.__file__)), "bin", "cosmos")
+    return script if os.path.exists(script) else shutil.which("cosmos")
+
+
+def time_command(args, repeat):
+    """:returns: (float) the median seconds `args` takes to run"""
+    seconds = []
+    for _ in range(repeat):
+        start = time.time()
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds.append(time.time() - start)
+    return statistics.median(seconds)
+
+
+def main(repeat):
+    directory = tempfile.mkdtemp()
+    try:
+        db = os.path.join(directory, "benchmark.sqlite")
+        cosmos_app = Cosmos("sqlite:///%s" % db)
+        cosmos_app.initdb()
+        cosmos_app.start("benchmark_import_time", skip_confirm=True, primary_log_path=None)
+        cosmos_app.session.commit()
+
+        commands = [
+            ("python -c pass", [sys.executable, "-c", "pass"]),
+            ("import cosmos.api", [sys.executable, "-c", "import cosmos.api"]),
+            ("cosmos ls", [sys.executable, cosmos_script(), "ls", "--db", db]),
+        ]
+        for name, args in commands:
+            print("%-18s %.3fs" % (name, time_command(args, repeat)))
+
+        imported = subprocess.run(
+            [sys.executable, "-c", LIST_IMPORTED], check=True, stdout=subprocess.PIPE, universal_newlines=True
+        ).stdout.split()
+        print("heavy modules imported by Cosmos(): %s" % (", ".join(imported) or "none"))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--repeat", type=int, default=10)
+    main(**vars(p.parse_args()))
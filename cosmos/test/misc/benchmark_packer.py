@@ -0,0 +1,69 @@
+"""
+Compares the TaskPacker against the previous sort-and-remove packing loop with 10k ready tasks.
+
+usage: python -m cosmos.test.misc.benchmark_packer [--num_tasks 10000] [--max_cores 2000]
+"""
+import argparse
+import random
+import time
+
+from cosmos import TaskStatus
+from cosmos.job.packer import TaskPacker
+
+
+class FakeTask(object):
+    status = TaskStatus.no_attempt
+
+    def __init__(self, id, core_req, gpu_req):
+        self.id = id
+        self.core_req = core_req
+        self.cpu_req = core_req
+        self.gpu_req = gpu_req
+
+
+def sort_and_remove_packing(tasks, cores_left, gpus_left):
+    """The packing loop TaskPacker replaced, which re-sorts the ready list for every submission"""
+    tasks = list(tasks)
+    submittable_tasks = []
+    while len(tasks) > 0:
+        for task in sorted(tasks, key=lambda t: (t.gpu_req, t.core_req, t.id)):
+            if task.gpu_req <= gpus_left and task.cpu_req <= cores_left:
+                break
+        else:
+            break
+        tasks.remove(task)
+        cores_left -= task.core_req
+        gpus_left -= task.gpu_req
+        submittable_tasks.append(task)
+    return submittable_tasks
+
+
+def main(num_tasks, max_cores, max_gpus):
+    random.seed(0)
+    tasks = [
+        FakeTask(i, core_req=random.choice([1, 1, 2, 4, 8]), gpu_req=random.choice([0, 0, 0, 1]))
+        for i in range(num_tasks)
+    ]
+
+    start = time.time()
+    expected = sort_and_remove_packing(tasks, max_cores, max_gpus)
+    legacy_seconds = time.time() - start
+
+    start = time.time()
+    packer = TaskPacker()
+    packer.update(tasks)
+    submittable = packer.pop_submittable(dict(cores=max_cores, gpus=max_gpus))
+    packer_seconds = time.time() - start
+
+    assert [t.id for t in submittable] == [t.id for t in expected]
+    print(f"{num_tasks} ready tasks, max_cores={max_cores}, max_gpus={max_gpus}: packed {len(submittable)}")
+    print(f"sort-and-remove: {legacy_seconds:.3f}s")
+    print(f"TaskPacker:      {packer_seconds:.3f}s (packing efficiency {packer.efficiency})")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--num_tasks", type=int, default=10000)
+    p.add_argument("--max_cores", type=int, default=2000)
+    p.add_argument("--max_gpus", type=int, default=100)
+    main(**vars(p.parse_args()))
@@ -0,0 +1,96 @@
+"""
+Compares the profiles of Cosmos(sqlite_profile=...): the latency of small commits like the ones the run loop
+makes, and how many queries a concurrent reader, like the web dashboard, gets through meanwhile.  Commits are
+made without the ORM, whose overhead is the same for every profile.
+
+usage: python -m cosmos.test.misc.benchmark_sqlite_profile [--num_tasks 1000] [--num_commits 300]
+  [--profiles default wal] [--dir /path/to/filesystem/to/test]
+"""
+import argparse
+import os
+import shutil
+import multiprocessing
+import sqlite3
+import tempfile
+import time
+
+from cosmos.api import Cosmos, Task
+from cosmos.db import SQLITE_PROFILES
+
+
+def echo(i):
+    return "echo %s" % i
+
+
+def read_until(path, stop, num_queries, num_errors):
+    """Query Task statuses, like the web dashboard does, until `stop` is set"""
+    conn = sqlite3.connect(path, timeout=1)
+    while not stop.is_set():
+        try:
+            conn.execute("SELECT _status, count(*) FROM task GROUP BY _status").fetchall()
+            num_queries.value += 1
+        except sqlite3.OperationalError:
+            # database is locked
+            num_errors.value += 1
+    conn.close()
+
+
+def benchmark(profile, directory, num_tasks, num_commits):
+    path = os.path.join(directory, "benchmark_%s.sqlite" % profile)
+    cosmos = Cosmos("sqlite:///%s" % path, sqlite_profile=profile)
+    cosmos.initdb()
+    workflow = cosmos.start("benchmark_sqlite_profile", skip_confirm=True)
+    tasks = workflow.add_tasks([dict(func=echo, params=dict(i=i), uid=str(i)) for i in range(num_tasks)])
+    task_ids = [task.id for task in tasks]
+    cosmos.session.commit()
+    engine = cosmos.session.bind
+
+    # in another process, so that it doesn't compete for the GIL
+    stop = multiprocessing.Event()
+    num_queries, num_errors = multiprocessing.Value("l"), multiprocessing.Value("l")
+    update = Task.__table__.update()
+    reader = multiprocessing.Process(target=read_until, args=(path, stop, num_queries, num_errors))
+    reader.start()
+    latencies = []
+    start = time.time()
+    for i in range(num_commits):
+        commit_start = time.time()
+        with engine.begin() as conn:
+            task_id = task_ids[i % num_tasks]
+            conn.execute(update.where(Task.id == task_id).values(status_reason="commit %s" % i))
+        latencies.append(time.time() - commit_start)
+    seconds = time.time() - start
+    stop.set()
+    reader.join()
+    cosmos.session.remove()
+
+    latencies.sort()
+    print(
+        "%-10s commit median %7.2fms  p99 %7.2fms  %7.0f commits/s  reader: %7.0f queries/s, %s locked"
+        % (
+            profile,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+            num_commits / seconds,
+            num_queries.value / seconds,
+            num_errors.value,
+        )
+    )
+
+
+def main(num_tasks, num_commits, profiles, dir):
+    directory = tempfile.mkdtemp(dir=dir)
+    try:
+        for profile in profiles:
+            benchmark(profile, directory, num_tasks, num_commits)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--num_tasks", type=int, default=1000)
+    p.add_argument("--num_commits", type=int, default=300)
+    p.add_argument("--profiles", nargs="+", default=sorted(SQLITE_PROFILES), choices=sorted(SQLITE_PROFILES))
+    p.add_argument("--dir", help="where to put the databases, default is the temp dir")
+    main(**vars(p.parse_args()))
@@ -0,0 +1,116 @@
+"""
+Times the queries that resuming a Workflow and the web dashboard make on a large task table, on a database
+created before the (stage_id, _status) and (stage_id, successful) indexes existed, and again after initdb()
+added them.
+
+usage: python -m cosmos.test.misc.benchmark_task_indexes [--num_workflows 10] [--num_stages 10]
+  [--tasks_per_stage 10000] [--percent_failed 1]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from sqlalchemy import false, func, true
+
+from cosmos import TaskStatus
+from cosmos.api import Cosmos, Stage, Task, Workflow
+from cosmos.db import create_missing_indexes
+
+NEW_INDEXES = ["ix_task_stage_id_status", "ix_task_stage_id_successful"]
+
+
+def populate(session, num_workflows, num_stages, tasks_per_stage, percent_failed):
+    """Insert finished Workflows, with every percent_failed'th Task failed"""
+    every = int(100 / percent_failed)
+    for w in range(num_workflows):
+        workflow = Workflow(name="workflow_%s" % w, manual_instantiation=False, successful=False)
+        session.add(workflow)
+        stages = [Stage(name="stage_%s" % s, workflow=workflow) for s in range(num_stages)]
+        session.flush()
+        for stage in stages:
+            rows = [
+                dict(
+                    uid=str(i),
+                    stage_id=stage.id,
+                    _status=TaskStatus.failed if i % every == 0 else TaskStatus.successful,
+                    successful=i % every != 0,
+                    NOOP=False,
+                    params={},
+                    environment_variables={},
+                    extra={},
+                    attempt=1,
+                    must_succeed=True,
+                )
+                for i in range(tasks_per_stage)
+            ]
+            session.execute(Task.__table__.insert(), rows)
+    session.commit()
+
+
+def time_queries(session, workflow_id):
+    wf_tasks = session.query(Task).join(Stage).filter(Stage.workflow_id == workflow_id)
+    stage_id = session.query(Stage.id).filter(Stage.workflow_id == workflow_id).first()[0]
+    queries = [
+        ("resume: unsuccessful tasks", lambda: wf_tasks.filter(Task.successful == false()).all()),
+        (
+            "resume: stages with successful tasks",
+            lambda: wf_tasks.filter(Task.successful == true()).with_entities(Task.stage_id).distinct().all(),
+        ),
+        (
+            "dashboard: tasks by status",
+            lambda: session.query(Task._status, func.count())
+            .filter(Task.stage_id == stage_id)
+            .group_by(Task._status)
+            .all(),
+        ),
+        (
+            "dashboard: failed tasks of a stage",
+            lambda: session.query(Task).filter_by(stage_id=stage_id, _status=TaskStatus.failed).all(),
+        ),
+    ]
+    seconds = dict()
+    for name, query in queries:
+        start = time.time()
+        for _ in range(5):
+            query()
+        seconds[name] = (time.time() - start) / 5
+    return seconds
+
+
+def main(num_workflows, num_stages, tasks_per_stage, percent_failed):
+    directory = tempfile.mkdtemp()
+    try:
+        cosmos = Cosmos("sqlite:///%s" % os.path.join(directory, "benchmark.sqlite"))
+        cosmos.initdb()
+        session = cosmos.session
+        print(f"inserting {num_workflows * num_stages * tasks_per_stage} tasks")
+        populate(session, num_workflows, num_stages, tasks_per_stage, percent_failed)
+        workflow_id = session.query(func.max(Workflow.id)).scalar()
+
+        # a database from before the indexes existed
+        for index in NEW_INDEXES:
+            session.execute("DROP INDEX %s" % index)
+        session.commit()
+        before = time_queries(session, workflow_id)
+
+        start = time.time()
+        created = create_missing_indexes(session.bind)
+        print(f"initdb created {created} in {time.time() - start:.1f}s")
+        assert create_missing_indexes(session.bind) == []
+        after = time_queries(session, workflow_id)
+
+        for name in before:
+            print(f"{name:<40} {before[name] * 1000:9.1f}ms -> {after[name] * 1000:7.1f}ms")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--num_workflows", type=int, default=10)
+    p.add_argument("--num_stages", type=int, default=10)
+    p.add_argument("--tasks_per_stage", type=int, default=10000)
+    p.add_argument("--percent_failed", type=float, default=1)
+    main(**vars(p.parse_args()))
@@ -11,15 +11,16 @@ def noop(out_fn):
     return "ls"
 
 
-def silly_recipe(wf, i, num_things):
+def silly_recipe(i, num_things):
     prev_task = None
     for j in range(num_things):
-        prev_task = wf.add_task(
+        prev_task = dict(
             func=noop,
             parents=[] if prev_task is None else [prev_task],
             params={"out_fn": "{}/{}.txt".format(i, j)},
             uid="{}/{}".format(i, j),
         )
+        yield prev_task
 
 
 def main():
@@ -44,9 +45,7 @@ def main():
         fail_fast=True,
     )
 
-    for i in range(100):
-        print("add {}".format(i))
-        silly_recipe(workflow, i, 100)
+    workflow.add_tasks(task for i in range(100) for task in silly_recipe(i, 100))
 
     workflow.make_output_dirs()
 
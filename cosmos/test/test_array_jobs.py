@@ -0,0 +1,115 @@
+import logging
+import os
+import stat
+
+import pytest
+
+from cosmos import TaskStatus
+from cosmos.job.drm.drm_ge import DRM_GE, qstat
+from cosmos.job.drm.drm_slurm import DRM_SLURM, do_sacct
+
+# run every element of the array right away, in the foreground
+FAKE_QSUB = """#!/bin/bash
+echo "$@" >> {tmpdir}/qsub.log
+t=$(echo "$@" | grep -o -- '-t 1-[0-9]*' | cut -d- -f3)
+for i in $(seq 1 ${{t:-1}}); do SGE_TASK_ID=$i "${{@: -1}}" > /dev/null 2>&1; done
+[ -n "$t" ] && echo "7.1-$t:1" || echo 8
+"""
+FAKE_SBATCH = """#!/bin/bash
+echo "$@" >> {tmpdir}/sbatch.log
+t=$(echo "$@" | grep -o -- '--array 1-[0-9]*' | cut -d- -f4)
+for i in $(seq 1 ${{t:-1}}); do SLURM_ARRAY_TASK_ID=$i "${{@: -1}}" > /dev/null 2>&1; done
+echo "Submitted batch job 9"
+"""
+FAKE_QSTAT = """#!/bin/bash
+cat <<EOF
+job-ID  prior   name       user         state submit/start at     queue                          slots ja-task-ID
+-----------------------------------------------------------------------------------------------------------------
+      7 0.55500 align[3]   user         r     10/18/2026 10:00:00 all.q@node1                        1 1
+      7 0.55500 align[3]   user         qw    10/18/2026 10:00:00                                    1 2-3:1
+      8 0.55500 call[1]    user         qw    10/18/2026 10:00:00                                    1
+EOF
+"""
+FAKE_SACCT = """#!/bin/bash
+cat <<EOF
+State|JobID|CPUTime|MaxRSS|AveRSS|AveCPU|CPUTimeRAW|AveVMSize|MaxVMSize|Elapsed|ExitCode|Start|End
+---
+COMPLETED|9_1|00:00:01|||00:00:00|1|||00:00:01|0:0|2026-10-18T10:00:00|2026-10-18T10:00:01
+COMPLETED|9_1.batch|00:00:01|1024K|1024K|00:00:00|1|2048K|2048K|00:00:01|0:0|2026-10-18T10:00:00|2026-10-18T10:00:01
+PENDING|9_[2-3%2]|00:00:00|||||||00:00:00|0:0|Unknown|Unknown
+EOF
+"""
+
+
+class FakeTask(object):
+    environment_variables = None
+    log = logging.getLogger(__name__)
+
+    class stage(object):
+        name = "align"
+
+    def __init__(self, tmpdir, drm, i, native_specification):
+        self.drm, self.drm_native_specification = drm, native_specification + " -J job%s" % i
+        self.log_dir = os.path.join(str(tmpdir), "task%s" % i)
+        os.mkdir(self.log_dir)
+        self.output_job_script_path = os.path.join(self.log_dir, "command.bash")
+        self.output_stdout_path = os.path.join(self.log_dir, "stdout.txt")
+        self.output_stderr_path = os.path.join(self.log_dir, "stderr.txt")
+        self.output_array_job_script_path = os.path.join(self.log_dir, "array_job.bash")
+        _write_script(self.output_job_script_path, "#!/bin/bash\necho task %s\necho err %s >&2\n" % (i, i))
+
+    def __str__(self):
+        return "<FakeTask %s>" % self.log_dir
+
+
+def _write_script(path, text):
+    with open(path, "w") as fh:
+        fh.write(text)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+
+@pytest.fixture()
+def fake_drm_bin(tmpdir, monkeypatch):
+    fakes = [("qsub", FAKE_QSUB), ("sbatch", FAKE_SBATCH), ("qstat", FAKE_QSTAT), ("sacct", FAKE_SACCT)]
+    for name, text in fakes:
+        _write_script(str(tmpdir.join(name)), text.format(tmpdir=tmpdir) if "{tmpdir}" in text else text)
+    monkeypatch.setenv("PATH", "%s:%s" % (tmpdir, os.environ["PATH"]))
+    return tmpdir
+
+
+@pytest.mark.parametrize(
+    "drm_cls, element_ids, single_id",
+    [(DRM_GE, ["7.1", "7.2", "7.3"], "8"), (DRM_SLURM, ["9_1", "9_2", "9_3"], "9")],
+)
+def test_submit_array_job(fake_drm_bin, drm_cls, element_ids, single_id):
+    tasks = [FakeTask(fake_drm_bin, drm_cls.name, i, "-q all.q") for i in range(3)]
+    tasks.append(FakeTask(fake_drm_bin, drm_cls.name, 3, "-q big.q"))
+    drm_cls(logging.getLogger(__name__)).submit_jobs(tasks)
+
+    assert [t.drm_jobID for t in tasks] == element_ids + [single_id]
+    assert all(t.status == TaskStatus.submitted for t in tasks)
+    for i, task in enumerate(tasks[:3]):
+        with open(task.output_stdout_path) as fh:
+            assert fh.read() == "task %s\n" % i
+        with open(task.output_stderr_path) as fh:
+            assert fh.read() == "err %s\n" % i
+
+    with open(str(fake_drm_bin.join("qsub.log" if drm_cls is DRM_GE else "sbatch.log"))) as fh:
+        submissions = fh.read().splitlines()
+    # one array job for the three Tasks with the same resources, and a regular job for the other
+    assert len(submissions) == 2
+    assert "align[3]" in submissions[0] and "job0" not in submissions[0]
+
+
+def test_qstat_array_job(fake_drm_bin):
+    qjobs = qstat()
+    assert qjobs["7.1"]["state"] == "r"
+    assert qjobs["7.2"]["state"] == qjobs["7.3"]["state"] == "qw"
+    assert "8" in qjobs and "8.1" not in qjobs
+
+
+def test_sacct_array_job(fake_drm_bin):
+    job_infos = do_sacct(["9_1", "9_2", "9_3"])
+    assert job_infos["9_1"]["State"] == "COMPLETED"
+    assert job_infos["9_1"]["MaxRSS"] == "1024K"
+    assert job_infos["9_2"]["State"] == job_infos["9_3"]["State"] == "PENDING"
@@ -0,0 +1,189 @@
+import datetime
+import math
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import event
+
+from cosmos.api import Cosmos, Stage, Task
+from cosmos.db import create_missing_indexes
+from cosmos.test import echo, noop
+from cosmos.util.sqla import JSON_CODECS, BulkUpdater, set_json_codec
+
+
+def test_commit_interval(cosmos_app, tmp_path):
+    commits = []
+    event.listen(cosmos_app.session.bind, "commit", lambda conn: commits.append(conn))
+
+    num_commits = dict()
+    for commit_interval in (None, 3600):
+        workflow = cosmos_app.start("workflow_%s" % commit_interval, skip_confirm=True)
+        task = None
+        for i in range(4):
+            task = workflow.add_task(echo, params=dict(i=i), uid=str(i), parents=task)
+        del commits[:]
+        assert workflow.run(commit_interval=commit_interval, do_cleanup_atexit=False)
+        num_commits[commit_interval] = len(commits)
+
+    # the state changes were deferred, but all of them were committed by the end of the run
+    assert num_commits[3600] < num_commits[None]
+    with sqlite3.connect(str(tmp_path / "db.sqlite")) as conn:
+        rows = conn.execute(
+            "SELECT task.successful FROM task JOIN stage ON task.stage_id = stage.id "
+            "JOIN workflow ON stage.workflow_id = workflow.id WHERE workflow.name = 'workflow_3600'"
+        ).fetchall()
+    assert rows == [(1,)] * 4
+
+
+def test_sqlite_profile(db_url):
+    cosmos = Cosmos(db_url, sqlite_profile="wal")
+    cosmos.initdb()
+    assert cosmos.session.execute("PRAGMA journal_mode").scalar() == "wal"
+    assert cosmos.session.execute("PRAGMA foreign_keys").scalar() == 1
+
+    # connections are shared by threads, like the ones of `cosmos runweb`, without closing each other's
+    def query(i):
+        try:
+            return cosmos.session.execute("PRAGMA journal_mode").scalar()
+        finally:
+            cosmos.session.remove()
+
+    with ThreadPoolExecutor(10) as pool:
+        assert list(pool.map(query, range(50))) == ["wal"] * 50
+
+    cosmos = Cosmos(db_url, sqlite_profile=dict(busy_timeout=1234))
+    assert cosmos.session.execute("PRAGMA busy_timeout").scalar() == 1234
+    with pytest.raises(ValueError):
+        Cosmos(db_url, sqlite_profile="fastest")
+
+
+def test_bulk_job_info(workflow, tmp_path):
+    for i in range(4):
+        workflow.add_task(echo, params=dict(i=i), uid=str(i))
+    assert workflow.run(do_cleanup_atexit=False)
+
+    # every Task's job info was written, and matches the Tasks in memory
+    with sqlite3.connect(str(tmp_path / "db.sqlite")) as conn:
+        rows = conn.execute("SELECT exit_status, wall_time IS NOT NULL FROM task").fetchall()
+    assert rows == [(0, 1)] * 4
+    assert all(t.exit_status == 0 and t.wall_time is not None for t in workflow.tasks)
+
+    updates = []
+
+    @event.listens_for(workflow.session.bind, "before_cursor_execute")
+    def record_updates(conn, cursor, statement, params, context, executemany):
+        if statement.startswith("UPDATE"):
+            updates.append((statement, params))
+
+    updater = BulkUpdater(workflow.session, Task)
+    for i, task in enumerate(workflow.tasks):
+        # successful has listeners, so it is set normally
+        updater.update(task, dict(wall_time=100 + i, status_reason="bulk", successful=i != 0))
+    assert workflow.tasks[1].wall_time == 101 and not workflow.tasks[0].successful
+    workflow.session.commit()
+
+    assert len(updates) == 2 and len(updates[0][1]) == 4
+    assert [(t.wall_time, t.status_reason, t.successful) for t in workflow.tasks][:2] == [
+        (100, "bulk", False),
+        (101, "bulk", True),
+    ]
+
+
+def test_bulk_updater_is_closed(workflow, monkeypatch):
+    updaters = []
+
+    class RecordedBulkUpdater(BulkUpdater):
+        def __init__(self, *args, **kwargs):
+            super(RecordedBulkUpdater, self).__init__(*args, **kwargs)
+            updaters.append(self)
+
+    monkeypatch.setattr("cosmos.models.Workflow.BulkUpdater", RecordedBulkUpdater)
+    workflow.add_task(echo, params=dict(i=0), uid="0")
+    for _ in range(2):
+        assert workflow.run(do_cleanup_atexit=False)
+
+    # each run's updater stopped listening to the session when the run ended
+    assert len(updaters) == 2
+    for updater in updaters:
+        assert not event.contains(updater.session, "before_commit", updater._on_before_commit)
+        assert not event.contains(updater.session, "after_rollback", updater._on_after_rollback)
+
+
+def test_create_missing_indexes(cosmos_app):
+    cosmos_app.session.execute("DROP INDEX ix_task_stage_id_status")
+    cosmos_app.session.commit()
+    assert create_missing_indexes(cosmos_app.session.bind) == ["ix_task_stage_id_status"]
+    assert create_missing_indexes(cosmos_app.session.bind) == []
+    cosmos_app.initdb()
+
+    # resuming deletes the unsuccessful Tasks, and the Stages that had no Tasks
+    workflow = cosmos_app.start("workflow", skip_confirm=True)
+    tasks = [workflow.add_task(echo, params=dict(i=i), uid=str(i)) for i in range(2)]
+    workflow.add_task(noop, uid="0")
+    workflow.stages.append(Stage(name="empty"))
+    tasks[0].successful = True
+    cosmos_app.session.commit()
+    noop_stage_id = workflow.stages[1].id
+    workflow = cosmos_app.start("workflow", skip_confirm=True)
+    assert [(s.name, [t.uid for t in s.tasks]) for s in workflow.stages] == [("echo", ["0"]), ("noop", [])]
+
+    # the Stage whose Tasks all failed is kept, and its Tasks are re-run in it
+    task = workflow.add_task(echo, params=dict(i=0), uid="0", stage_name="noop")
+    assert task.stage.id == noop_stage_id
+    assert workflow.run(do_cleanup_atexit=False)
+    assert task.successful and task.stage.successful
+
+
+@pytest.mark.parametrize("intern_strings", [False, True])
+@pytest.mark.parametrize("codec", sorted(JSON_CODECS))
+def test_json_codec(workflow, codec, intern_strings):
+    params = dict(i=2 ** 70, path="/data/ref.fa", flags=["-M", 1.5, None], nested={"1": True})
+    try:
+        set_json_codec(codec, intern_strings=intern_strings)
+        task = workflow.add_task(noop, params=params, uid="0")
+        workflow.session.commit()
+        workflow.session.expire_all()
+        assert task.params == params and task.environment_variables == {}
+        path = "".join(["/data/", "ref.fa"])
+        assert (task.params["path"] is sys.intern(path)) == intern_strings
+    finally:
+        set_json_codec()
+
+    # setting a value that is already there doesn't mark the column as changed
+    task.params["path"] = "/data/ref.fa"
+    assert task not in workflow.session.dirty
+    task.params["path"] = "/data/other.fa"
+    assert task in workflow.session.dirty
+
+
+def test_json_column_changed_in_place(workflow):
+    # a container that was changed in place and set again is written, even though it equals itself
+    task = workflow.add_task(noop, params=dict(lst=[1]), uid="0")
+    workflow.info["lst"] = [1]
+    workflow.session.commit()
+    for d in (task.params, workflow.info):
+        lst = d["lst"]
+        lst.append(2)
+        d["lst"] = lst
+    workflow.session.commit()
+    workflow.session.expire_all()
+    assert task.params["lst"] == workflow.info["lst"] == [1, 2]
+
+
+@pytest.mark.parametrize("codec", sorted(JSON_CODECS))
+def test_json_codec_non_finite_floats(workflow, codec):
+    try:
+        set_json_codec(codec)
+        task = workflow.add_task(noop, params=dict(x=float("nan"), limits=[float("-inf"), None]), uid="0")
+        workflow.session.commit()
+        workflow.session.expire_all()
+        assert math.isnan(task.params["x"]) and task.params["limits"] == [float("-inf"), None]
+    finally:
+        set_json_codec()
+
+    if codec != "msgspec":
+        # dates are rejected like json does, rather than loaded back as strings
+        with pytest.raises(TypeError):
+            JSON_CODECS[codec][0](dict(day=datetime.date(2020, 1, 1)))
@@ -0,0 +1,93 @@
+import os
+import queue
+import subprocess
+
+import pytest
+
+from cosmos.job.drm.drm_local import ChildReaper, ProcessGroupSampler, pidfds_are_supported
+from cosmos.job.drm.py_call_pool import PyCallPool
+
+
+@pytest.mark.skipif(not pidfds_are_supported(), reason="pidfd_open is not available")
+def test_child_reaper():
+    num_fds = len(os.listdir("/proc/self/fd"))
+    exited = queue.SimpleQueue()
+    reaper = ChildReaper(lambda pid, wait_status, rusage: exited.put((pid, wait_status)))
+    # a reaper that is never started doesn't hold any file descriptors
+    assert len(os.listdir("/proc/self/fd")) == num_fds
+    reaper.start()
+    try:
+        procs = [subprocess.Popen(["sh", "-c", "exit %d" % i]) for i in range(3)]
+        for p in procs:
+            reaper.watch(p.pid)
+
+        exit_codes = dict()
+        for _ in procs:
+            pid, wait_status = exited.get(timeout=10)
+            exit_codes[pid] = os.waitstatus_to_exitcode(wait_status)
+        assert exit_codes == {p.pid: i for i, p in enumerate(procs)}
+    finally:
+        reaper.stop()
+        reaper.join(timeout=10)
+    assert not reaper.is_alive()
+    assert len(os.listdir("/proc/self/fd")) == num_fds
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="/proc is not available")
+def test_process_group_sampler():
+    sampler = ProcessGroupSampler(interval=None)
+    # a process group with two sleeping processes
+    p = subprocess.Popen(["sh", "-c", "sleep 10 & sleep 10; wait"], start_new_session=True)
+    try:
+        sampler.watch(p.pid)
+        for _ in range(50):
+            sampler.sample()
+        profile = sampler.unwatch(p.pid)
+    finally:
+        os.killpg(p.pid, 9)
+        p.wait()
+
+    assert profile["max_num_threads"] >= 2
+    assert profile["max_rss_mem_kb"] >= profile["avg_rss_mem_kb"] > 0
+    assert profile["max_num_fds"] >= 3
+    assert sampler.unwatch(p.pid) == dict()
+
+
+def test_py_call_pool(tmpdir):
+    exited = queue.SimpleQueue()
+    pool = PyCallPool(lambda pid, exit_status, rusage: exited.put((pid, exit_status)), preload=["json"])
+    pool.kill_after = 1
+    scripts = {
+        # the job can't open its stdout, which is reported as its exit status
+        "no_log_dir": "print('unreachable')",
+        "ok": "import os\nprint('hello', os.environ['NAME'])",
+        "fail": "raise ValueError('boom')",
+        "exit": "import sys\nsys.exit(3)",
+        "timeout": "import time\ntime.sleep(10)",
+        # ignores the time limit, so it is killed kill_after seconds later
+        "stuck": "import signal, time\nsignal.signal(signal.SIGALRM, signal.SIG_IGN)\ntime.sleep(10)",
+    }
+    procs = dict()
+    try:
+        for name, code in scripts.items():
+            script = tmpdir.join(name + ".py")
+            script.write("#!/usr/bin/env python\n" + code + "\n")
+            p = pool.start(
+                str(script),
+                str(tmpdir.join("missing" if name == "no_log_dir" else "", name + ".out")),
+                str(tmpdir.join(name + ".err")),
+                dict(os.environ, NAME=name),
+                time_req=1 if name in ("timeout", "stuck") else None,
+            )
+            procs[p.pid] = name
+
+        exit_statuses = dict()
+        for _ in procs:
+            pid, exit_status = exited.get(timeout=20)
+            exit_statuses[procs[pid]] = exit_status
+    finally:
+        pool.shutdown()
+
+    assert exit_statuses == dict(no_log_dir=1, ok=0, fail=1, exit=3, timeout=124, stuck=137)
+    assert tmpdir.join("ok.out").read() == "hello ok\n"
+    assert "ValueError: boom" in tmpdir.join("fail.err").read()
@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+import pytest
+
+from cosmos.job.drm.DRM_Base import DRM
+
+
+def test_drm_registry():
+    # DRMs are only imported when they are used
+    code = "import sys; from cosmos.api import Cosmos; Cosmos(); print('boto3' in sys.modules)"
+    assert subprocess.check_output([sys.executable, "-c", code], universal_newlines=True).strip() == "False"
+
+    assert {"local", "awsbatch", "k8s-jobs"} <= DRM.get_drm_names()
+    assert DRM.get_drm("local").__name__ == "DRM_Local"
+    assert DRM.has_drm("local") and not DRM.has_drm("nope")
+    with pytest.raises(ValueError):
+        DRM.get_drm("nope")
+
+    class DRM_Custom(DRM):
+        name = "custom"
+
+    assert DRM.has_drm("custom") and DRM.get_drm("custom") is DRM_Custom
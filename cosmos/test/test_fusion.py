@@ -0,0 +1,33 @@
+import pytest
+
+from cosmos.api import Cosmos
+
+
+def step(i):
+    if i == 2:
+        # fails on the first attempt
+        return "test -e flag || { touch flag; exit 3; }; echo step %s" % i
+    return "echo step %s" % i
+
+
+# the fused Tasks are rendered with the others, in the render executor if there is one
+@pytest.mark.parametrize("render_executor", [None, "thread"])
+def test_fuse_chains(cleandir, render_executor):
+    cosmos = Cosmos()
+    cosmos.initdb()
+    workflow = cosmos.start("workflow", skip_confirm=True)
+    tasks = []
+    for i in range(5):
+        task = workflow.add_task(step, params=dict(i=i), parents=tasks[-1:], uid=str(i), max_attempts=2)
+        tasks.append(task)
+    assert workflow.run(fuse_chains=True, render_executor=render_executor)
+
+    assert all(t.successful and t.exit_status == 0 for t in tasks)
+    for t in tasks:
+        with open(t.output_stdout_path) as fh:
+            assert fh.read() == "step %s\n" % t.params["i"]
+    # the chain stopped at the failure, and the rest was fused into the reattempt
+    assert len({t.drm_jobID for t in tasks[:2]}) == 1
+    assert len({t.drm_jobID for t in tasks[2:]}) == 1
+    assert tasks[0].drm_jobID != tasks[2].drm_jobID
+    assert tasks[2].attempt == 2
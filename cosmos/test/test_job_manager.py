@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from cosmos.api import TaskStatus
+from cosmos.job.JobManager import JobManager
+from cosmos.test import echo
+
+
+def broken(i):
+    raise RuntimeError("broken cmd_fxn")
+
+
+def test_prepare_tasks(workflow):
+    tasks = [workflow.add_task(echo, params=dict(i=i), uid=str(i)) for i in range(3)]
+    jobmanager = JobManager(
+        get_submit_args=workflow.cosmos_app.get_submit_args, logger=workflow.log, workflow=workflow
+    )
+    commands = jobmanager.render_commands(tasks)
+    jobmanager.prepare_tasks_for_submission(tasks, commands)
+    for task in tasks:
+        assert os.access(task.output_command_script_path, os.X_OK)
+        with open(task.output_stdout_path, "w") as fh:
+            fh.write("a previous run")
+
+    # files of previous runs are removed
+    jobmanager.prepare_tasks_for_submission(tasks, commands)
+    for task in tasks:
+        assert not os.path.exists(task.output_stdout_path)
+        with open(task.output_command_script_path) as fh:
+            assert fh.read() == commands[tasks.index(task)]
+
+
+@pytest.mark.parametrize("render_executor", ["thread", "process"])
+def test_render_executor(workflow, render_executor):
+    tasks = [workflow.add_task(echo, params=dict(i=i), uid=str(i)) for i in range(10)]
+    assert workflow.run(render_executor=render_executor, do_cleanup_atexit=False)
+    for task in tasks:
+        with open(task.output_command_script_path) as fh:
+            assert fh.read().endswith("\necho %s" % task.params["i"])
+    assert workflow.jobmanager.render_executor is None
+
+    with pytest.raises(ValueError):
+        workflow.run(render_executor="gpu", do_cleanup_atexit=False)
+
+    # the pool is also shut down after a dry run, or an exception
+    workflow.add_task(broken, params=dict(i=10), uid="10")
+    assert workflow.run(render_executor=render_executor, dry=True, do_cleanup_atexit=False) is None
+    assert workflow.jobmanager.render_executor is None
+    with pytest.raises(RuntimeError):
+        workflow.run(render_executor=render_executor, do_cleanup_atexit=False)
+    assert workflow.jobmanager.render_executor is None
+
+
+def test_release_finished_tasks(workflow):
+    parents = [workflow.add_task(echo, params=dict(i=i), uid=str(i), stage_name="a") for i in range(3)]
+    assert workflow.run(do_cleanup_atexit=False)
+
+    tasks = parents + [
+        workflow.add_task(echo, params=dict(i=i), parents=[parent], uid=str(i), stage_name="b")
+        for i, parent in enumerate(parents)
+    ]
+    assert workflow.run(release_finished_tasks=True, commit_interval=60, do_cleanup_atexit=False)
+
+    # both the previously successful Tasks and the new ones were released, with a record of each
+    assert not any(task in workflow.session for task in tasks)
+    assert not workflow.jobmanager.tasks and not workflow.jobmanager.dead_tasks
+    assert sorted(workflow.jobmanager.finished_tasks) == [
+        (task_id, TaskStatus.successful, 0) for task_id in sorted(t.id for t in workflow.tasks)
+    ]
+    assert all(t.successful and t.exit_status == 0 for t in workflow.tasks)
+    assert workflow.get_stage("b").num_successful_tasks() == 3
@@ -0,0 +1,100 @@
+from cosmos.api import TaskStatus
+from cosmos.test import echo
+
+
+def test_stage_and_task_indexes(workflow):
+    tasks = [workflow.add_task(echo, params=dict(i=i), uid=str(i)) for i in range(3)]
+    stage = workflow.get_stage("echo")
+    assert [stage.get_task(str(i)) for i in range(3)] == tasks
+
+    tasks[0].uid = "renamed"
+    assert stage.get_task("renamed") is tasks[0] and stage.get_task("0", None) is None
+    stage.tasks.remove(tasks[1])
+    assert stage.get_task("1", None) is None
+    assert workflow.add_task(echo, params=dict(i=1), uid="1") is not tasks[1]
+
+    # the indexes are rebuilt from the database after a commit
+    workflow.session.commit()
+    assert workflow.get_stage("echo").get_task("2") is tasks[2]
+
+
+def test_add_tasks(workflow):
+    first = workflow.add_task(echo, params=dict(i=0), uid="0")
+    specs = [dict(func=echo, params=dict(i=1), uid="1", parents=[first])]
+    specs.append(dict(func=echo, params=dict(i=2), uid="2", parents=[specs[0]], stage_name="echo2"))
+    specs.append(dict(func=echo, params=dict(i=0), uid="0", if_duplicate="return"))
+    tasks = workflow.add_tasks(specs)
+
+    assert tasks[2] is first
+    assert tasks[0].parents == [first] and first.children == [tasks[0]]
+    assert tasks[1].parents == [tasks[0]] and tasks[1].stage.parents == [first.stage]
+    assert workflow.get_stage("echo").get_task("1") is tasks[0]
+    last = workflow.add_task(echo, params=dict(i=3), uid="3", parents=tasks[1])
+    assert workflow.run(do_cleanup_atexit=False)
+
+    # the edges were written to the database
+    workflow.session.expire_all()
+    assert [t.uid for t in workflow.task_graph().predecessors(last)] == ["2"]
+    assert [t.uid for t in tasks[0].children] == ["2"]
+    assert all(t.successful for t in workflow.tasks) and len(workflow.tasks) == 4
+
+
+def test_cached_task_graph(workflow):
+    def assert_up_to_date(workflow):
+        for cached, fresh in [
+            (workflow.cached_task_graph(), workflow.task_graph()),
+            (workflow.cached_stage_graph(), workflow.stage_graph()),
+        ]:
+            assert set(cached.nodes()) == set(fresh.nodes())
+            assert set(cached.edges()) == set(fresh.edges())
+
+    first = workflow.add_task(echo, params=dict(i=0), uid="0")
+    assert_up_to_date(workflow)
+
+    second = workflow.add_task(echo, params=dict(i=1), uid="1", parents=first, stage_name="echo2")
+    third, fourth = workflow.add_tasks(
+        [dict(func=echo, params=dict(i=i), uid=str(i), parents=[second], stage_name="echo3") for i in (2, 3)]
+    )
+    first.children.append(third)
+    assert_up_to_date(workflow)
+    assert first.descendants() == {second, third, fourth}
+    assert fourth.ancestors() == {first, second}
+    assert workflow.get_stage("echo").descendants() == {second.stage, third.stage}
+
+    # after a run has committed and expired everything
+    assert workflow.run(do_cleanup_atexit=False)
+    assert_up_to_date(workflow)
+    second.delete(descendants=True)
+    assert_up_to_date(workflow)
+    assert first.descendants() == set() and len(workflow.tasks) == 1
+
+
+def test_task_counters(workflow):
+    def assert_counts(workflow):
+        for stage in workflow.stages:
+            assert stage.count_tasks() == len(stage.tasks)
+            assert stage.num_successful_tasks() == sum(t.successful for t in stage.tasks)
+            # new Tasks don't have their default status until they are flushed
+            assert stage.count_tasks(status=TaskStatus.no_attempt) == sum(
+                t.status in (None, TaskStatus.no_attempt) for t in stage.tasks
+            )
+        assert workflow.count_tasks() == len(workflow.tasks)
+        assert workflow.count_tasks(successful=True) == sum(t.successful for t in workflow.tasks)
+
+    first = workflow.add_task(echo, params=dict(i=0), uid="0")
+    assert_counts(workflow)
+    workflow.add_tasks([dict(func=echo, params=dict(i=i), uid=str(i), parents=[first]) for i in (1, 2)])
+    workflow.add_task(echo, params=dict(i=3), uid="3", stage_name="echo2", parents=first)
+    assert_counts(workflow)
+    assert workflow.count_tasks(status=TaskStatus.no_attempt, must_succeed=True) == 4
+
+    assert workflow.run(do_cleanup_atexit=False)
+    assert_counts(workflow)
+    assert workflow.count_tasks(status={TaskStatus.successful, TaskStatus.failed}) == 4
+
+    workflow.get_stage("echo").get_task("2").delete()
+    assert_counts(workflow)
+    assert workflow.count_tasks() == 3
+    workflow.get_stage("echo2").delete()
+    assert_counts(workflow)
+    assert workflow.count_tasks() == 2
@@ -0,0 +1,91 @@
+import time
+
+from cosmos.api import Cosmos
+from cosmos.graph.dag import CompactDAG
+from cosmos.models.Workflow import _get_critical_path_lengths
+
+
+class FakeTask(object):
+    def __init__(self, id, stage, time_req=None, wall_time=None):
+        self.id = id
+        self.stage = stage
+        self.time_req = time_req
+        self.wall_time = wall_time
+
+    def __repr__(self):
+        return "<FakeTask %s>" % self.id
+
+
+def test_critical_path_lengths():
+    # a long chain competing with a wide set of leaves
+    chain = [FakeTask(i, "chain", time_req=10) for i in range(3)]
+    leaves = [FakeTask(i, "leaf", time_req=10) for i in range(3, 6)]
+    g = CompactDAG(chain + leaves, zip(chain[:-1], chain[1:]))
+
+    lengths = _get_critical_path_lengths(g, successful_tasks=[])
+    assert [lengths[t] for t in chain] == [30, 20, 10]
+    assert all(lengths[t] == 10 for t in leaves)
+
+    # historical wall_times take precedence over time_req
+    history = [FakeTask(6, "leaf", wall_time=100)]
+    lengths = _get_critical_path_lengths(g, successful_tasks=history)
+    assert lengths[chain[0]] == 30
+    assert all(lengths[t] == 100 for t in leaves)
+
+
+def echo(i):
+    return "echo %s" % i
+
+
+def test_renumber_cross_linked_stages(cleandir):
+    # every Stage is in one big strongly connected component, with far too many simple cycles to enumerate
+    num_stages = 300
+    cosmos = Cosmos("sqlite:///db.sqlite")
+    cosmos.initdb()
+    workflow = cosmos.start("workflow", skip_confirm=True)
+    roots = [dict(func=echo, params=dict(i=i), uid="root", stage_name="s%s" % i) for i in range(num_stages)]
+    leaves = [
+        dict(
+            func=echo,
+            params=dict(i=i),
+            uid="leaf",
+            stage_name="s%s" % i,
+            parents=[roots[(i + d) % num_stages] for d in (-1, 1, 2, 7)],
+        )
+        for i in range(num_stages)
+    ]
+    first = workflow.add_task(echo, params=dict(i=-1), uid="first", stage_name="first")
+    roots[0]["parents"] = [first]
+    workflow.add_tasks(roots + leaves)
+    last = workflow.add_task(echo, params=dict(i=-2), uid="last", stage_name="last", parents=first.children)
+
+    start = time.time()
+    workflow.run(dry=True, do_cleanup_atexit=False)
+    assert time.time() - start < 30
+    # the cycle is numbered in the order its Stages were added, after its parent and before its child
+    assert [s.number for s in workflow.stages] == list(range(1, num_stages + 3))
+    assert first.stage.number == 1 and last.stage.number == num_stages + 2
+
+
+def test_packer_custom_resources():
+    from cosmos import TaskStatus
+    from cosmos.job.packer import TaskPacker
+
+    class ResourceTask(FakeTask):
+        status = TaskStatus.no_attempt
+        core_req = 1
+        gpu_req = 0
+        mem_req = None
+
+        def __init__(self, id, **resource_reqs):
+            super(ResourceTask, self).__init__(id, stage=None)
+            self.resource_reqs = resource_reqs
+
+    tasks = [ResourceTask(i, scratch_gb=40) for i in range(5)] + [ResourceTask(5)]
+    packer = TaskPacker(resources=["cores", "scratch_gb"])
+    packer.update(tasks)
+
+    submittable = packer.pop_submittable(dict(cores=10, scratch_gb=100))
+    assert sorted(t.id for t in submittable) == [0, 1, 5]
+    assert packer.efficiency == {"cores": 0.3, "scratch_gb": 0.8}
+    assert len(packer) == 3
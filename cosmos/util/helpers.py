@@ -5,6 +5,7 @@ import pprint
 import random
 import shutil
 import signal
+import stat
 import string
 import sys
 import tempfile
@@ -206,6 +207,13 @@ def mkdir(path):
         os.makedirs(path)
 
 
+def write_script(path, text):
+    """Write an executable script, with the mode os.chmod(path, mode | stat.S_IEXEC) would have given it"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666 | stat.S_IEXEC)
+    with open(fd, "w") as fh:
+        fh.write(text)
+
+
 def isgenerator(iterable):
     return hasattr(iterable, "__iter__") and not hasattr(iterable, "__len__")
 
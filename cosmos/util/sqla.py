@@ -1,6 +1,22 @@
-import six
+import json
+import math
+import sys
+from collections import Counter
+
 import sqlalchemy.types as types
+from sqlalchemy import bindparam, event, orm
 from sqlalchemy.ext.mutable import Mutable
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
 
 
 class Enum_ColumnType(types.TypeDecorator):
@@ -58,23 +74,129 @@ def get_or_create(session, model, **kwargs):
         return instance, True
 
 
-from sqlalchemy.types import TypeDecorator
-import json
+def _has_non_finite_float(value):
+    """
+    >>> _has_non_finite_float(dict(a=[1, None, dict(b=float('nan'))]))
+    True
+    >>> _has_non_finite_float(dict(a=[1, None, 1.5]))
+    False
+    """
+    if type(value) is float:
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite_float(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite_float(v) for v in value)
+    return False
+
+
+def _orjson_dumps(value):
+    try:
+        # dates are passed through to the (missing) default, so they raise a TypeError like they do with json
+        encoded = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    except TypeError:
+        # ex: integers larger than 64 bits, or dates
+        return json.dumps(value)
+    if b"null" in encoded and _has_non_finite_float(value):
+        # orjson writes NaN and Infinity as null, json keeps them
+        return json.dumps(value)
+    return encoded.decode()
+
+
+def _orjson_loads(value):
+    try:
+        return orjson.loads(value)
+    except orjson.JSONDecodeError:
+        # ex: NaN, which the json module writes
+        return json.loads(value)
+
+
+def _msgspec_codec():
+    encoder, decoder = msgspec.json.Encoder(), msgspec.json.Decoder()
+
+    def dumps(value):
+        try:
+            encoded = encoder.encode(value)
+        except (TypeError, OverflowError, msgspec.EncodeError):
+            return json.dumps(value)
+        if b"null" in encoded and _has_non_finite_float(value):
+            return json.dumps(value)
+        return encoded.decode()
+
+    def loads(value):
+        try:
+            return decoder.decode(value)
+        except msgspec.DecodeError:
+            return json.loads(value)
+
+    return dumps, loads
+
+
+#: (dumps, loads) of the JSON libraries that are installed.  orjson and msgspec are 3-6x faster than json.
+#: Values they would not write the way json does, like NaN, Infinity and integers larger than 64 bits, are
+#: passed on to json.  msgspec still writes dates as strings, where json raises a TypeError.
+JSON_CODECS = {"json": (json.dumps, json.loads)}
+if msgspec is not None:
+    JSON_CODECS["msgspec"] = _msgspec_codec()
+if orjson is not None:
+    JSON_CODECS["orjson"] = (_orjson_dumps, _orjson_loads)
+
+#: the codec used unless another one is set, the first one installed.  msgspec must be chosen explicitly,
+#: since it writes values that json rejects
+DEFAULT_JSON_CODEC = "orjson" if "orjson" in JSON_CODECS else "json"
+
+_json_codec = JSON_CODECS[DEFAULT_JSON_CODEC]
+_intern_strings = False
+
+
+def set_json_codec(name=None, intern_strings=False):
+    """
+    Set the JSON library that JSONEncodedDict columns use, for every Session in the process.
+
+    >>> set_json_codec('json')
+    'json'
+    >>> set_json_codec() == DEFAULT_JSON_CODEC
+    True
+
+    :param str name: a key of JSON_CODECS.  Defaults to DEFAULT_JSON_CODEC
+    :param bool intern_strings: intern the string values of loaded dicts, so that the ones repeated across
+      rows, like the params of the Tasks of a Stage, are stored once.  Costs time on every load, so only
+      worth it when many Tasks are kept in memory.  orjson and msgspec already share the keys
+    :returns: (str) the name of the codec
+    """
+    global _json_codec, _intern_strings
+    if name is None:
+        name = DEFAULT_JSON_CODEC
+    if name not in JSON_CODECS:
+        raise ValueError("json_codec must be one of %s, not %r" % (sorted(JSON_CODECS), name))
+    _json_codec = JSON_CODECS[name]
+    _intern_strings = intern_strings
+    return name
 
 
 class JSONEncodedDict(TypeDecorator):
-    "Represents an immutable structure as a json-encoded string."
+    """
+    Represents an immutable structure as a json-encoded string.
+    """
 
     impl = types.UnicodeText
 
     def process_bind_param(self, value, dialect):
         if value is None:
             value = dict()
-        value = six.text_type(json.dumps({k: v for k, v in list(value.items())}))
-        return value
+        return _json_codec[0](value)
 
     def process_result_value(self, value, dialect):
-        return json.loads(value)
+        value = _json_codec[1](value)
+        if _intern_strings and type(value) is dict:
+            intern = sys.intern
+            for k, v in value.items():
+                if type(v) is str:
+                    value[k] = intern(v)
+        return value
+
+
+IMMUTABLE_SCALARS = (str, int, float, bool, type(None))
 
 
 class MutableDict(Mutable, dict):
@@ -94,6 +216,12 @@ class MutableDict(Mutable, dict):
     def __setitem__(self, key, value):
         "Detect dictionary set events and emit change events."
 
+        # setting a scalar that is already there doesn't need the column to be encoded and written again.
+        # Containers are always written, since they may have been changed in place
+        if key in self and type(value) in IMMUTABLE_SCALARS:
+            old = dict.__getitem__(self, key)
+            if type(old) is type(value) and old == value:
+                return
         dict.__setitem__(self, key, value)
         self.changed()
 
@@ -125,3 +253,322 @@ class MutableList(Mutable, list):
     def remove(self, value):
         list.append(self, value)
         self.changed()
+
+
+class CollectionIndex(object):
+    """
+    An in-memory dict of the members of a one-to-many relationship, keyed by one of their attributes, kept in
+    sync as members are appended, removed, or have their key changed.
+
+    The index is built from the collection the first time it is used, and is thrown away when the parent is
+    expired or refreshed (ex: by a commit), since the collection may have changed in the database.
+
+    :param collection_attr: the relationship, ex: Stage.tasks
+    :param key_attr: the attribute of the members to index by, ex: Task.uid
+    :param str parent_attr: the name of the members' attribute that refers back to the parent, ex: "stage"
+    """
+
+    def __init__(self, collection_attr, key_attr, parent_attr):
+        self.collection_name = collection_attr.key
+        self.key = key_attr.key
+        self.parent_attr = parent_attr
+        self.index_attr = "_%s_by_%s" % (self.collection_name, self.key)
+
+        event.listen(collection_attr, "append", self._on_append)
+        event.listen(collection_attr, "remove", self._on_remove)
+        event.listen(key_attr, "set", self._on_set_key)
+        event.listen(collection_attr.class_, "expire", self._on_expire)
+        event.listen(collection_attr.class_, "refresh", self._on_expire)
+
+    def get(self, parent):
+        """:returns: (dict) the index of `parent`'s collection"""
+        index = parent.__dict__.get(self.index_attr)
+        if index is None:
+            index = dict()
+            for member in getattr(parent, self.collection_name):
+                index.setdefault(getattr(member, self.key), member)
+            parent.__dict__[self.index_attr] = index
+        return index
+
+    def reset(self, parent):
+        """Rebuild the index of `parent`'s collection the next time it is used"""
+        parent.__dict__.pop(self.index_attr, None)
+
+    def _index_of(self, parent):
+        # an index that was never built does not need to be maintained
+        return None if parent is None else parent.__dict__.get(self.index_attr)
+
+    def _on_append(self, parent, member, initiator):
+        # a new member may not have its key yet, in which case it is indexed by _on_set_key
+        index = self._index_of(parent)
+        key = member.__dict__.get(self.key)
+        if index is not None and key is not None:
+            index.setdefault(key, member)
+
+    def _on_remove(self, parent, member, initiator):
+        index = self._index_of(parent)
+        if index is None:
+            return
+        if self.key not in member.__dict__:
+            # the key is not loaded, so rebuild the index the next time it is used
+            self.reset(parent)
+        elif index.get(member.__dict__[self.key]) is member:
+            del index[member.__dict__[self.key]]
+
+    def _on_set_key(self, member, value, old_value, initiator):
+        index = self._index_of(member.__dict__.get(self.parent_attr))
+        if index is not None:
+            if index.get(old_value) is member:
+                del index[old_value]
+            if value is not None:
+                index.setdefault(value, member)
+
+    def _on_expire(self, parent, *args):
+        # parent is None if it was already garbage collected
+        if parent is not None:
+            self.reset(parent)
+
+
+class BulkUpdater(object):
+    """
+    Sets columns of many persistent objects, then writes them with one executemany UPDATE per set of columns
+    right before the session commits, rather than having the ORM flush each object with its own UPDATE.
+
+    The objects are updated in memory right away, as if the values had been loaded from the database, so they
+    stay consistent.  Attributes that aren't plain columns, or that have "set" listeners (ex: ones that a
+    CollectionCounter counts by), are set normally, so that nothing misses a change.
+
+    Call :meth:`close` when done with it, to stop listening to the session.
+
+    :param session: the session whose commits write the updates
+    :param model: the mapped class of the objects
+    """
+
+    def __init__(self, session, model):
+        self.session = session
+        self.model = model
+        self.table = model.__table__
+        self.bulk_keys = set()
+        for prop in model.__mapper__.column_attrs:
+            attr = getattr(model, prop.key)
+            if len(prop.columns) == 1 and prop.key == prop.columns[0].key and not attr.dispatch.set:
+                self.bulk_keys.add(prop.key)
+        self.bulk_keys -= {key.key for key in model.__mapper__.primary_key}
+        #: id -> the columns to write
+        self.pending = dict()
+
+        event.listen(session, "before_commit", self._on_before_commit)
+        event.listen(session, "after_rollback", self._on_after_rollback)
+
+    def update(self, obj, values):
+        """Set the attributes of `obj` to `values`, writing the columns that can be at the next commit"""
+        id_ = obj.id
+        for key, value in values.items():
+            if id_ is not None and key in self.bulk_keys:
+                orm.attributes.set_committed_value(obj, key, value)
+                self.pending.setdefault(id_, dict())[key] = value
+            else:
+                setattr(obj, key, value)
+
+    def flush(self):
+        """Write the pending updates now"""
+        pending, self.pending = self.pending, dict()
+        by_keys = dict()
+        for id_, values in pending.items():
+            values = dict(values, _id=id_)
+            by_keys.setdefault(tuple(sorted(values)), []).append(values)
+        for keys, rows in by_keys.items():
+            statement = (
+                self.table.update()
+                .where(self.table.c.id == bindparam("_id"))
+                .values({key: bindparam(key) for key in keys if key != "_id"})
+            )
+            self.session.execute(statement, rows)
+
+    def close(self):
+        """Stop listening to the session.  Pending updates are executed now, and written by its next commit"""
+        event.remove(self.session, "before_commit", self._on_before_commit)
+        event.remove(self.session, "after_rollback", self._on_after_rollback)
+        if self.pending:
+            self.flush()
+
+    def _on_before_commit(self, session):
+        if self.pending:
+            self.flush()
+
+    def _on_after_rollback(self, session):
+        # the objects were expired, and will load the values that were actually written
+        self.pending.clear()
+
+
+class CollectionCounter(object):
+    """
+    In-memory counts of the members of a one-to-many relationship, by the values of some of their attributes,
+    kept in sync as members are appended, removed, deleted or have those attributes set.  Counting is then
+    independent of the size of the collection.
+
+    The counts are built from the collection the first time they are used.  Unlike a CollectionIndex they are
+    kept when the parent is expired, since every change made by this process goes through the events above.
+
+    :param collection_attr: the relationship, ex: Stage.tasks
+    :param counted_attrs: the column attributes of the members to count by, ex: (Task._status,)
+    :param str parent_attr: the name of the members' attribute that refers back to the parent, ex: "stage"
+    """
+
+    def __init__(self, collection_attr, counted_attrs, parent_attr):
+        self.collection_name = collection_attr.key
+        self.keys = [attr.key for attr in counted_attrs]
+        #: counts are filtered by the counted attributes' names, without a leading underscore
+        self.names = [key.lstrip("_") for key in self.keys]
+        #: column defaults, which members don't have until they are flushed
+        self.defaults = dict()
+        for attr in counted_attrs:
+            default = attr.property.columns[0].default
+            if default is not None and default.is_scalar:
+                self.defaults[attr.key] = default.arg
+        self.parent_attr = parent_attr
+        self.counts_attr = "_%s_counts" % self.collection_name
+        self.member_class = collection_attr.property.mapper.class_
+        self.parent_class = collection_attr.class_
+        self.rollups = []
+
+        event.listen(collection_attr, "append", self._on_append)
+        event.listen(collection_attr, "remove", self._on_remove)
+        for i, attr in enumerate(counted_attrs):
+            event.listen(attr, "set", self._make_on_set(i), active_history=True)
+        event.listen(orm.Session, "before_flush", self._on_before_flush)
+
+    def get(self, parent):
+        """:returns: (collections.Counter) the number of members of `parent`'s collection by counted values"""
+        counts = parent.__dict__.get(self.counts_attr)
+        if counts is None:
+            counts = Counter(self._counted_values(m) for m in getattr(parent, self.collection_name))
+            parent.__dict__[self.counts_attr] = counts
+        return counts
+
+    def count(self, parent, **where):
+        """
+        :param where: counted values to filter by, ex: status=TaskStatus.failed.  A set matches any of its
+          members.
+        :returns: (int) the number of members of `parent`'s collection that match
+        """
+        return _count(self.get(parent), self.names, where)
+
+    def reset(self, parent):
+        """Recount `parent`'s collection the next time it is used"""
+        parent.__dict__.pop(self.counts_attr, None)
+        for rollup in self.rollups:
+            rollup.reset(getattr(parent, rollup.parent_attr))
+
+    def roll_up(self, collection_attr, parent_attr):
+        """
+        :param collection_attr: a relationship to this counter's parents, ex: Workflow.stages
+        :param str parent_attr: the name of the parents' attribute that refers back to theirs, ex: "workflow"
+        :returns: (CollectionCounterRollup) counts of the members of every parent in the collection
+        """
+        rollup = CollectionCounterRollup(self, collection_attr, parent_attr)
+        self.rollups.append(rollup)
+        return rollup
+
+    def _counted_values(self, member, i=None, value=None):
+        values = []
+        for j, key in enumerate(self.keys):
+            v = value if j == i else getattr(member, key)
+            values.append(self.defaults.get(key) if v is None else v)
+        return tuple(values)
+
+    def _update(self, parent, delta):
+        # counts that were never built do not need to be maintained
+        counts = None if parent is None else parent.__dict__.get(self.counts_attr)
+        if counts is not None:
+            counts.update(delta)
+            for rollup in self.rollups:
+                rollup._update(getattr(parent, rollup.parent_attr), delta)
+
+    def _on_append(self, parent, member, initiator):
+        self._update(parent, {self._counted_values(member): 1})
+
+    def _on_remove(self, parent, member, initiator):
+        self._update(parent, {self._counted_values(member): -1})
+
+    def _make_on_set(self, i):
+        def on_set(member, value, old_value, initiator):
+            old, new = self._counted_values(member), self._counted_values(member, i, value)
+            if old != new:
+                self._update(getattr(member, self.parent_attr), {old: -1, new: 1})
+
+        return on_set
+
+    def _on_before_flush(self, session, flush_context, instances):
+        deleted_parents = {obj for obj in session.deleted if isinstance(obj, self.parent_class)}
+        for parent in deleted_parents:
+            counts = parent.__dict__.get(self.counts_attr)
+            if counts is not None:
+                for rollup in self.rollups:
+                    rollup._update(getattr(parent, rollup.parent_attr), {k: -v for k, v in counts.items()})
+        for member in session.deleted:
+            if isinstance(member, self.member_class):
+                parent = getattr(member, self.parent_attr)
+                if parent not in deleted_parents:
+                    self._update(parent, {self._counted_values(member): -1})
+
+
+class CollectionCounterRollup(object):
+    """
+    The counts of a CollectionCounter, summed over a collection of its parents, ex: the Tasks of every Stage
+    of a Workflow.  Created by :meth:`CollectionCounter.roll_up`.
+    """
+
+    def __init__(self, counter, collection_attr, parent_attr):
+        self.counter = counter
+        self.collection_name = collection_attr.key
+        self.parent_attr = parent_attr
+        self.counts_attr = "_%s_%s_counts" % (self.collection_name, counter.collection_name)
+
+        event.listen(collection_attr, "append", self._on_append)
+        event.listen(collection_attr, "remove", self._on_remove)
+
+    def get(self, parent):
+        """:returns: (collections.Counter) the number of members of all of `parent`'s children"""
+        counts = parent.__dict__.get(self.counts_attr)
+        if counts is None:
+            counts = Counter()
+            for child in getattr(parent, self.collection_name):
+                counts.update(self.counter.get(child))
+            parent.__dict__[self.counts_attr] = counts
+        return counts
+
+    def count(self, parent, **where):
+        """See :meth:`CollectionCounter.count`"""
+        return _count(self.get(parent), self.counter.names, where)
+
+    def reset(self, parent):
+        if parent is not None:
+            parent.__dict__.pop(self.counts_attr, None)
+
+    def _update(self, parent, delta):
+        counts = None if parent is None else parent.__dict__.get(self.counts_attr)
+        if counts is not None:
+            counts.update(delta)
+
+    def _on_append(self, parent, child, initiator):
+        if parent.__dict__.get(self.counts_attr) is not None:
+            self._update(parent, self.counter.get(child))
+
+    def _on_remove(self, parent, child, initiator):
+        if parent.__dict__.get(self.counts_attr) is not None:
+            self._update(parent, {k: -v for k, v in self.counter.get(child).items()})
+
+
+def _count(counts, names, where):
+    """
+    >>> _count({('failed', True): 2, ('failed', False): 1, ('successful', True): 4}, ['status', 'ok'],
+    ...        dict(status={'failed', 'killed'}))
+    3
+    """
+    where = [(names.index(name), value) for name, value in where.items()]
+    return sum(
+        n
+        for values, n in counts.items()
+        if all(values[i] in v if isinstance(v, (set, frozenset)) else values[i] == v for i, v in where)
+    )
@@ -19,7 +19,6 @@ from cosmos.api import Workflow, Stage, Task, TaskStatus
 from ..job.JobManager import JobManager
 from . import filters
 from ..graph.draw import draw_task_graph, draw_stage_graph
-from ..job.drm.drm_awsbatch import get_logs_from_job_id
 
 
 def gen_bprint(session):
@@ -335,6 +334,8 @@ def gen_bprint(session):
         resource_usage = [(field, getattr(task, field)) for field in task.profile_fields]
 
         if task.drm == "awsbatch":
+            from ..job.drm.drm_awsbatch import get_logs_from_job_id
+
             try:
                 task_stdout_text = get_logs_from_job_id(
                     task.drm_jobID,
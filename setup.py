@@ -65,7 +65,9 @@ setup(
             "ghp-import",
             "sphinx",
             "sphinx_rtd_theme",
-        ]
+        ],
+        # a faster codec for the JSON columns, see cosmos.util.sqla.JSON_CODECS
+        "json": ["orjson"],
     },
     packages=find_packages(),
     include_package_data=True,